@@ -0,0 +1,317 @@
+"""
+Automatic replies to incoming messages.
+
+Keyword triggers are compiled into a single Aho-Corasick automaton and regex
+triggers into a few combined patterns, so checking a message costs roughly
+one pass over its text however many rules there are. Rules live in a JSON
+file and can be edited from the GUI; a change only updates the part of the
+matcher it touches.
+"""
+import collections
+import json
+import os
+import re
+import string
+import threading
+
+KEYWORD = 'keyword'
+REGEX = 'regex'
+# Regex triggers are combined into patterns of this many rules, so changing
+# one rule only recompiles its chunk
+REGEX_CHUNK_SIZE = 64
+# Numbered or named backreferences and conditional groups
+_SELF_REFERENCING = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+# Fields a response may contain, see Rule.format
+RESPONSE_FIELDS = ('user', 'mention', 'channel')
+
+
+class Rule:
+    """
+    A trigger and its response
+    :param trigger: Keyword (matched case-insensitively) or regular expression
+    :param response: Reply text; {user}, {mention} and {channel} are filled in
+    :param kind: KEYWORD or REGEX
+    :param whole_word: Keywords only match between word boundaries
+    :raises ValueError: if the response has other fields or unbalanced braces
+    :raises re.error: if a REGEX trigger is not a valid regular expression
+    """
+    def __init__(self, trigger, response, kind=KEYWORD, whole_word=True, rule_id=None):
+        if kind not in (KEYWORD, REGEX):
+            raise ValueError(f"Unknown trigger kind {kind!r}, expected {KEYWORD!r} or {REGEX!r}")
+        if not trigger:
+            raise ValueError("Empty trigger")
+        _check_response(response)
+        if kind == REGEX:
+            re.compile(trigger)  # raises re.error on invalid patterns
+        self.id = rule_id
+        self.trigger = trigger
+        self.response = response
+        self.kind = kind
+        self.whole_word = whole_word
+
+    def to_dict(self):
+        return {'trigger': self.trigger, 'response': self.response, 'kind': self.kind, 'whole_word': self.whole_word}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['trigger'], data['response'], data.get('kind', KEYWORD), data.get('whole_word', True))
+
+    def format(self, message):
+        """Response text for a discord.Message"""
+        return self.response.format_map(collections.defaultdict(str, {
+            'user': message.author.display_name,
+            'mention': message.author.mention,
+            'channel': getattr(message.channel, 'name', ''),
+        }))
+
+
+class AhoCorasick:
+    """
+    Multi-keyword matcher. Keywords can be added and removed at any time;
+    adding only inserts the new trie nodes, and the failure links are
+    recomputed in one pass the next time a text is searched.
+    """
+    def __init__(self):
+        self._goto = [{}]  # node -> {char: node}
+        self._fail = [0]
+        self._outputs = [set()]  # node -> ids of the keywords ending here
+        self._dict_link = [0]  # node -> nearest node on the failure chain with outputs (0 if none)
+        self._depth = [0]
+        self._dirty = False
+
+    def add(self, keyword, key):
+        node = 0
+        for char in keyword:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append(set())
+                self._dict_link.append(0)
+                self._depth.append(self._depth[node] + 1)
+                self._goto[node][char] = child
+                self._dirty = True
+            node = child
+        if not self._outputs[node]:
+            self._dirty = True  # dictionary links may now stop at this node
+        self._outputs[node].add(key)
+
+    def remove(self, keyword, key):
+        node = 0
+        for char in keyword:
+            node = self._goto[node].get(char)
+            if node is None:
+                return
+        self._outputs[node].discard(key)
+        if not self._outputs[node]:
+            # The node stays in the trie; only dictionary links need updating
+            self._dirty = True
+
+    def _link(self):
+        queue = collections.deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._dict_link[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                failed = self._fail[child]
+                self._dict_link[child] = failed if self._outputs[failed] else self._dict_link[failed]
+                queue.append(child)
+        self._dirty = False
+
+    def search(self, text):
+        """
+        :return: Iterator of (end index, keyword length, key) for every occurrence
+        """
+        if self._dirty:
+            self._link()
+        goto, fail, outputs, dict_link, depth = self._goto, self._fail, self._outputs, self._dict_link, self._depth
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if outputs[node] else dict_link[node]
+            while match:
+                for key in outputs[match]:
+                    yield index, depth[match], key
+                match = dict_link[match]
+
+
+class AutoResponder:
+    """
+    The rules and their compiled matcher. Thread-safe: the GUI edits rules
+    while the bot's loop matches messages.
+    """
+    def __init__(self, path=None):
+        """
+        :param path: JSON file the rules are loaded from and saved to, None to keep them in memory
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._rules = {}  # rule id -> Rule, ids grow in file order, lower ids win
+        self._next_id = 0
+        self._keywords = AhoCorasick()
+        self._regex_chunks = {}  # chunk number -> [(compiled pattern, {group name: rule id} or rule id)]
+        self._dirty_chunks = set()
+        if path and os.path.exists(path):
+            self.load()
+
+    @property
+    def rules(self):
+        with self._lock:
+            return [self._rules[rule_id] for rule_id in sorted(self._rules)]
+
+    def load(self):
+        """Replace the rules with the file's; invalid rules are reported and skipped"""
+        with open(self.path, encoding='utf-8') as f:
+            entries = json.load(f)
+        rules = []
+        for number, data in enumerate(entries, 1):
+            try:
+                rules.append(Rule.from_dict(data))
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                print(f"Error in auto-response {number} of {self.path}, skipped: {e}")
+        with self._lock:
+            for rule_id in list(self._rules):
+                self._remove(rule_id)
+            for rule in rules:
+                self._add(rule)
+
+    def save(self):
+        if not self.path:
+            return
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump([rule.to_dict() for rule in self.rules], f, indent=2, ensure_ascii=False)
+        os.replace(temporary, self.path)
+
+    def add_rule(self, rule):
+        """:return: The rule, with its id set"""
+        with self._lock:
+            return self._add(rule)
+
+    def remove_rule(self, rule_id):
+        with self._lock:
+            self._remove(rule_id)
+
+    def update_rule(self, rule_id, rule):
+        """Replace a rule, keeping its priority"""
+        with self._lock:
+            self._remove(rule_id)
+            return self._add(rule, rule_id)
+
+    def match(self, text):
+        """
+        :return: The highest priority rule triggered by the text, or None
+        """
+        if not text:
+            return None
+        with self._lock:
+            best = None
+            folded = text.casefold()
+            for end, length, rule_id in self._keywords.search(folded):
+                if best is not None and rule_id >= best:
+                    continue
+                if self._rules[rule_id].whole_word and not _on_word_boundaries(folded, end - length + 1, end + 1):
+                    continue
+                best = rule_id
+            for chunk in sorted(self._dirty_chunks):
+                self._compile_chunk(chunk)
+            self._dirty_chunks.clear()
+            for patterns in self._regex_chunks.values():
+                for pattern, groups in patterns:
+                    if isinstance(groups, int):
+                        # A rule compiled on its own
+                        if (best is None or groups < best) and pattern.search(text):
+                            best = groups
+                        continue
+                    lowest = min(groups.values())
+                    # A match hides any other starting inside it, where a higher
+                    # priority rule may match: search again from the next position
+                    start = 0
+                    while (best is None or lowest < best) and start <= len(text):
+                        found = pattern.search(text, start)
+                        if found is None:
+                            break
+                        rule_id = groups[found.lastgroup]
+                        if best is None or rule_id < best:
+                            best = rule_id
+                        start = found.start() + 1
+            return self._rules[best] if best is not None else None
+
+    def _add(self, rule, rule_id=None):
+        if rule_id is None:
+            rule_id = self._next_id
+            self._next_id += 1
+        rule.id = rule_id
+        self._rules[rule_id] = rule
+        if rule.kind == KEYWORD:
+            self._keywords.add(rule.trigger.casefold(), rule_id)
+        else:
+            self._dirty_chunks.add(rule_id // REGEX_CHUNK_SIZE)
+        return rule
+
+    def _remove(self, rule_id):
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return
+        if rule.kind == KEYWORD:
+            self._keywords.remove(rule.trigger.casefold(), rule_id)
+        else:
+            self._dirty_chunks.add(rule_id // REGEX_CHUNK_SIZE)
+
+    def _compile_chunk(self, chunk):
+        first = chunk * REGEX_CHUNK_SIZE
+        rules = [self._rules[rule_id] for rule_id in range(first, first + REGEX_CHUNK_SIZE)
+                 if rule_id in self._rules and self._rules[rule_id].kind == REGEX]
+        # Backreferences and named groups would clash once patterns are
+        # joined, so those rules are compiled on their own
+        alone = [rule for rule in rules if _SELF_REFERENCING.search(rule.trigger) or re.compile(rule.trigger).groupindex]
+        combined = [rule for rule in rules if rule not in alone]
+        patterns = []
+        if combined:
+            try:
+                patterns.append((
+                    re.compile('|'.join(f'(?P<r{rule.id}>{rule.trigger})' for rule in combined)),
+                    {f'r{rule.id}': rule.id for rule in combined},
+                ))
+            except re.error:
+                # e.g. inline global flags, only allowed at the start of a pattern
+                alone.extend(combined)
+        patterns.extend((re.compile(rule.trigger), rule.id) for rule in alone)
+        if patterns:
+            self._regex_chunks[chunk] = patterns
+        else:
+            self._regex_chunks.pop(chunk, None)
+
+
+def _check_response(response):
+    """
+    Check that a response only uses RESPONSE_FIELDS, as str.format would
+    otherwise fail on every message the rule answers
+    :raises ValueError: if it has another field, a positional one or a stray brace
+    """
+    # Raises ValueError itself on unbalanced braces
+    for _, field, _, _ in string.Formatter().parse(response):
+        if field is not None and field not in RESPONSE_FIELDS:
+            raise ValueError(f"Unknown field {{{field}}} in response, expected "
+                             f"{', '.join(f'{{{name}}}' for name in RESPONSE_FIELDS)}")
+    try:
+        # Conversions and format specs
+        response.format_map(dict.fromkeys(RESPONSE_FIELDS, ''))
+    except (KeyError, IndexError) as e:
+        raise ValueError(f"Unknown field {e} in response")
+
+
+def _on_word_boundaries(text, start, end):
+    return ((start == 0 or not text[start - 1].isalnum()) and
+            (end == len(text) or not text[end].isalnum()))
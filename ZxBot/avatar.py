@@ -0,0 +1,68 @@
+"""
+Avatar changes are limited by Discord to a couple per hour, and a change
+over the limit is refused only once the image has been uploaded. The bot
+keeps its own account of the changes it made so a request over the budget
+waits or is refused before anything is sent.
+"""
+import collections
+import time
+
+# (changes, per seconds) Discord accepts for a bot's avatar
+AVATAR_CHANGES = (2, 3600.0)
+# A change that would have to wait longer than this for the budget is refused
+MAX_AVATAR_WAIT = 60.0
+
+# Outcomes of DiscordBot.change_avatar
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+RATE_LIMITED = 'rate_limited'
+FAILED = 'failed'
+
+
+class AvatarBudget:
+    """
+    Sliding log of the last avatar changes. Slots are reserved before the
+    change is sent, so concurrent requests never count on the same one.
+    """
+    def __init__(self, changes=AVATAR_CHANGES[0], per=AVATAR_CHANGES[1]):
+        self.changes = changes
+        self.per = per
+        self._log = collections.deque()  # Times of the reserved changes, oldest first
+
+    def retry_after(self, now=None):
+        """:return: Seconds until a change fits in the budget, 0 if one fits now"""
+        now = time.monotonic() if now is None else now
+        while self._log and self._log[0] + self.per <= now:
+            self._log.popleft()
+        if len(self._log) < self.changes:
+            return 0.0
+        return self._log[len(self._log) - self.changes] + self.per - now
+
+    def reserve(self, max_wait=0.0, now=None):
+        """
+        Reserve the next free slot
+        :param max_wait: Longest acceptable wait for the slot in seconds
+        :return: (time of the slot, seconds to wait for it), (None, retry after) if the wait is over max_wait
+        """
+        now = time.monotonic() if now is None else now
+        delay = self.retry_after(now)
+        if delay > max_wait:
+            return None, delay
+        self._log.append(now + delay)
+        return now + delay, delay
+
+    def release(self, slot):
+        """Give back a slot whose change was not made"""
+        try:
+            self._log.remove(slot)
+        except ValueError:
+            pass
+
+    def exhaust(self, retry_after=None, now=None):
+        """
+        Mark the budget as spent after Discord refused a change
+        :param retry_after: Seconds Discord asked to wait, the whole period if unknown
+        """
+        now = time.monotonic() if now is None else now
+        until = now + (self.per if retry_after is None else retry_after)
+        self._log = collections.deque([until - self.per] * self.changes)
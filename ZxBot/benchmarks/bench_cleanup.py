@@ -0,0 +1,61 @@
+"""
+Compare one-by-one, bulk and indexed cleanup against the fake Discord API.
+
+Run from the ZxBot folder:
+    python -m benchmarks.bench_cleanup --messages 1000
+"""
+import argparse
+import asyncio
+import time
+
+from bot import DiscordBot
+from benchmarks.fake_discord import FakeDiscord, login, attach_channel, BOT_USER_ID
+
+CHANNEL_ID = 300000000000000001
+
+
+async def run_cleanup(fake, messages, bulk, old_ratio, indexed=False):
+    fake.channels.pop(CHANNEL_ID, None)
+    fake.seed_messages(CHANNEL_ID, messages, bot_ratio=0.5, old_ratio=old_ratio)
+    bot = DiscordBot(message_index_path=':memory:')
+    if indexed:
+        # As if every bot message had been sent through send_message
+        channel = fake.channels[CHANNEL_ID]
+        for message_id in sorted(channel):
+            if int(channel[message_id]['author']['id']) == BOT_USER_ID:
+                bot.message_index.add(CHANNEL_ID, message_id)
+    try:
+        await login(bot, fake)
+        await attach_channel(bot, CHANNEL_ID)
+        fake.reset_counters()
+        start = time.perf_counter()
+        result = await bot.delete_bot_messages(CHANNEL_ID, limit=messages, bulk=bulk)
+        elapsed = time.perf_counter() - start
+    finally:
+        await bot.bot.http.close()
+    return result, elapsed, sum(fake.requests.values()), dict(fake.requests), fake.rate_limited
+
+
+async def main(args):
+    fake = FakeDiscord(time_scale=args.time_scale)
+    await fake.start()
+    try:
+        for mode, bulk, indexed in (('single', False, False), ('bulk', True, False), ('indexed', True, True)):
+            result, elapsed, total, per_route, limited = await run_cleanup(
+                fake, args.messages, bulk, args.old_ratio, indexed
+            )
+            print(f"{mode} mode: {result['total']} deleted "
+                  f"({result['bulk']} bulk, {result['single']} single) "
+                  f"in {elapsed:.2f}s, {total} requests, {limited} 429s")
+            for route, count in sorted(per_route.items()):
+                print(f"    {count:6d}  {route}")
+    finally:
+        await fake.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=1000, help='Messages in the channel (half from the bot)')
+    parser.add_argument('--old-ratio', type=float, default=0.1, help='Share of bot messages older than 14 days')
+    parser.add_argument('--time-scale', type=float, default=0.05, help='Multiplier applied to rate-limit windows')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+"""
+Startup time and memory report for each intents profile.
+
+Each profile runs in its own process, connects with the given token, waits
+for on_ready (after member chunking when the profile enables it) and
+reports connect/ready times, Python heap usage and cache sizes.
+
+Run from the ZxBot folder:
+    python -m benchmarks.bench_profiles --token YOUR_TOKEN
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+PROFILES = ('minimal', 'messaging', 'full')
+
+
+async def measure(profile, token, timeout):
+    tracemalloc.start()
+    from bot import DiscordBot
+
+    bot = DiscordBot(message_index_path=':memory:', profile=profile)
+    report = {'profile': profile}
+    start = time.perf_counter()
+    ready = asyncio.Event()
+
+    async def on_connect():
+        report.setdefault('connect_s', time.perf_counter() - start)
+
+    async def on_ready():
+        report['ready_s'] = time.perf_counter() - start
+        ready.set()
+
+    bot.bot.add_listener(on_connect, 'on_connect')
+    bot.bot.add_listener(on_ready, 'on_ready')
+    runner = asyncio.create_task(bot.start_bot(token))
+    waiter = asyncio.create_task(ready.wait())
+    try:
+        await asyncio.wait({runner, waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if not ready.is_set():
+            report['error'] = 'failed to start' if runner.done() else f'not ready after {timeout}s'
+            return report
+        current, peak = tracemalloc.get_traced_memory()
+        report.update({
+            'heap_mb': current / 1024 / 1024,
+            'peak_heap_mb': peak / 1024 / 1024,
+            'guilds': len(bot.bot.guilds),
+            'cached_users': len(bot.bot.users),
+            'cached_members': sum(len(guild.members) for guild in bot.bot.guilds),
+        })
+    finally:
+        await bot.stop_bot()
+        runner.cancel()
+        waiter.cancel()
+    return report
+
+
+def run_profile(profile, args):
+    command = [sys.executable, '-m', 'benchmarks.bench_profiles', '--run', profile,
+               '--token', args.token, '--timeout', str(args.timeout)]
+    output = subprocess.run(command, capture_output=True, text=True).stdout.strip().splitlines()
+    return json.loads(output[-1]) if output else {'profile': profile, 'error': 'no output'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--token', help='Bot token (defaults to config.TOKEN)')
+    parser.add_argument('--timeout', type=float, default=300, help='Seconds to wait for on_ready')
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+    parser.add_argument('--run', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.token is None:
+        from config import TOKEN
+        args.token = TOKEN
+
+    if args.run:
+        print(json.dumps(asyncio.run(measure(args.run, args.token, args.timeout))))
+        return
+
+    print(f"{'profile':<10} {'connect':>8} {'ready':>8} {'heap MB':>8} {'peak MB':>8} "
+          f"{'guilds':>7} {'users':>8} {'members':>8}")
+    for profile in args.profiles:
+        r = run_profile(profile, args)
+        if 'error' in r:
+            print(f"{profile:<10} {r['error']}")
+            continue
+        print(f"{profile:<10} {r.get('connect_s', 0):7.2f}s {r['ready_s']:7.2f}s {r['heap_mb']:8.1f} "
+              f"{r['peak_heap_mb']:8.1f} {r['guilds']:7d} {r['cached_users']:8d} {r['cached_members']:8d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Measure how long the bot takes to come back after a stop or a restart,
+against the fake Discord API and gateway.
+
+Run from the ZxBot folder:
+    python -m benchmarks.bench_restart --rounds 5
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import statistics
+import time
+
+from bot import DiscordBot
+from benchmarks.fake_discord import FakeDiscord
+
+CHANNEL_ID = 300000000000000001
+
+
+async def start(bot, token='fake-token'):
+    """:return: Seconds until the bot was ready"""
+    ready = concurrent.futures.Future()
+    started = time.perf_counter()
+    asyncio.ensure_future(bot.start_bot(token, ready))
+    if not await asyncio.wrap_future(ready):
+        raise RuntimeError('bot failed to start')
+    return time.perf_counter() - started
+
+
+async def main(args):
+    fake = FakeDiscord()
+    await fake.start()
+    fake.add_channel(CHANNEL_ID)
+    bot = DiscordBot(message_index_path=':memory:')
+    bot.bot._connection.guild_ready_timeout = args.guild_ready_timeout
+    timings = {'cold start': [], 'force stop + start': [], 'stop + start': [], 'restart': []}
+    try:
+        timings['cold start'].append(await start(bot))
+        for _ in range(args.rounds):
+            await bot.force_stop_bot()
+            timings['force stop + start'].append(await start(bot))
+            await bot.stop_bot(keep_session=True)
+            timings['stop + start'].append(await start(bot))
+            timings['restart'].append(await bot.restart())
+        for name, values in timings.items():
+            print(f"{name:>20}: median {statistics.median(values) * 1000:8.1f} ms over {len(values)} run(s)")
+        print(f"gateway: {fake.gateway_ops[2]} IDENTIFY, {fake.gateway_ops[6]} RESUME; "
+              f"REST: {sum(fake.requests.values())} requests")
+    finally:
+        await bot.force_stop_bot()
+        await fake.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--guild-ready-timeout', type=float, default=2.0,
+                        help="Seconds discord.py waits for GUILD_CREATE events after READY (discord.py's default is 2)")
+    asyncio.run(main(parser.parse_args()))
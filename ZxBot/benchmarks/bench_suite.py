@@ -0,0 +1,177 @@
+"""
+Throughput and latency of the main bot operations against the fake Discord
+API and gateway: sending messages, sending images one by one or as albums,
+cleaning up and changing presence. For each one it reports operations/sec, p50/p99 latency, the REST
+requests made per route, the 429s received and the gateway messages sent.
+
+Run from the ZxBot folder:
+    python -m benchmarks.bench_suite --messages 500 --channels 5
+    python -m benchmarks.bench_suite --only send image --json
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from bot import DiscordBot, _succeeded
+from benchmarks.fake_discord import FakeDiscord
+
+SCENARIOS = ('send', 'image', 'image_reuse', 'album', 'cleanup', 'presence')
+FIRST_CHANNEL_ID = 300000000000000001
+
+
+async def run_operations(operations, concurrency):
+    """
+    Run coroutine factories, at most concurrency at a time
+    :return: (elapsed seconds, list of latencies, number of failures)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def run(operation):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            result = await operation()
+            latencies.append(time.perf_counter() - started)
+            if not _succeeded(result):
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(operation) for operation in operations))
+    return time.perf_counter() - started, latencies, failures
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+async def scenario(fake, bot, name, args, image_path, album_paths):
+    """:return: (operations, items) where items is what the ops/sec figure counts"""
+    channel_ids = [FIRST_CHANNEL_ID + i for i in range(args.channels)]
+    if name == 'send':
+        operations = [
+            (lambda i=i: bot.send_message(channel_ids[i % len(channel_ids)], f'message {i}'))
+            for i in range(args.messages)
+        ]
+        return operations, None
+    if name in ('image', 'image_reuse'):
+        reuse = name == 'image_reuse'
+        operations = [
+            (lambda i=i: bot.send_image(channel_ids[i % len(channel_ids)], image_path, reuse_upload=reuse))
+            for i in range(args.images)
+        ]
+        return operations, None
+    if name == 'album':
+        # The same number of images as the image scenarios, several per message
+        per_channel = [album_paths[i::len(channel_ids)] for i in range(len(channel_ids))]
+        return [
+            (lambda channel_id=channel_id, paths=paths: bot.send_images(channel_id, paths))
+            for channel_id, paths in zip(channel_ids, per_channel) if paths
+        ], [len(paths) for paths in per_channel]
+    if name == 'cleanup':
+        for channel_id in channel_ids:
+            fake.channels.pop(channel_id, None)
+            fake.seed_messages(channel_id, args.messages // len(channel_ids) * 2, bot_ratio=0.5, old_ratio=0.1)
+            bot.message_index.remove(channel_id, bot.message_index.get(channel_id, 10 ** 9))
+            bot.message_index.set_scan_state(channel_id, None, False)
+        deleted = []
+
+        async def cleanup(channel_id):
+            result = await bot.delete_bot_messages(channel_id, limit=args.messages)
+            deleted.append(result['total'])
+            return result
+
+        return [(lambda channel_id=channel_id: cleanup(channel_id)) for channel_id in channel_ids], deleted
+    if name == 'presence':
+        statuses = ('online', 'idle', 'dnd')
+        operations = [
+            (lambda i=i: bot.change_presence(statuses[i % len(statuses)], f'benchmark {i}'))
+            for i in range(args.presences)
+        ]
+        return operations, None
+    raise ValueError(f'Unknown scenario {name!r}')
+
+
+async def main(args):
+    fake = FakeDiscord(time_scale=args.time_scale)
+    await fake.start()
+    for i in range(args.channels):
+        fake.add_channel(FIRST_CHANNEL_ID + i)
+    bot = DiscordBot(message_index_path=':memory:')
+    # discord.py waits this long for more GUILD_CREATEs after the last one
+    bot.bot._connection.guild_ready_timeout = 0.1
+    image_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
+    image_file.write(os.urandom(args.image_kb * 1024))
+    image_file.close()
+    album_paths = [image_file.name] * args.images
+
+    reports = []
+    try:
+        ready = concurrent.futures.Future()
+        asyncio.ensure_future(bot.start_bot('fake-token', ready))
+        if not await asyncio.wrap_future(ready):
+            raise RuntimeError('bot failed to connect to the fake gateway')
+
+        for name in args.only or SCENARIOS:
+            operations, items = await scenario(fake, bot, name, args, image_file.name, album_paths)
+            fake.reset_counters()
+            elapsed, latencies, failures = await run_operations(operations, args.concurrency)
+            # Let the fake gateway read what was written to the socket before counting
+            await asyncio.sleep(0.1)
+            count = sum(items) if items is not None else len(operations)
+            reports.append({
+                'scenario': name,
+                'operations': len(operations),
+                'items': count,
+                'failures': failures,
+                'elapsed_s': elapsed,
+                'per_second': count / elapsed if elapsed else None,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'requests': sum(fake.requests.values()),
+                'requests_per_route': dict(fake.requests),
+                'rate_limited': fake.rate_limited,
+                'gateway_sends': fake.gateway_ops[3],
+            })
+    finally:
+        await bot.force_stop_bot()
+        await fake.stop()
+        os.unlink(image_file.name)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    print(f"{'scenario':<12} {'items':>6} {'/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'requests':>9} {'429s':>5} {'fail':>5}")
+    for report in reports:
+        print(f"{report['scenario']:<12} {report['items']:>6} {report['per_second']:>9.1f} "
+              f"{report['p50_ms']:>9.1f} {report['p99_ms']:>9.1f} {report['requests']:>9} "
+              f"{report['rate_limited']:>5} {report['failures']:>5}")
+        for route, count in sorted(report['requests_per_route'].items()):
+            print(f"{'':<12} {count:>6}  {route}")
+        if report['gateway_sends']:
+            print(f"{'':<12} {report['gateway_sends']:>6}  gateway presence updates")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500, help='Messages sent, and bot messages cleaned up')
+    parser.add_argument('--images', type=int, default=50, help='Images sent per image scenario')
+    parser.add_argument('--image-kb', type=int, default=256, help='Size of the test image')
+    parser.add_argument('--presences', type=int, default=50,
+                        help='Presence changes (discord.py allows 110 gateway sends per minute)')
+    parser.add_argument('--channels', type=int, default=5, help='Channels the operations are spread over')
+    parser.add_argument('--concurrency', type=int, default=10, help='Operations in flight at once')
+    parser.add_argument('--time-scale', type=float, default=0.05, help='Multiplier applied to rate-limit windows')
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, help='Scenarios to run')
+    parser.add_argument('--json', action='store_true', help='Print the reports as JSON')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,502 @@
+"""
+Local stand-in for the Discord REST API and gateway, used by the benchmarks.
+
+It keeps channels and messages in memory, counts every request per route
+and answers with rate-limit headers (and 429s when a bucket is exhausted)
+so discord.py paces itself the same way it does against the real API.
+REST covers login, channel fetch and create, message send (JSON and
+multipart), history, delete, bulk delete and user edit. The gateway speaks
+just enough of the protocol (HELLO, IDENTIFY/READY/GUILD_CREATE,
+RESUME/RESUMED, heartbeats, presence updates, CHANNEL_CREATE) for
+discord.py to connect and reconnect, and enforces the gateway send limit.
+"""
+import collections
+import datetime
+import json
+import time
+import uuid
+
+import discord
+import yarl
+from aiohttp import WSMsgType, web
+
+BOT_USER_ID = 100000000000000001
+OTHER_USER_ID = 100000000000000002
+GUILD_ID = 200000000000000001
+
+# (requests, window in seconds) per route, as documented by Discord.
+# Windows are multiplied by FakeDiscord.time_scale to keep benchmarks short.
+DEFAULT_RATE_LIMITS = {
+    'GET /channels/{channel_id}/messages': (50, 1.0),
+    'POST /channels/{channel_id}/messages': (5, 5.0),
+    'DELETE /channels/{channel_id}/messages/{message_id}': (5, 1.0),
+    'POST /channels/{channel_id}/messages/bulk-delete': (1, 1.0),
+    'PATCH /users/@me': (2, 3600.0),
+}
+# Discord closes the gateway after 120 sends per minute
+GATEWAY_SEND_LIMIT = (120, 60.0)
+
+
+class FakeDiscord:
+    def __init__(self, rate_limits=None, time_scale=0.05):
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS)
+        if rate_limits:
+            self.rate_limits.update(rate_limits)
+        self.time_scale = time_scale
+        self.channels = {}  # channel_id -> {message_id: message payload}, all in GUILD_ID
+        self.guild_ids = [GUILD_ID]
+        self.shard_count = 1  # recommended by /gateway/bot
+        self.requests = collections.Counter()
+        self.rate_limited = 0
+        self._buckets = {}
+        self._snowflake_increment = 0
+        self._runner = None
+        self.base_url = None
+        self.gateway_url = None
+        self.sessions = {}  # session_id -> last sequence number
+        self.gateway_ops = collections.Counter()
+        self.presences = []
+        self.avatar = None
+        self._gateways = set()  # dispatch callables of the connected gateway sockets
+
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_get('/gateway', self.gateway)
+        self.app.router.add_get('/api/v10/gateway', self.get_gateway)
+        self.app.router.add_get('/api/v10/gateway/bot', self.get_gateway)
+        self.app.router.add_get('/api/v10/users/@me', self.get_me)
+        self.app.router.add_patch('/api/v10/users/@me', self.edit_me)
+        self.app.router.add_post('/api/v10/guilds/{guild_id}/channels', self.create_channel)
+        self.app.router.add_get('/api/v10/oauth2/applications/@me', self.get_application)
+        self.app.router.add_get('/api/v10/channels/{channel_id}', self.get_channel)
+        self.app.router.add_get('/api/v10/channels/{channel_id}/messages', self.get_messages)
+        self.app.router.add_post('/api/v10/channels/{channel_id}/messages', self.send_message)
+        self.app.router.add_delete('/api/v10/channels/{channel_id}/messages/{message_id}', self.delete_message)
+        self.app.router.add_post('/api/v10/channels/{channel_id}/messages/bulk-delete', self.bulk_delete)
+
+    async def start(self, host='127.0.0.1', port=0):
+        """
+        Start serving and point discord.py at this server
+        :return: Base URL of the fake API
+        """
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://{host}:{port}/api/v10'
+        self.gateway_url = f'ws://{host}:{port}/gateway'
+        discord.http.Route.BASE = self.base_url
+        discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(self.gateway_url)
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def reset_counters(self):
+        self.requests.clear()
+        self.gateway_ops.clear()
+        self.rate_limited = 0
+        self._buckets.clear()
+
+    # Data helpers
+
+    def snowflake(self, when=None):
+        when = when or discord.utils.utcnow()
+        self._snowflake_increment = (self._snowflake_increment + 1) % 4096
+        return discord.utils.time_snowflake(when) + self._snowflake_increment
+
+    def add_guild(self, guild_id):
+        if guild_id not in self.guild_ids:
+            self.guild_ids.append(guild_id)
+
+    def add_channel(self, channel_id):
+        self.channels.setdefault(int(channel_id), {})
+
+    def add_message(self, channel_id, author_id, content='', when=None):
+        message_id = self.snowflake(when)
+        payload = _message_payload(message_id, int(channel_id), author_id, content)
+        self.channels[int(channel_id)][message_id] = payload
+        return message_id
+
+    def seed_messages(self, channel_id, count, bot_ratio=0.5, old_ratio=0.0):
+        """
+        Fill a channel with a mix of bot and foreign messages
+        :param count: Total number of messages to create
+        :param bot_ratio: Share of messages authored by the bot
+        :param old_ratio: Share of bot messages older than the 14 days bulk-delete window
+        """
+        self.add_channel(channel_id)
+        now = discord.utils.utcnow()
+        bot_every = max(1, round(1 / bot_ratio)) if bot_ratio else 0
+        old_every = max(1, round(1 / old_ratio)) if old_ratio else 0
+        bot_index = 0
+        for i in range(count):
+            is_bot = bot_every and i % bot_every == 0
+            when = now - datetime.timedelta(seconds=count - i)
+            if is_bot:
+                if old_every and bot_index % old_every == 0:
+                    when -= datetime.timedelta(days=20)
+                bot_index += 1
+            self.add_message(channel_id, BOT_USER_ID if is_bot else OTHER_USER_ID, f'message {i}', when)
+
+    # Rate limiting
+
+    def _rate_limit(self, route, major):
+        """
+        Apply the route's bucket and build the rate-limit headers
+        :return: (headers, retry_after) where retry_after is None when the request is allowed
+        """
+        limit, window = self.rate_limits.get(route, (50, 1.0))
+        window *= self.time_scale
+        key = (route, major)
+        now = time.monotonic()
+        reset_at, used = self._buckets.get(key, (now + window, 0))
+        if now >= reset_at:
+            reset_at, used = now + window, 0
+        reset_after = max(reset_at - now, 0.001)
+        headers = {
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Bucket': f'{hash(route) & 0xffffffff:x}',
+            'X-RateLimit-Reset-After': f'{reset_after:.3f}',
+            'X-RateLimit-Reset': f'{time.time() + reset_after:.3f}',
+        }
+        if used >= limit:
+            headers['X-RateLimit-Remaining'] = '0'
+            headers['X-RateLimit-Scope'] = 'user'
+            return headers, reset_after
+        self._buckets[key] = (reset_at, used + 1)
+        headers['X-RateLimit-Remaining'] = str(limit - used - 1)
+        return headers, None
+
+    def _respond(self, route, major, handler_result, status=200):
+        self.requests[route] += 1
+        headers, retry_after = self._rate_limit(route, major)
+        if retry_after is not None:
+            self.rate_limited += 1
+            body = {'message': 'You are being rate limited.', 'retry_after': retry_after, 'global': False}
+            # discord.py treats a 429 without Via as a Cloudflare ban and gives up
+            headers['Via'] = '1.1 google'
+            headers['Retry-After'] = f'{retry_after:.3f}'
+            return _json_response(body, status=429, headers=headers)
+        if status == 204:
+            return web.Response(status=204, headers=headers)
+        return _json_response(handler_result(), status=status, headers=headers)
+
+    # Gateway
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        state = {'session_id': None, 'sequence': 0}
+        sends = collections.deque()  # monotonic times of the recent client sends
+
+        async def dispatch(event, data):
+            state['sequence'] += 1
+            if state['session_id']:
+                self.sessions[state['session_id']] = state['sequence']
+            await ws.send_str(json.dumps({'op': 0, 't': event, 's': state['sequence'], 'd': data}))
+
+        await ws.send_str(json.dumps({'op': 10, 'd': {'heartbeat_interval': 41250}}))
+        self._gateways.add(dispatch)
+        try:
+            await self._gateway_loop(ws, state, sends, dispatch)
+        finally:
+            self._gateways.discard(dispatch)
+        return ws
+
+    async def _gateway_loop(self, ws, state, sends, dispatch):
+        limit, window = GATEWAY_SEND_LIMIT
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                break
+            now = time.monotonic()
+            sends.append(now)
+            while sends[0] <= now - window:
+                sends.popleft()
+            if len(sends) > limit:
+                await ws.close(code=4008, message=b'Rate limited.')
+                break
+            payload = json.loads(msg.data)
+            op, data = payload.get('op'), payload.get('d')
+            self.gateway_ops[op] += 1
+            if op == 1:
+                await ws.send_str(json.dumps({'op': 11}))
+            elif op == 2:
+                state['session_id'] = uuid.uuid4().hex
+                shard_id, shard_count = data.get('shard') or (0, 1)
+                guilds = [g for g in self.guild_ids if (g >> 22) % shard_count == shard_id]
+                await dispatch('READY', {
+                    'v': 10,
+                    'user': _user_payload(BOT_USER_ID, 'ZxBot', bot=True),
+                    'guilds': [{'id': str(g), 'unavailable': True} for g in guilds],
+                    'session_id': state['session_id'],
+                    'resume_gateway_url': self.gateway_url,
+                    'application': {'id': str(BOT_USER_ID), 'flags': 0},
+                    'shard': data.get('shard'),
+                })
+                for guild_id in guilds:
+                    await dispatch('GUILD_CREATE', self._guild_payload(guild_id))
+            elif op == 6:
+                if data.get('session_id') not in self.sessions:
+                    await ws.send_str(json.dumps({'op': 9, 'd': False}))
+                    continue
+                state['session_id'] = data['session_id']
+                state['sequence'] = self.sessions[state['session_id']]
+                await dispatch('RESUMED', {})
+            elif op == 3:
+                self.presences.append(data)
+
+    async def _broadcast_event(self, event, data):
+        for dispatch in list(self._gateways):
+            try:
+                await dispatch(event, data)
+            except ConnectionError:
+                self._gateways.discard(dispatch)
+
+    def _guild_payload(self, guild_id):
+        channels = [_channel_payload(c) for c in sorted(self.channels)] if guild_id == GUILD_ID else []
+        for channel in channels:
+            del channel['guild_id']
+        return {
+            'id': str(guild_id),
+            'name': f'guild-{guild_id}',
+            'icon': None,
+            'owner_id': str(OTHER_USER_ID),
+            'unavailable': False,
+            'member_count': 2,
+            'large': False,
+            'features': [],
+            'roles': [],
+            'emojis': [],
+            'stickers': [],
+            'channels': channels,
+            'threads': [],
+            'members': [{'user': _user_payload(BOT_USER_ID, 'ZxBot', bot=True), 'roles': [], 'joined_at': None, 'flags': 0}],
+            'voice_states': [],
+            'presences': [],
+            'stage_instances': [],
+            'guild_scheduled_events': [],
+            'premium_tier': 0,
+            'verification_level': 0,
+            'explicit_content_filter': 0,
+            'default_message_notifications': 0,
+            'mfa_level': 0,
+            'system_channel_flags': 0,
+        }
+
+    # Handlers
+
+    async def get_gateway(self, request):
+        return _json_response({
+            'url': self.gateway_url,
+            'shards': self.shard_count,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1},
+        })
+
+    async def get_me(self, request):
+        return self._respond('GET /users/@me', None, lambda: _user_payload(BOT_USER_ID, 'ZxBot', bot=True))
+
+    async def edit_me(self, request):
+        payload = await request.json()
+
+        def edit():
+            if 'avatar' in payload:
+                self.avatar = payload['avatar']
+            user = _user_payload(BOT_USER_ID, 'ZxBot', bot=True)
+            user['avatar'] = f'{hash(self.avatar) & 0xffffffff:032x}' if self.avatar else None
+            return user
+
+        return self._respond('PATCH /users/@me', None, edit)
+
+    async def create_channel(self, request):
+        guild_id = int(request.match_info['guild_id'])
+        route = 'POST /guilds/{guild_id}/channels'
+        if guild_id != GUILD_ID:
+            self.requests[route] += 1
+            return _json_response({'message': 'Unknown Guild', 'code': 10004}, status=404)
+        name = (await request.json()).get('name') or 'channel'
+        channel_id = self.snowflake()
+        self.add_channel(channel_id)
+        response = self._respond(route, guild_id, lambda: dict(_channel_payload(channel_id), name=name), status=201)
+        if response.status == 201:
+            await self._broadcast_event('CHANNEL_CREATE', dict(_channel_payload(channel_id), name=name))
+        return response
+
+    async def get_application(self, request):
+        def application():
+            return {
+                'id': str(BOT_USER_ID),
+                'name': 'ZxBot',
+                'description': '',
+                'icon': None,
+                'bot_public': False,
+                'bot_require_code_grant': False,
+                'owner': _user_payload(OTHER_USER_ID, 'owner'),
+                'verify_key': '0' * 64,
+                'flags': 0,
+            }
+        return self._respond('GET /oauth2/applications/@me', None, application)
+
+    async def get_channel(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        if channel_id not in self.channels:
+            self.requests['GET /channels/{channel_id}'] += 1
+            return _json_response({'message': 'Unknown Channel', 'code': 10003}, status=404)
+        return self._respond('GET /channels/{channel_id}', channel_id, lambda: _channel_payload(channel_id))
+
+    async def get_messages(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        limit = min(int(request.query.get('limit', 50)), 100)
+        before = request.query.get('before')
+        after = request.query.get('after')
+
+        def page():
+            ids = sorted(self.channels.get(channel_id, {}), reverse=True)
+            if before:
+                ids = [i for i in ids if i < int(before)]
+            if after:
+                ids = sorted(i for i in ids if i > int(after))
+            return [self.channels[channel_id][i] for i in ids[:limit]]
+
+        return self._respond('GET /channels/{channel_id}/messages', channel_id, page)
+
+    async def send_message(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        route = 'POST /channels/{channel_id}/messages'
+        if channel_id not in self.channels:
+            self.requests[route] += 1
+            return _json_response({'message': 'Unknown Channel', 'code': 10003}, status=404)
+        content, attachments = '', []
+        if request.content_type.startswith('multipart/'):
+            reader = await request.multipart()
+            async for part in reader:
+                data = await part.read()
+                if part.name == 'payload_json':
+                    content = json.loads(data).get('content') or ''
+                else:
+                    attachments.append((part.filename, len(data)))
+        else:
+            content = (await request.json()).get('content') or ''
+
+        def create():
+            message_id = self.add_message(channel_id, BOT_USER_ID, content)
+            payload = self.channels[channel_id][message_id]
+            payload['attachments'] = [
+                _attachment_payload(self.snowflake(), channel_id, filename, size)
+                for filename, size in attachments
+            ]
+            return payload
+
+        return self._respond(route, channel_id, create)
+
+    async def delete_message(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        message_id = int(request.match_info['message_id'])
+        route = 'DELETE /channels/{channel_id}/messages/{message_id}'
+        if message_id not in self.channels.get(channel_id, {}):
+            self.requests[route] += 1
+            return _json_response({'message': 'Unknown Message', 'code': 10008}, status=404)
+        response = self._respond(route, channel_id, None, status=204)
+        if response.status == 204:
+            del self.channels[channel_id][message_id]
+        return response
+
+    async def bulk_delete(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        payload = await request.json()
+        message_ids = [int(i) for i in payload.get('messages', [])]
+        route = 'POST /channels/{channel_id}/messages/bulk-delete'
+        min_id = discord.utils.time_snowflake(discord.utils.utcnow() - datetime.timedelta(days=14))
+        if not 2 <= len(message_ids) <= 100 or any(i < min_id for i in message_ids):
+            self.requests[route] += 1
+            return _json_response({'message': 'Invalid Form Body', 'code': 50034}, status=400)
+        response = self._respond(route, channel_id, None, status=204)
+        if response.status == 204:
+            for message_id in message_ids:
+                self.channels[channel_id].pop(message_id, None)
+        return response
+
+
+async def login(bot, fake, token='fake-token'):
+    """
+    Log a DiscordBot into the fake API without opening a gateway connection
+    """
+    await bot.bot.login(token)
+
+
+async def attach_channel(bot, channel_id):
+    """
+    Fetch a channel from the fake API and put it in the bot's cache, as the
+    gateway would have done on READY
+    """
+    channel = await bot.bot.fetch_channel(int(channel_id))
+    bot.bot._connection._add_guild(channel.guild)
+    channel.guild._add_channel(channel)
+    return channel
+
+
+def _json_response(data, status=200, headers=None):
+    # discord.py only decodes bodies whose content type is exactly application/json
+    headers = dict(headers or {})
+    headers['Content-Type'] = 'application/json'
+    return web.Response(body=json.dumps(data).encode(), status=status, headers=headers)
+
+
+def _user_payload(user_id, username, bot=False):
+    return {
+        'id': str(user_id),
+        'username': username,
+        'discriminator': '0',
+        'global_name': None,
+        'avatar': None,
+        'bot': bot,
+    }
+
+
+def _channel_payload(channel_id):
+    return {
+        'id': str(channel_id),
+        'type': 0,
+        'guild_id': str(GUILD_ID),
+        'name': f'channel-{channel_id}',
+        'position': 0,
+        'permission_overwrites': [],
+        'nsfw': False,
+        'parent_id': None,
+        'topic': None,
+        'last_message_id': None,
+        'rate_limit_per_user': 0,
+    }
+
+
+def _attachment_payload(attachment_id, channel_id, filename, size):
+    url = f'https://cdn.discordapp.com/attachments/{channel_id}/{attachment_id}/{filename}'
+    return {
+        'id': str(attachment_id),
+        'filename': filename,
+        'size': size,
+        'url': url,
+        'proxy_url': url,
+    }
+
+
+def _message_payload(message_id, channel_id, author_id, content):
+    timestamp = discord.utils.snowflake_time(message_id).isoformat()
+    return {
+        'id': str(message_id),
+        'channel_id': str(channel_id),
+        'author': _user_payload(author_id, 'ZxBot' if author_id == BOT_USER_ID else 'someone', author_id == BOT_USER_ID),
+        'content': content,
+        'timestamp': timestamp,
+        'edited_timestamp': None,
+        'tts': False,
+        'mention_everyone': False,
+        'mentions': [],
+        'mention_roles': [],
+        'attachments': [],
+        'embeds': [],
+        'pinned': False,
+        'type': 0,
+    }
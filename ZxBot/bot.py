@@ -1,60 +1,859 @@
+import asyncio
+import collections
+import concurrent.futures
+import datetime
+import functools
+import math
+import threading
+import time
+import aiohttp
 import discord
 from discord.ext import commands
+from discord.gateway import DiscordWebSocket, ReconnectWebSocket
+from message_index import MessageIndex
+from dispatcher import OutboundDispatcher, PRIORITY_HIGH, PRIORITY_NORMAL
+from image_pipeline import ImagePipeline, PreparedImage, DEFAULT_UPLOAD_LIMIT, pack_attachments
+from channel_resolver import ChannelResolver
+from metrics import Metrics
+from autoresponder import AutoResponder
+from cooldowns import ReplyCooldowns, DEFAULT_DEDUP_WINDOW
+from scheduler import Scheduler
+from composer import MessageCoalescer, split_message, DEFAULT_LINGER
+from feed import MessageFeed
+from cleanup import CleanupFilter
+from avatar import AvatarBudget, MAX_AVATAR_WAIT, CHANGED, UNCHANGED, RATE_LIMITED, FAILED
+from startup_profile import profiler
+
+# Discord refuses bulk deletes of more than 100 messages or of messages
+# older than 14 days
+BULK_DELETE_MAX = 100
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14)
+# Keep a margin so messages close to the cutoff are not rejected in flight
+BULK_DELETE_MARGIN = datetime.timedelta(minutes=5)
+# Maximum number of channels a broadcast sends to at the same time
+BROADCAST_CONCURRENCY = 10
+# Seconds a suspended gateway session is still worth resuming
+RESUME_WINDOW = 120
+# Seconds restart() waits for the bot to be ready again
+RESTART_TIMEOUT = 60
+# Seconds an avatar change may wait on a rate limit Discord applies despite
+# the local budget (the limit lasts up to an hour); other operations wait
+# their rate limits out as usual
+MAX_RATELIMIT_WAIT = 60
+# Gateway intent and cache profiles, see bot_options()
+PROFILES = ('minimal', 'messaging', 'full')
+DEFAULT_PROFILE = 'messaging'
+
+def bot_options(profile=DEFAULT_PROFILE):
+    """
+    commands.Bot options for a profile:
+    minimal: guild and channel events only, no member, presence or message cache
+    messaging: adds message events and content, still no member list or presences
+    full: every intent, members chunked at startup, last 1000 messages cached
+    :param profile: One of PROFILES
+    :return: dict of keyword arguments for commands.Bot
+    """
+    if profile == 'minimal':
+        intents = discord.Intents.none()
+        intents.guilds = True
+        return {
+            'intents': intents,
+            'member_cache_flags': discord.MemberCacheFlags.none(),
+            'chunk_guilds_at_startup': False,
+            'max_messages': None,
+        }
+    if profile == 'messaging':
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.guild_messages = True
+        intents.dm_messages = True
+        intents.message_content = True
+        return {
+            'intents': intents,
+            'member_cache_flags': discord.MemberCacheFlags.none(),
+            'chunk_guilds_at_startup': False,
+            'max_messages': None,
+        }
+    if profile == 'full':
+        return {
+            'intents': discord.Intents.all(),
+            'member_cache_flags': discord.MemberCacheFlags.all(),
+            'chunk_guilds_at_startup': True,
+            'max_messages': 1000,
+        }
+    raise ValueError(f"Unknown profile {profile!r}, expected one of {', '.join(PROFILES)}")
+
+def _upload_limit(channel):
+    """Maximum upload size in bytes for a channel"""
+    # Fetched channels of uncached guilds only carry a discord.Object as their guild
+    return getattr(getattr(channel, 'guild', None), 'filesize_limit', DEFAULT_UPLOAD_LIMIT)
+
+def _latency_ms(latency):
+    """Gateway latency in milliseconds, None before the first heartbeat"""
+    return round(latency * 1000, 1) if math.isfinite(latency) else None
+
+def _report_presence_error(future):
+    """Done callback of a presence change nobody awaits, so its error is not lost"""
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error changing presence after a settings reload: {future.exception()}")
+
+def _succeeded(result):
+    """Whether an operation's return value means it worked"""
+    if result is None or result is False:
+        return False
+    if isinstance(result, dict):
+        if 'ok' in result:
+            # e.g. change_avatar's outcome
+            return bool(result['ok'])
+        if result and all(isinstance(value, bool) for value in result.values()):
+            # Broadcasts report one bool per channel
+            return all(result.values())
+    return True
+
+def _instrumented(method):
+    """Record the duration and the outcome of a DiscordBot operation in its metrics"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            result = await method(self, *args, **kwargs)
+            succeeded = _succeeded(result)
+            return result
+        finally:
+            self.metrics.observe(method.__name__, time.perf_counter() - started, succeeded)
+    return wrapper
 
 class DiscordBot:
-    def __init__(self):
-        self.bot = commands.Bot(command_prefix='!', intents=discord.Intents.all())
+    def __init__(self, message_index_path='message_index.db', profile=DEFAULT_PROFILE, metrics_path=None,
+                 sharded=False, shard_count=None, shard_ids=None, responses_path=None, cooldowns=None,
+                 dedup_window=DEFAULT_DEDUP_WINDOW, schedule_path=None, linger=DEFAULT_LINGER):
+        """
+        :param message_index_path: SQLite file recording the messages the bot sent
+        :param profile: Intents and caches profile, one of PROFILES
+        :param metrics_path: JSON file a metrics snapshot is written to every minute, None to disable
+        :param sharded: Split the gateway connection into shards, as many as Discord recommends by default
+        :param shard_count: Total number of shards across all processes (implies sharded)
+        :param shard_ids: Shards run by this process, all of them if None (needs shard_count)
+        :param responses_path: JSON file of auto-response rules, None to keep them in memory only
+        :param cooldowns: {'user' | 'channel' | 'guild': (replies, seconds)} limits on auto-responses,
+                          cooldowns.DEFAULT_LIMITS if None
+        :param dedup_window: Seconds an identical auto-response in a channel is dropped, 0 to disable
+        :param schedule_path: SQLite file of the scheduled messages, None to keep them in memory only
+        :param linger: Seconds queue_message() waits to merge small messages to the same channel, 0 to disable
+        """
+        if shard_ids is not None and shard_count is None:
+            raise ValueError("shard_ids needs shard_count, the total number of shards")
+        self.profile = profile
+        self.sharded = sharded or shard_count is not None
+        self.metrics = Metrics()
+        self.metrics_path = metrics_path
+        options = bot_options(profile)
+        if self.sharded:
+            options.update(shard_count=shard_count, shard_ids=list(shard_ids) if shard_ids is not None else None)
+        bot_class = commands.AutoShardedBot if self.sharded else commands.Bot
+        # Gateway debug events are only needed to time IDENTIFY/READY when profiling
+        self.bot = bot_class(
+            command_prefix='!',
+            enable_debug_events=profiler.enabled,
+            http_trace=self.metrics.http_trace(),
+            **options
+        )
+        self.message_index = MessageIndex(message_index_path)
+        self.dispatcher = OutboundDispatcher()
+        self.coalescer = MessageCoalescer(self._dispatch_message, linger)
+        self.images = ImagePipeline()
+        self.channels = ChannelResolver(self.bot)
+        self.responder = AutoResponder(responses_path)
+        self.reply_cooldowns = ReplyCooldowns(cooldowns, dedup_window)
+        self.scheduler = Scheduler(schedule_path or ':memory:')
+        self.feed = MessageFeed()
+        self.avatar_budget = AvatarBudget()
+        self._avatar = None  # (content hash, Discord avatar key) of the last avatar set
+        self.loop = None
+        self.last_restart_latency = None
         self._is_running = False
+        self._ready_future = None
+        self._loop_thread = None
+        self._gateway_task = None
+        self._resume_state = None
+        self._token = None
+        self._monitor_task = None
+        self._shards_pending = set()
+        self._reconnect = None  # Future of the token to log in with, set by reconnect()
+        self.bot.add_listener(self._on_ready, 'on_ready')
+        self.bot.add_listener(self._on_ready, 'on_resumed')
+        self.bot.add_listener(self._on_shard_reconnected, 'on_shard_ready')
+        self.bot.add_listener(self._on_shard_reconnected, 'on_shard_resumed')
+        self.bot.add_listener(self._on_channel_delete, 'on_guild_channel_delete')
+        self.bot.add_listener(self._on_channel_delete, 'on_private_channel_delete')
+        self.bot.add_listener(self._on_message, 'on_message')
+        self.bot.add_listener(self._on_raw_message_delete, 'on_raw_message_delete')
+        self.bot.add_listener(self._on_raw_message_delete, 'on_raw_bulk_message_delete')
+        if profiler.enabled:
+            profiler.attach(self)
         
+    @_instrumented
     async def send_message(self, channel_id, message):
+        """
+        Send a message, split into several when over Discord's length limit
+        :param channel_id: ID of the channel to send the message to
+        :param message: Message to send, code blocks and markdown are kept intact across the split
+        :return: True if every part was sent, False otherwise
+        """
         try:
-            channel = self.bot.get_channel(int(channel_id))
-            if channel:
-                await channel.send(message)
+            channel = await self.channels.resolve(channel_id)
+            parts = split_message(message)
+            if channel and parts:
+                for part in parts:
+                    sent = await channel.send(part)
+                    self.message_index.add(channel.id, sent.id)
                 return True
             return False
         except Exception as e:
             print(f"Error sending message: {e}")
             return False
             
-    async def send_image(self, channel_id, image_path, message=None):
+    async def queue_message(self, channel_id, message):
+        """
+        Send a message through the outbound dispatcher, merged with the other
+        small messages queued for the same channel within the linger window
+        :return: True if sent, False otherwise
+        :raises asyncio.QueueFull: if too many operations are already waiting
         """
-        Send an image to a channel with an optional message
+        return await self.coalescer.send(str(channel_id), message)
+        
+    async def _dispatch_message(self, channel_id, message):
+        return await self.dispatcher.submit(lambda: self.send_message(channel_id, message), ('send', channel_id))
+            
+    @_instrumented
+    async def send_image(self, channel_id, image_path, message=None, reuse_upload=True):
+        """
+        Send an image to a channel with an optional message.
+        The file is read, and shrunk when over the upload limit, in a worker thread.
         :param channel_id: ID of the channel to send the image to
         :param image_path: Path to the image file
         :param message: Optional message to send with the image
+        :param reuse_upload: Send the CDN URL of an earlier upload of the same image instead of uploading it again
         :return: True if successful, False otherwise
         """
         try:
-            channel = self.bot.get_channel(int(channel_id))
+            channel = await self.channels.resolve(channel_id)
             if channel:
-                with open(image_path, 'rb') as image:
-                    file = discord.File(image)
-                    await channel.send(content=message, file=file)
+                image = await self.images.prepare(image_path, _upload_limit(channel), reuse_upload)
+                await self._send_prepared_image(channel, image, message)
                 return True
             return False
         except Exception as e:
             print(f"Error sending image: {e}")
             return False
-    
+            
+    @_instrumented
+    async def send_images(self, channel_id, image_paths, message=None):
+        """
+        Send several images in as few messages as Discord's attachment count
+        and upload size limits allow; the files are streamed from disk
+        :param channel_id: ID of the channel to send the images to
+        :param image_paths: Paths to the image files
+        :param message: Optional message, sent with the first images
+        :return: True if every image was sent, False otherwise
+        """
+        try:
+            channel = await self.channels.resolve(channel_id)
+            if not channel or not image_paths:
+                return False
+            max_size = _upload_limit(channel)
+            # Sizes are known, and oversized images shrunk, before anything is uploaded
+            images = await asyncio.gather(*(self.images.prepare(path, max_size, reuse=False) for path in image_paths))
+            await self._send_prepared_images(channel, images, message, max_size)
+            return True
+        except Exception as e:
+            print(f"Error sending images: {e}")
+            return False
+            
+    async def _send_prepared_images(self, channel, images, message, max_size):
+        """
+        Upload PreparedImages in as few messages as the limits allow
+        :param channel: Channel to send the images to
+        :param images: PreparedImages from the image pipeline, all under max_size
+        :param message: Optional message, sent with the first images
+        :param max_size: Upload limit in bytes of one message
+        """
+        for number, group in enumerate(pack_attachments([image.size for image in images], max_size)):
+            sent = await channel.send(content=message if number == 0 else None,
+                                      files=[images[index].to_file() for index in group])
+            self.message_index.add(channel.id, sent.id)
+            for position, index in enumerate(group):
+                self.images.remember(images[index].digest, sent, position)
+                
+
+    async def _send_prepared_image(self, channel, image, message=None):
+        """
+        Send a PreparedImage, by reference when it carries a CDN URL
+        :param channel: Channel to send the image to
+        :param image: PreparedImage from the image pipeline
+        :param message: Optional message to send with the image
+        """
+        if image.url:
+            sent = await channel.send(f"{message}\n{image.url}" if message else image.url)
+        else:
+            sent = await channel.send(content=message, file=image.to_file())
+            self.images.remember(image.digest, sent)
+        self.message_index.add(channel.id, sent.id)
+        
+    @_instrumented
+    async def broadcast_message(self, channel_ids, message, max_concurrency=BROADCAST_CONCURRENCY):
+        """
+        Send the same message to several channels concurrently
+        :param channel_ids: IDs of the channels to send the message to
+        :param message: Message to send
+        :param max_concurrency: Maximum number of sends in flight at once
+        :return: dict mapping each channel ID to True if successful, False otherwise
+        """
+        return await self._broadcast(
+            channel_ids,
+            lambda channel_id: self.send_message(channel_id, message),
+            max_concurrency
+        )
+        
+    @_instrumented
+    async def broadcast_image(self, channel_ids, image_path, message=None, max_concurrency=BROADCAST_CONCURRENCY,
+                              reuse_upload=True):
+        """
+        Send the same image to several channels concurrently, reading the file only once
+        :param channel_ids: IDs of the channels to send the image to
+        :param image_path: Path to the image file
+        :param message: Optional message to send with the image
+        :param max_concurrency: Maximum number of sends in flight at once
+        :param reuse_upload: Upload the image once, then send its CDN URL to the other channels
+        :return: dict mapping each channel ID to True if successful, False otherwise
+        """
+        channel_ids = list(dict.fromkeys(str(channel_id).strip() for channel_id in channel_ids))
+        try:
+            max_size = await self._broadcast_upload_limit(channel_ids)
+            # Read once, every upload sends the same bytes
+            image = await self.images.prepare(image_path, max_size, reuse_upload, stream=False)
+        except Exception as e:
+            print(f"Error reading image: {e}")
+            return {channel_id: False for channel_id in channel_ids}
+            
+        async def send(channel_id):
+            try:
+                channel = await self.channels.resolve(channel_id)
+                if channel:
+                    await self._send_prepared_image(channel, image, message)
+                    return True
+                return False
+            except Exception as e:
+                print(f"Error sending image: {e}")
+                return False
+                
+        results = {}
+        if reuse_upload and not image.url:
+            # Upload to channels one by one until an upload succeeds, then
+            # send the resulting CDN URL to all the others
+            while channel_ids and not image.url:
+                channel_id = channel_ids.pop(0)
+                results[channel_id] = await send(channel_id)
+                url = self.images.cached_url(image.digest)
+                if url:
+                    image = PreparedImage(image.digest, image.filename, url=url)
+                    
+        results.update(await self._broadcast(channel_ids, send, max_concurrency))
+        return results
+        
+    @_instrumented
+    async def broadcast_images(self, channel_ids, image_paths, message=None, max_concurrency=BROADCAST_CONCURRENCY):
+        """
+        Send the same images to several channels concurrently, see send_images().
+        Each file is read and hashed once, under the smallest upload limit of the channels.
+        :return: dict mapping each channel ID to True if successful, False otherwise
+        """
+        channel_ids = list(dict.fromkeys(str(channel_id).strip() for channel_id in channel_ids))
+        try:
+            if not image_paths:
+                raise ValueError("no images")
+            max_size = await self._broadcast_upload_limit(channel_ids)
+            images = await asyncio.gather(
+                *(self.images.prepare(path, max_size, reuse=False, stream=False) for path in image_paths)
+            )
+        except Exception as e:
+            print(f"Error reading images: {e}")
+            return {channel_id: False for channel_id in channel_ids}
+            
+        async def send(channel_id):
+            try:
+                channel = await self.channels.resolve(channel_id)
+                if channel:
+                    await self._send_prepared_images(channel, images, message, max_size)
+                    return True
+                return False
+            except Exception as e:
+                print(f"Error sending images: {e}")
+                return False
+                
+        return await self._broadcast(channel_ids, send, max_concurrency)
+        
+    async def _broadcast_upload_limit(self, channel_ids):
+        """:return: Smallest upload limit of the channels, so one prepared image fits them all"""
+        channels = await asyncio.gather(
+            *(self.channels.resolve(channel_id) for channel_id in channel_ids), return_exceptions=True
+        )
+        return min([_upload_limit(channel) for channel in channels
+                    if channel and not isinstance(channel, Exception)] or [DEFAULT_UPLOAD_LIMIT])
+        
+    async def _broadcast(self, channel_ids, send, max_concurrency):
+        """
+        Run a send coroutine for each channel, at most max_concurrency at a time.
+        discord.py keys rate-limit buckets by channel, so sends to different
+        channels proceed in parallel while each channel is paced on its own.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        
+        async def send_one(channel_id):
+            async with semaphore:
+                return await send(channel_id)
+                
+        # Keep the first occurrence of each channel, in order
+        channel_ids = list(dict.fromkeys(str(channel_id).strip() for channel_id in channel_ids))
+        results = await asyncio.gather(*(send_one(channel_id) for channel_id in channel_ids))
+        return dict(zip(channel_ids, results))
+        
     def is_running(self):
         return self._is_running
+        
+    def status(self):
+        """
+        Snapshot of the bot's state
+        :return: dict with running, ready, user, guilds, latency_ms, queue_depth, profile and shards
+        """
+        ready = self._is_running and self.bot.is_ready()
+        return {
+            'running': self._is_running,
+            'ready': ready,
+            'user': str(self.bot.user) if self.bot.user else None,
+            'guilds': len(self.bot.guilds),
+            'latency_ms': _latency_ms(self.bot.latency) if ready else None,
+            'queue_depth': self.queue_depth(),
+            'profile': self.profile,
+            'last_restart_s': self.last_restart_latency,
+            'shards': self.shard_status(),
+        }
+        
+    def shard_status(self):
+        """
+        State of each gateway connection run by this process
+        :return: list of dicts with id, connected, latency_ms and guilds; a single entry when not sharded
+        """
+        guilds = collections.Counter(guild.shard_id for guild in self.bot.guilds)
+        if self.sharded:
+            shards = [(shard.id, not shard.is_closed(), shard.latency) for shard in self.bot.shards.values()]
+        else:
+            ws = self.bot.ws
+            shards = [(self.bot.shard_id or 0, ws is not None and ws.open, self.bot.latency)]
+        return [
+            {
+                'id': shard_id,
+                'connected': self._is_running and connected,
+                'latency_ms': _latency_ms(latency) if connected else None,
+                'guilds': guilds[shard_id],
+            }
+            for shard_id, connected, latency in sorted(shards)
+        ]
+        
+    def gauges(self):
+        """Current values exported next to the metrics"""
+        return {
+            'running': int(self._is_running),
+            'ready': int(self._is_running and self.bot.is_ready()),
+            'guilds': len(self.bot.guilds),
+            'queue_depth': self.queue_depth(),
+            'shards': len(self.bot.shards) if self.sharded else 1,
+        }
+        
+    def start_loop(self):
+        """
+        Start the long-lived event loop thread the bot runs on, if not already running
+        :return: The bot's event loop
+        """
+        if self._loop_thread and self._loop_thread.is_alive():
+            return self.loop
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, name='zxbot-loop', daemon=True)
+        self._loop_thread.start()
+        return self.loop
+        
+    def start(self, token):
+        """
+        Start the bot on its loop thread, can be called from any thread
+        :param token: Bot token
+        :return: concurrent.futures.Future resolved with True once the bot is ready or resumed, False if it fails to start
+        """
+        self.start_loop()
+        ready = concurrent.futures.Future()
+        self.run_threadsafe(self.start_bot(token, ready))
+        return ready
+        
+    def run_threadsafe(self, coro):
+        """
+        Run a coroutine on the bot's event loop from another thread
+        :return: concurrent.futures.Future resolved with the coroutine's result
+        :raises RuntimeError: if the bot loop is not running
+        """
+        if self.loop is None or self.loop.is_closed():
+            coro.close()
+            raise RuntimeError("Bot loop is not running")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+        
+    def enqueue(self, factory, route=None, priority=PRIORITY_NORMAL, coalesce_key=None):
+        """
+        Queue an operation on the outbound dispatcher, can be called from any thread
+        :param factory: Callable returning the coroutine to run, e.g. lambda: bot.send_message(...)
+        :param route: Route key used for rate-limit pacing, e.g. ('send', channel_id)
+        :param priority: PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW from dispatcher
+        :param coalesce_key: Pending operations with the same key are replaced by the latest one
+        :return: concurrent.futures.Future resolved with the operation's result
+        :raises asyncio.QueueFull: if too many operations are already waiting
+        """
+        return self.dispatcher.submit_threadsafe(factory, route, priority, coalesce_key)
+        
+    def queue_depth(self):
+        """Number of outbound operations waiting to be sent"""
+        return self.dispatcher.queue_depth
     
-    async def start_bot(self, token):
+    async def start_bot(self, token, ready=None):
+        """
+        Connect the bot and run it until it is stopped.
+        The same client can be started again after a stop; the login and HTTP
+        connection pool are kept after stop_bot(keep_session=True), and the
+        gateway session is resumed instead of identifying again.
+        :param token: Bot token
+        :param ready: Optional concurrent.futures.Future, resolved with True once the bot is ready or False if it fails to start
+        """
+        self._ready_future = ready
         try:
             self._is_running = True
-            await self.bot.start(token)
+            self.loop = asyncio.get_running_loop()
+            self.dispatcher.start()
+            if self._monitor_task is None or self._monitor_task.done():
+                self._monitor_task = asyncio.ensure_future(self.metrics.monitor(
+                    self.bot, snapshot_path=self.metrics_path, gauges=self.gauges
+                ))
+            while True:
+                if self.bot.is_closed():
+                    # A closed client can be started again once its state is cleared;
+                    # close() also drops the loop, which login() does not restore
+                    self.bot.clear()
+                    self.bot.loop = self.loop
+                if self._token != token:
+                    self._resume_state = None
+                    await self.bot.login(token)
+                    self._token = token
+                self._gateway_task = asyncio.ensure_future(self._connect())
+                try:
+                    await self._gateway_task
+                except asyncio.CancelledError:
+                    if not (self._gateway_task and self._gateway_task.cancelled()):
+                        raise
+                    # Suspended by stop_bot(keep_session=True), or closed by reconnect()
+                if self._reconnect is None:
+                    break
+                # reconnect() hands over the token once the old session is closed
+                token = await self._reconnect
+                self._reconnect = None
+                if not self._is_running:
+                    break  # Stopped while reconnecting
         except Exception as e:
             print(f"Error starting bot: {e}")
+        finally:
             self._is_running = False
+            self._gateway_task = None
+            self.scheduler.stop()
+            if ready and not ready.done():
+                ready.set_result(False)
+                
+    async def _connect(self):
+        """
+        Run the gateway connection, first trying to RESUME a recently suspended session
+        """
+        state, self._resume_state = self._resume_state, None
+        while state and time.monotonic() - state['suspended_at'] < RESUME_WINDOW:
+            try:
+                self.bot.ws = await asyncio.wait_for(DiscordWebSocket.from_client(
+                    self.bot,
+                    initial=False,
+                    gateway=state['gateway'],
+                    shard_id=self.bot.shard_id,
+                    session=state['session'],
+                    sequence=state['sequence'],
+                    resume=True,
+                ), timeout=60.0)
+                while True:
+                    await self.bot.ws.poll_event()
+            except ReconnectWebSocket as e:
+                if not e.resume:
+                    break
+                ws = self.bot.ws
+                state = {
+                    'session': ws.session_id,
+                    'sequence': ws.sequence,
+                    'gateway': ws.gateway,
+                    'suspended_at': time.monotonic(),
+                }
+            except (discord.ConnectionClosed, discord.HTTPException, OSError,
+                    aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Gateway resume failed: {e!r}")
+                break
+        if self.bot.is_closed():
+            return
+        # Session refused or connection lost: discord.py's own connect loop
+        # takes over from a fresh IDENTIFY
+        await self.bot.connect()
+        
+    async def _on_ready(self):
+        if self._shards_pending:
+            # A sharded restart is done once every shard is back
+            return
+        self.scheduler.start(self._run_scheduled)
+        if self._ready_future and not self._ready_future.done():
+            self._ready_future.set_result(True)
+            
+    async def _on_shard_reconnected(self, shard_id):
+        if shard_id in self._shards_pending:
+            self._shards_pending.discard(shard_id)
+            if not self._shards_pending:
+                await self._on_ready()
+            
+    def _run_scheduled(self, job):
+        asyncio.ensure_future(self._send_scheduled(job))
+        
+    async def _send_scheduled(self, job):
+        try:
+            if job.image_path:
+                await self.dispatcher.submit(lambda: self.send_image(job.channel_id, job.image_path, job.message),
+                                             ('send', str(job.channel_id)))
+            else:
+                await self.queue_message(job.channel_id, job.message)
+        except asyncio.QueueFull:
+            print(f"Error: scheduled job {job.id} skipped, the outbound queue is full")
+        except asyncio.CancelledError:
+            pass  # Bot stopped
+            
+    async def _on_channel_delete(self, channel):
+        self.channels.forget(channel.id)
+        
+    async def _on_raw_message_delete(self, payload):
+        # The deleted message's attachments are gone, their CDN URLs can no longer be reused
+        message_ids = getattr(payload, 'message_ids', None) or (payload.message_id,)
+        self.images.forget_messages(payload.channel_id, message_ids)
+
+    async def _on_message(self, message):
+        self.feed.push(message)
+        if message.author.bot or message.author == self.bot.user:
+            return
+        rule = self.responder.match(message.content)
+        if rule is None:
+            return
+        channel_id = message.channel.id
+        try:
+            reply = rule.format(message)
+        except Exception as e:
+            # One bad response must not break the listener for every other rule
+            self.metrics.count_autoresponse('invalid')
+            print(f"Error formatting auto-response to {rule.trigger!r}: {e}")
+            return
+        guild_id = message.guild.id if message.guild else None
+        suppressed = self.reply_cooldowns.check(message.author.id, channel_id, guild_id, reply)
+        if suppressed:
+            self.metrics.count_autoresponse(suppressed)
+            return
+        try:
+            await self.queue_message(channel_id, reply)
+        except asyncio.QueueFull:
+            self.metrics.count_autoresponse('queue_full')
+            print(f"Error: auto-response to message {message.id} dropped, the outbound queue is full")
+            return
+        except asyncio.CancelledError:
+            return  # Bot stopped
+        self.metrics.count_autoresponse('sent')
     
-    async def stop_bot(self):
+    @_instrumented
+    async def stop_bot(self, keep_session=False):
+        """
+        Stop the bot
+        :param keep_session: Only disconnect from the gateway, keeping the login, the HTTP connection
+                             pool and a resumable session for a quick start_bot (a sharded bot is
+                             always fully closed)
+        :return: True if successful, False otherwise
+        """
         try:
             self._is_running = False
-            await self.bot.close()
+            self.coalescer.cancel()
+            await self.dispatcher.stop()
+            ws = self.bot.ws
+            if keep_session and ws is not None and ws.session_id and self._gateway_task:
+                self._resume_state = {
+                    'session': ws.session_id,
+                    'sequence': ws.sequence,
+                    'gateway': ws.gateway,
+                    'suspended_at': time.monotonic(),
+                }
+                self._gateway_task.cancel()
+                # Close codes other than 1000/1001 leave the session resumable
+                await ws.close(code=4000)
+            else:
+                await self._close_client()
+            return True
         except Exception as e:
             print(f"Error stopping bot: {e}")
+            return False
             
+    async def _close_client(self):
+        self._resume_state = None
+        self.channels.clear()
+        if self._gateway_task:
+            self._gateway_task.cancel()
+        if self._token is None:
+            # Never logged in: only the HTTP session may be open, and a closed
+            # client that never logged in cannot be cleared for a new start
+            await self.bot.http.close()
+        else:
+            await self.bot.close()
+        # discord.py closes the connector along with the HTTP session but would
+        # hand it to the next session; let the next login create a new pool
+        self.bot.http.connector = discord.utils.MISSING
+        self._token = None
+        
+    @_instrumented
+    async def restart(self, token=None):
+        """
+        Reconnect to the gateway, resuming the session when Discord allows it.
+        A token other than the current one cannot be resumed: the bot logs in
+        with it and identifies again, see reconnect().
+        :param token: Bot token, defaults to the one the bot was started with
+        :return: Seconds until the bot was ready or resumed, or None if it failed or timed out
+        """
+        if self._is_running and token and self._token and token != self._token:
+            return await self.reconnect(token)
+        token = token or self._token
+        started = time.perf_counter()
+        ready = concurrent.futures.Future()
+        ws = self.bot.ws
+        shards = [shard for shard in self.bot.shards.values() if not shard.is_closed()] if self.sharded else []
+        if self._is_running and ws is not None and ws.open:
+            self._ready_future = ready
+            # discord.py reconnects with RESUME after a resumable close code
+            await ws.close(code=4000)
+        elif self._is_running and shards:
+            self._ready_future = ready
+            self._shards_pending = {shard.id for shard in shards}
+            # Same as above for each shard; ShardInfo only offers a full
+            # disconnect, which would throw the sessions away
+            for shard in shards:
+                await shard._parent.ws.close(code=4000)
+        elif token:
+            asyncio.ensure_future(self.start_bot(token, ready))
+        else:
+            return None
+        try:
+            if not await asyncio.wait_for(asyncio.wrap_future(ready), RESTART_TIMEOUT):
+                return None
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._shards_pending = set()
+        self.last_restart_latency = time.perf_counter() - started
+        return self.last_restart_latency
+            
+    @_instrumented
+    async def reconnect(self, token=None, profile=None):
+        """
+        Close the gateway session and identify again, for the changes a resume
+        cannot carry: a new token or intents profile. The HTTP pool is renewed
+        along with the login; the dispatcher, scheduler and caches of the bot
+        itself are kept.
+        :param token: Bot token, defaults to the current one
+        :param profile: Intents and caches profile, one of PROFILES, defaults to the current one
+        :return: Seconds until the bot was ready again, or None if it failed or timed out
+        """
+        if profile is not None and profile != self.profile:
+            self._set_profile(profile)
+        token = token or self._token
+        if not self._is_running or self._reconnect is not None or not token:
+            return None
+        started = time.perf_counter()
+        ready = concurrent.futures.Future()
+        self._reconnect = self.loop.create_future()
+        try:
+            await self._close_client()
+        finally:
+            self._ready_future = ready
+            self._reconnect.set_result(token)
+        try:
+            if not await asyncio.wait_for(asyncio.wrap_future(ready), RESTART_TIMEOUT):
+                return None
+        except asyncio.TimeoutError:
+            return None
+        self.last_restart_latency = time.perf_counter() - started
+        return self.last_restart_latency
+        
+    def _set_profile(self, profile):
+        """Switch the intents and caches profile, used from the next IDENTIFY on"""
+        options = bot_options(profile)
+        state = self.bot._connection
+        # The options commands.Bot hands to its ConnectionState, which has no public setter for them
+        state._intents = options['intents']
+        state.member_cache_flags = options['member_cache_flags']
+        state._chunk_guilds = options['chunk_guilds_at_startup']
+        state.max_messages = options['max_messages']
+        if options['intents'].members and not options['member_cache_flags']._empty:
+            state.__dict__.pop('store_user', None)
+        else:
+            state.store_user = state.store_user_no_intents
+        self.profile = profile
+        
+    def apply_settings(self, changes):
+        """
+        Apply settings from settings.SettingsWatcher, on the bot's loop while it
+        runs. Rates, cooldowns and the presence change in place; a new token or
+        intents profile reconnects the gateway.
+        :param changes: {setting name: value}, settings the bot has no use for are ignored
+        """
+        if 'route_rates' in changes:
+            self.dispatcher.set_route_rates(changes['route_rates'])
+        if 'autoresponse_cooldowns' in changes or 'autoresponse_dedup_window' in changes:
+            current = self.reply_cooldowns
+            limits = {scope: (cooldown.rate, cooldown.per) for scope, cooldown in current.cooldowns.items()}
+            current.configure(changes.get('autoresponse_cooldowns', limits),
+                              changes.get('autoresponse_dedup_window', current.dedup_window))
+        if 'message_linger' in changes:
+            self.coalescer.linger = changes['message_linger']
+        if 'autoresponses_path' in changes:
+            self.responder.path = changes['autoresponses_path']
+            try:
+                self.responder.load()
+            except (OSError, ValueError) as e:
+                print(f"Error reloading auto-responses: {e}")
+        if changes.get('presence'):
+            status, activity = changes['presence']['status'], changes['presence']['activity']
+            # Also sent with the next IDENTIFY
+            self.bot.status = discord.Status[status]
+            self.bot.activity = discord.Game(name=activity) if activity else None
+            if self._is_running:
+                try:
+                    future = self.dispatcher.submit(lambda: self.change_presence(status, activity), 'presence',
+                                                    PRIORITY_HIGH, 'presence')
+                    future.add_done_callback(_report_presence_error)
+                except asyncio.QueueFull:
+                    print("Error: presence not updated, the outbound queue is full")
+        if 'token' in changes or 'intents_profile' in changes:
+            profile = changes.get('intents_profile')
+            if self._is_running:
+                asyncio.ensure_future(self.reconnect(changes.get('token'), profile))
+            elif profile and profile != self.profile:
+                self._set_profile(profile)
+                
+    @_instrumented
     async def force_stop_bot(self):
         """
         Force stop the bot by setting internal state and closing connection
@@ -62,32 +861,94 @@ class DiscordBot:
         """
         try:
             self._is_running = False
-            self.bot.clear()  # Clear all internal state
-            await self.bot.close()
+            self.coalescer.cancel()
+            await self.dispatcher.stop()
+            await self._close_client()
             return True
         except Exception as e:
             print(f"Error force stopping bot: {e}")
             self._is_running = False  # Ensure bot is marked as stopped even if error occurs
             return False
             
-    async def change_avatar(self, image_path):
+    @_instrumented
+    async def change_avatar(self, image_path, max_wait=MAX_AVATAR_WAIT):
         """
-        Change the bot's avatar
+        Change the bot's avatar. The image is cropped square, scaled down and
+        encoded off the loop; the same image as the current avatar is not sent
+        again, and a change over the local avatar budget waits up to max_wait
+        seconds for it or is refused without calling Discord. A rate limit
+        Discord applies anyway is waited out for MAX_RATELIMIT_WAIT seconds at most.
         :param image_path: Path to the new avatar image
-        :return: True if successful, False otherwise
+        :param max_wait: Longest wait for the avatar budget in seconds
+        :return: {'ok': bool, 'outcome': CHANGED | UNCHANGED | RATE_LIMITED | FAILED,
+                  'retry_after': seconds before another change is possible, None if one is}
         """
+        def outcome(ok, name, retry_after=None):
+            return {'ok': ok, 'outcome': name, 'retry_after': retry_after}
+            
         try:
-            with open(image_path, 'rb') as image:
-                avatar = image.read()
-                await self.bot.user.edit(avatar=avatar)
-                return True
+            avatar, digest = await self.images.prepare_avatar(image_path)
+        except Exception as e:
+            print(f"Error preparing avatar: {e}")
+            return outcome(False, FAILED)
+        try:
+            current = self.bot.user.avatar
+        except AttributeError:
+            # Started, but not logged in yet
+            print("Error changing avatar: the bot is not logged in yet")
+            return outcome(False, FAILED)
+        if self._avatar == (digest, current.key if current else None):
+            return outcome(True, UNCHANGED)
+            
+        slot, delay = self.avatar_budget.reserve(max_wait)
+        if slot is None:
+            return outcome(False, RATE_LIMITED, round(delay, 1))
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            await asyncio.wait_for(self.bot.user.edit(avatar=avatar), MAX_RATELIMIT_WAIT)
+        except asyncio.TimeoutError:
+            # discord.py is waiting out a rate limit: Discord refused the change,
+            # or accepted it and emptied the route's bucket for longer than that
+            self.avatar_budget.exhaust()
+            try:
+                user = await self.bot.fetch_user(self.bot.user.id)
+            except discord.HTTPException as e:
+                print(f"Error checking the avatar after a rate limit: {e}")
+                user = None
+            key = user.avatar.key if user is not None and user.avatar else None
+            # Neither the avatar the bot started from nor one it set before
+            known = {current.key if current else None, self._avatar[1] if self._avatar else None}
+            if user is not None and key not in known:
+                self._avatar = (digest, key)
+                return outcome(True, CHANGED, round(self.avatar_budget.retry_after(), 1))
+            print(f"Avatar change refused by Discord, budget exhausted: still rate limited after {MAX_RATELIMIT_WAIT}s")
+            return outcome(False, RATE_LIMITED, round(self.avatar_budget.retry_after(), 1))
+        except (discord.RateLimited, discord.HTTPException) as e:
+            if isinstance(e, discord.RateLimited) or e.status == 429 or 'too fast' in str(e).lower():
+                retry_after = getattr(e, 'retry_after', None)
+                self.avatar_budget.exhaust(retry_after)
+                print(f"Avatar change refused by Discord, budget exhausted: {e}")
+                return outcome(False, RATE_LIMITED, round(self.avatar_budget.retry_after(), 1))
+            self.avatar_budget.release(slot)
+            print(f"Error changing avatar: {e}")
+            return outcome(False, FAILED)
+        except asyncio.CancelledError:
+            # Cancelled while waiting for the budget
+            self.avatar_budget.release(slot)
+            raise
         except Exception as e:
+            self.avatar_budget.release(slot)
             print(f"Error changing avatar: {e}")
-            return False
+            return outcome(False, FAILED)
+        current = self.bot.user.avatar
+        self._avatar = (digest, current.key if current else None)
+        return outcome(True, CHANGED)
             
+    @_instrumented
     async def change_presence(self, status_type, activity_text):
         """
-        Change the bot's status and activity
+        Change the bot's status and activity, on every shard when sharded
         :param status_type: online, idle, dnd, invisible
         :param activity_text: Text to display as activity
         :return: True if successful, False otherwise
@@ -101,24 +962,178 @@ class DiscordBot:
             print(f"Error changing presence: {e}")
             return False
             
-    async def delete_bot_messages(self, channel_id, limit=100):
+    @_instrumented
+    async def delete_bot_messages(self, channel_id, limit=100, bulk=True, message_filter=None, progress=None,
+                                  cancel=None, resume=True):
         """
-        Delete messages sent by the bot in a specific channel
+        Delete messages sent by the bot in a specific channel, a page of up to
+        100 messages at a time.
+        Messages recorded in the message index are deleted directly; the channel
+        history is only scanned for messages sent before the index existed, or
+        for filters the index cannot answer (content, attachments, other authors).
+        The history scan saves a cursor after each page, so a cleanup that was
+        cancelled, stopped at its limit or interrupted continues from there.
         :param channel_id: ID of the channel to delete messages from
-        :param limit: Maximum number of messages to check (default: 100)
-        :return: Number of messages deleted
+        :param limit: Maximum number of messages to delete from the index, then to check in the history
+                      (default: 100), None for no limit
+        :param bulk: Use the bulk-delete endpoint for recent messages (default: True)
+        :param message_filter: cleanup.CleanupFilter of the messages to delete, every bot message if None
+        :param progress: Called on the bot's loop with a copy of the result after each page
+        :param cancel: threading.Event; once set, the cleanup stops after the current page
+        :param resume: Continue from the cursor saved by a previous cleanup with the same filter; without
+                       a filter, the scan of the history older than the index always continues
+        :return: dict with the number of messages deleted in 'bulk', one by one in 'single', and the 'total',
+                 the messages Discord refused to delete ('failed'), the history messages 'scanned', and whether the cleanup is 'done' or was 'cancelled'
         """
+        message_filter = message_filter or CleanupFilter()
+        result = {'bulk': 0, 'single': 0, 'total': 0, 'failed': 0, 'scanned': 0, 'done': False,
+                  'cancelled': False}
+        
+        def page_done():
+            if progress:
+                progress(dict(result))
+            if cancel is not None and cancel.is_set() and not result['done']:
+                result['cancelled'] = True
+            return result['cancelled']
+            
         try:
-            channel = self.bot.get_channel(int(channel_id))
+            channel = await self.channels.resolve(channel_id)
             if not channel:
-                return 0
+                return result
                 
-            deleted_count = 0
-            async for message in channel.history(limit=limit):
-                if message.author == self.bot.user:
-                    await message.delete()
-                    deleted_count += 1
-            return deleted_count
+            after, before = message_filter.bounds()
+            remaining = limit
+            while message_filter.by_id and (remaining is None or remaining > 0):
+                size = BULK_DELETE_MAX if remaining is None else min(BULK_DELETE_MAX, remaining)
+                indexed_ids = self.message_index.get(channel.id, size, after, before)
+                if remaining is not None:
+                    remaining -= len(indexed_ids)
+                if not indexed_ids:
+                    break
+                await self._delete_message_ids(channel, indexed_ids, result, bulk)
+                # Deleted, already gone or refused: either way no longer ours to track
+                self.message_index.remove(channel.id, indexed_ids)
+                if page_done():
+                    return result
+                if len(indexed_ids) < size:
+                    break
+                    
+            if remaining is None or remaining > 0:
+                await self._scan_history(channel, message_filter, remaining, result, bulk, page_done, resume)
+            return result
         except Exception as e:
             print(f"Error deleting messages: {e}")
-            return 0
\ No newline at end of file
+            return result
+            
+    async def _scan_history(self, channel, message_filter, limit, result, bulk, page_done, resume):
+        """
+        Delete the messages of the channel history that match a filter, from
+        the newest to the oldest, saving the cursor after each page
+        :param channel: Channel to scan
+        :param message_filter: CleanupFilter
+        :param limit: Maximum number of history messages to check, None for no limit
+        :param result: Counters dict updated in place
+        :param bulk: Allow the bulk-delete endpoint
+        :param page_done: Called after each page, returns True to stop
+        :param resume: Start from the saved cursor of the same filter
+        """
+        after, before = message_filter.bounds()
+        scan_before, exhausted = self.message_index.scan_state(channel.id)
+        if message_filter.by_id:
+            # Newer messages of the bot are all in the index
+            if exhausted:
+                result['done'] = True
+                return
+            start = min(filter(None, (scan_before, before)), default=None)
+        else:
+            start = before
+        key = message_filter.key()
+        if not message_filter.is_default:
+            cursor = self.message_index.cleanup_cursor(channel.id, key) if resume else None
+            start = min(filter(None, (cursor, start)), default=None)
+            
+        def save(cursor, exhausted):
+            if message_filter.is_default:
+                self.message_index.set_scan_state(channel.id, cursor, exhausted)
+            else:
+                self.message_index.set_cleanup_cursor(channel.id, key, None if exhausted else cursor)
+                
+        message_ids = []
+        scanned = 0
+        oldest = start
+        history = channel.history(
+            limit=limit,
+            before=discord.Object(id=start) if start else None,
+            after=discord.Object(id=after) if after else None,
+            oldest_first=False,
+        )
+        async for message in history:
+            scanned += 1
+            result['scanned'] += 1
+            oldest = message.id
+            if message_filter.matches(message, self.bot.user):
+                message_ids.append(message.id)
+            if scanned % BULK_DELETE_MAX == 0:
+                await self._delete_message_ids(channel, message_ids, result, bulk)
+                self.message_index.remove(channel.id, message_ids)
+                message_ids = []
+                save(oldest, False)
+                if page_done():
+                    return
+        await self._delete_message_ids(channel, message_ids, result, bulk)
+        self.message_index.remove(channel.id, message_ids)
+        # Stopped by the limit or by the end of the history (or the after bound)
+        result['done'] = limit is None or scanned < limit
+        save(oldest, result['done'])
+        page_done()
+        
+    async def _delete_message_ids(self, channel, message_ids, result, bulk=True):
+        """
+        Delete the given message IDs, in batches through the bulk-delete endpoint
+        when possible and one by one otherwise
+        :param channel: Channel the messages belong to
+        :param message_ids: IDs of the messages to delete
+        :param result: Counters dict updated in place ('bulk', 'single', 'total', 'failed')
+        :param bulk: Allow the bulk-delete endpoint
+        """
+        gone = []
+        recent, old = [], []
+        if bulk and hasattr(channel, 'delete_messages'):
+            cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE + BULK_DELETE_MARGIN
+            min_id = discord.utils.time_snowflake(cutoff)
+            for message_id in message_ids:
+                (recent if message_id > min_id else old).append(message_id)
+        else:
+            old = list(message_ids)
+            
+        for i in range(0, len(recent), BULK_DELETE_MAX):
+            batch = recent[i:i + BULK_DELETE_MAX]
+            if len(batch) < 2:
+                # The bulk endpoint needs at least two messages
+                old.extend(batch)
+                continue
+            try:
+                await channel.delete_messages([discord.Object(id=message_id) for message_id in batch])
+                result['bulk'] += len(batch)
+                result['total'] += len(batch)
+                gone.extend(batch)
+            except discord.HTTPException as e:
+                print(f"Error bulk deleting messages, falling back to single deletes: {e}")
+                old.extend(batch)
+                
+        # Single deletes go one at a time so the HTTP client can pace them
+        # against the route's rate-limit bucket instead of triggering 429s
+        for message_id in old:
+            try:
+                await self.bot.http.delete_message(channel.id, message_id)
+                result['single'] += 1
+                result['total'] += 1
+                gone.append(message_id)
+            except discord.NotFound:
+                gone.append(message_id)
+            except (discord.HTTPException, discord.RateLimited) as e:
+                # One message the bot may not delete must not end the cleanup
+                result['failed'] += 1
+                print(f"Error deleting message {message_id}: {e}")
+        # Uploads in these messages are gone, their URLs must not be sent again
+        self.images.forget_messages(channel.id, gone)
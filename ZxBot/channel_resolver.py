@@ -0,0 +1,95 @@
+import asyncio
+import collections
+import time
+
+import discord
+
+# How long a fetched channel is trusted before it is fetched again
+DEFAULT_TTL = 300
+# How long an unknown or forbidden channel ID is remembered
+DEFAULT_NEGATIVE_TTL = 60
+
+
+class ChannelResolver:
+    """
+    Turns channel IDs into channel objects. The gateway cache is tried first,
+    then a bounded LRU of channels fetched over REST, and only then the API.
+    IDs the API answers with Unknown Channel or Missing Access are remembered
+    for a while so retrying a bad ID costs nothing, and concurrent lookups of
+    the same ID share a single request.
+    """
+    def __init__(self, bot, max_size=1024, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        """
+        :param bot: discord.Client used for the cache lookups and the fetches
+        :param max_size: Maximum number of fetched and of unknown channels kept, each
+        :param ttl: Seconds a fetched channel is reused
+        :param negative_ttl: Seconds an unknown or forbidden channel ID is remembered
+        """
+        self.bot = bot
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.fetches = 0
+        self._channels = collections.OrderedDict()  # channel_id -> (channel, expires_at)
+        self._missing = collections.OrderedDict()  # channel_id -> expires_at
+        self._pending = {}  # channel_id -> asyncio.Future shared by concurrent lookups
+
+    async def resolve(self, channel_id):
+        """
+        :param channel_id: Channel ID, as an int or a string
+        :return: The channel, or None if it does not exist or the bot cannot see it
+        :raises discord.HTTPException: on errors that say nothing about the channel (5xx, network)
+        """
+        channel_id = int(channel_id)
+        channel = self.bot.get_channel(channel_id)
+        if channel is not None:
+            return channel
+
+        now = time.monotonic()
+        entry = self._channels.get(channel_id)
+        if entry is not None:
+            channel, expires_at = entry
+            if expires_at > now:
+                self._channels.move_to_end(channel_id)
+                return channel
+            del self._channels[channel_id]
+        expires_at = self._missing.get(channel_id)
+        if expires_at is not None:
+            if expires_at > now:
+                return None
+            del self._missing[channel_id]
+
+        pending = self._pending.get(channel_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch(channel_id))
+            self._pending[channel_id] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(channel_id, None))
+        # Shielded so one caller being cancelled does not cancel the others' lookup
+        return await asyncio.shield(pending)
+
+    def forget(self, channel_id):
+        """Drop everything known about a channel, e.g. after it was deleted"""
+        channel_id = int(channel_id)
+        self._channels.pop(channel_id, None)
+        self._missing.pop(channel_id, None)
+
+    def clear(self):
+        self._channels.clear()
+        self._missing.clear()
+
+    async def _fetch(self, channel_id):
+        self.fetches += 1
+        try:
+            channel = await self.bot.fetch_channel(channel_id)
+        except (discord.NotFound, discord.Forbidden, discord.InvalidData):
+            _store(self._missing, channel_id, time.monotonic() + self.negative_ttl, self.max_size)
+            return None
+        _store(self._channels, channel_id, (channel, time.monotonic() + self.ttl), self.max_size)
+        return channel
+
+
+def _store(cache, key, value, max_size):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_size:
+        cache.popitem(last=False)
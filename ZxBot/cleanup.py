@@ -0,0 +1,97 @@
+"""
+Which messages a cleanup deletes. DiscordBot.delete_bot_messages pages
+through the message index and the channel history with these bounds, saving
+a cursor after each page so a cleanup that is cancelled or interrupted
+resumes where it stopped.
+"""
+import datetime
+import json
+import re
+
+import discord
+
+
+class CleanupFilter:
+    """
+    Messages a cleanup deletes: the bot's own by default, narrowed by age,
+    content and attachments
+    """
+    def __init__(self, after=None, before=None, pattern=None, attachments_only=False, author_ids=None):
+        """
+        :param after: Only messages sent after this datetime (naive datetimes are UTC)
+        :param before: Only messages sent before this datetime
+        :param pattern: Only messages whose content matches this regular expression
+        :param attachments_only: Only messages with attachments
+        :param author_ids: Only messages of these user IDs instead of the bot's own; deleting
+                           other users' messages needs the Manage Messages permission
+        :raises re.error: if pattern is not a valid regular expression
+        """
+        self.after = _utc(after)
+        self.before = _utc(before)
+        self.pattern = re.compile(pattern) if pattern else None
+        self.attachments_only = attachments_only
+        self.author_ids = frozenset(int(author_id) for author_id in author_ids) if author_ids else None
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        From API parameters, with after and before as ISO 8601 dates
+        :raises ValueError: if a date or the pattern is invalid
+        """
+        try:
+            return cls(
+                datetime.datetime.fromisoformat(data['after']) if data.get('after') else None,
+                datetime.datetime.fromisoformat(data['before']) if data.get('before') else None,
+                data.get('pattern'),
+                bool(data.get('attachments_only')),
+                data.get('author_ids'),
+            )
+        except re.error as e:
+            raise ValueError(f"invalid pattern: {e}") from e
+
+    @property
+    def is_default(self):
+        """Every message of the bot"""
+        return self.key() == _DEFAULT_KEY
+
+    @property
+    def by_id(self):
+        """Whether a message can be judged from its ID alone, as the message index only holds IDs"""
+        return self.pattern is None and not self.attachments_only and self.author_ids is None
+
+    def bounds(self):
+        """:return: (after, before) message ID bounds, exclusive, None where unbounded"""
+        after = discord.utils.time_snowflake(self.after, high=True) if self.after else None
+        before = discord.utils.time_snowflake(self.before, high=False) if self.before else None
+        return after, before
+
+    def matches(self, message, bot_user):
+        """Whether a discord.Message fetched from the history is to be deleted"""
+        if self.author_ids is None:
+            if message.author != bot_user:
+                return False
+        elif message.author.id not in self.author_ids:
+            return False
+        if self.attachments_only and not message.attachments:
+            return False
+        if self.pattern is not None and not self.pattern.search(message.content):
+            return False
+        return True
+
+    def key(self):
+        """Identifies the filter, so a saved cursor is only resumed by the same cleanup"""
+        return json.dumps([
+            self.bounds(),
+            self.pattern.pattern if self.pattern else None,
+            self.attachments_only,
+            sorted(self.author_ids) if self.author_ids is not None else None,
+        ])
+
+
+def _utc(moment):
+    if moment is not None and moment.tzinfo is None:
+        return moment.replace(tzinfo=datetime.timezone.utc)
+    return moment
+
+
+_DEFAULT_KEY = CleanupFilter().key()
@@ -0,0 +1,185 @@
+"""
+Turning text into Discord messages: long text is split into messages under
+the 2000 character limit without breaking code blocks or inline markdown,
+and small messages queued for the same channel are merged into one.
+"""
+import asyncio
+
+# Discord's limit on the content of a message
+MESSAGE_LIMIT = 2000
+# Seconds a small message waits for others to the same channel before it is sent
+DEFAULT_LINGER = 0.25
+# Put between merged messages
+SEPARATOR = '\n'
+
+_FENCE = '```'
+# Inline markdown that must not be split between two messages; bold before
+# italics so ** is not counted as two *
+_INLINE_MARKERS = ('`', '**', '__', '~~', '||')
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """
+    Split text into messages of at most limit characters. Splits are made,
+    in order of preference, at a blank line, at a line break, at a space
+    outside inline markdown, and only then anywhere. A code block cut in
+    two is closed at the end of one message and reopened, with its
+    language, at the start of the next. Apart from those added fences the
+    messages joined together give back the text exactly.
+    :return: List of messages, empty for an empty text
+    """
+    if len(text) <= limit:
+        return [text] if text else []
+    # Long lines are cut so a piece, a reopened fence and a closing one always fit
+    piece_limit = limit // 2
+    chunks = []
+    current = ''
+    fence = None  # Opening line of the code block the end of current is in
+    paragraph = 0  # End of the last blank line outside a code block in current
+
+    for line in text.splitlines(keepends=True):
+        pieces = [line] if len(line) <= piece_limit else _split_line(line, piece_limit, fence is not None)
+        for piece in pieces:
+            after = fence
+            if piece.count(_FENCE) % 2:
+                # The line opening a block, e.g. ```python, is repeated to reopen it
+                after = None if fence else piece[piece.rfind(_FENCE):].strip()
+            reserve = len(_FENCE) + 1 if after else 0
+            if len(current) + len(piece) + reserve > limit and current:
+                if paragraph >= limit // 2:
+                    # Prefer ending the message at a paragraph; the rest moves on with the new line
+                    chunks.append(current[:paragraph])
+                    current = current[paragraph:]
+                    paragraph = 0
+                if len(current) + len(piece) + reserve > limit:
+                    chunks.append(_close(current, fence))
+                    current = f'{fence}\n' if fence else ''
+                    paragraph = 0
+            current += piece
+            fence = after
+            if fence is None and not piece.strip():
+                paragraph = len(current)
+    if current:
+        chunks.append(_close(current, fence))
+    return chunks
+
+
+def _close(chunk, fence):
+    if fence is None:
+        return chunk
+    return chunk + _FENCE if chunk.endswith('\n') else f'{chunk}\n{_FENCE}'
+
+
+def _split_line(line, size, in_code):
+    """Cut a line longer than size into pieces at spaces, outside inline markdown when possible"""
+    pieces = []
+    while len(line) > size:
+        window = line[:size]
+        cut = 0
+        if not in_code:
+            cut = max((i + 1 for i, char in enumerate(window) if char == ' ' and _balanced(window[:i + 1])),
+                      default=0)
+        if not cut:
+            cut = window.rfind(' ') + 1
+        if not cut:
+            cut = size
+            # Never in the middle of a run of backticks
+            while cut > 1 and line[cut - 1] == '`' and line[cut] == '`':
+                cut -= 1
+        pieces.append(line[:cut])
+        line = line[cut:]
+    pieces.append(line)
+    return pieces
+
+
+def _balanced(text):
+    """Whether text closes every inline markdown span it opens"""
+    text = text.replace(_FENCE, '')
+    for marker in _INLINE_MARKERS:
+        count = text.count(marker)
+        if count % 2:
+            return False
+        text = text.replace(marker, '')
+    return True
+
+
+class MessageCoalescer:
+    """
+    Merges small messages queued for the same channel within a short linger
+    window, so a burst of them costs one API call instead of one each. Used
+    from the bot's event loop only.
+    """
+    def __init__(self, send, linger=DEFAULT_LINGER, limit=MESSAGE_LIMIT):
+        """
+        :param send: Coroutine function (channel_id, text) sending a merged message and returning its result
+        :param linger: Seconds the first message of a batch waits for others
+        :param limit: Maximum length of a merged message
+        """
+        self._send = send
+        self.linger = linger
+        self.limit = limit
+        self._batches = {}  # channel_id -> _Batch waiting for its linger to end
+
+    async def send(self, channel_id, text):
+        """
+        Queue a message; longer than the limit, it is sent on its own
+        :return: The send's result, shared by every message merged with this one
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(channel_id)
+        if batch is not None and batch.size + len(SEPARATOR) + len(text) > self.limit:
+            self._flush(channel_id)
+            batch = None
+        if len(text) >= self.limit or not self.linger:
+            return await self._send(channel_id, text)
+        if batch is None:
+            batch = self._batches[channel_id] = _Batch()
+            batch.timer = loop.call_later(self.linger, self._flush, channel_id)
+        future = loop.create_future()
+        batch.add(text, future)
+        return await future
+
+    def flush(self):
+        """Send every waiting batch now"""
+        for channel_id in list(self._batches):
+            self._flush(channel_id)
+
+    def cancel(self):
+        """Drop every waiting batch, cancelling its messages"""
+        batches, self._batches = self._batches, {}
+        for batch in batches.values():
+            batch.timer.cancel()
+            for future in batch.futures:
+                future.cancel()
+
+    def _flush(self, channel_id):
+        batch = self._batches.pop(channel_id, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.ensure_future(self._send(channel_id, SEPARATOR.join(batch.texts)))
+        task.add_done_callback(batch.resolve)
+
+
+class _Batch:
+    def __init__(self):
+        self.texts = []
+        self.futures = []
+        self.size = -len(SEPARATOR)
+        self.timer = None
+
+    def add(self, text, future):
+        self.texts.append(text)
+        self.futures.append(future)
+        self.size += len(SEPARATOR) + len(text)
+
+    def resolve(self, task):
+        for future in self.futures:
+            if future.done():
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
@@ -1,3 +1,19 @@
 TOKEN = 'YOUR_BOT_TOKEN'  # Replace with your bot token
 DEFAULT_CHANNEL_ID = None  # Replace with your default channel ID if needed
-DEFAULT_LANGUAGE = "fr"  # fr ou en
\ No newline at end of file
+DEFAULT_LANGUAGE = "fr"  # fr ou en
+MESSAGE_INDEX_PATH = "message_index.db"  # Local index of the messages sent by the bot
+INTENTS_PROFILE = "messaging"  # minimal, messaging or full (members, presences and message cache)
+CONTROL_HOST = "127.0.0.1"  # Control API address in headless mode (python main.py --headless)
+CONTROL_PORT = 8765
+CONTROL_API_KEY = None  # Set to require an X-Api-Key header on the control API
+METRICS_SNAPSHOT_PATH = None  # e.g. "metrics.json" to write a metrics snapshot every minute
+SHARDED = False  # Split the gateway connection into shards (needed past 2500 guilds)
+SHARD_COUNT = None  # Total number of shards, None for the count recommended by Discord
+SHARD_IDS = None  # Shards run by this process, e.g. [0, 1]; None for all of them (needs SHARD_COUNT)
+BOTS = []  # Several bots for python main.py --multi, e.g. [{"name": "main", "token": "..."}, {"name": "alt", "token": "..."}]
+AUTORESPONSES_PATH = "autoresponses.json"  # Keyword and regex auto-responses, editable from the GUI
+AUTORESPONSE_COOLDOWNS = {"user": (3, 10), "channel": (10, 10), "guild": (30, 10)}  # At most N auto-responses per S seconds
+AUTORESPONSE_DEDUP_WINDOW = 30  # Seconds an identical auto-response in the same channel is dropped, 0 to disable
+SCHEDULE_PATH = "schedule.db"  # Scheduled and recurring messages, managed from the GUI
+MESSAGE_LINGER = 0.25  # Seconds small messages to the same channel wait to be merged into one, 0 to disable
+CONFIG_PATH = "config.json"  # Settings file over these values (JSON, or .toml), reloaded while the bot runs; see settings.py
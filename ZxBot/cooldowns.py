@@ -0,0 +1,131 @@
+"""
+Rate limits on automatic replies, so a spam burst in one channel cannot make
+the bot spend its whole Discord rate-limit budget answering it.
+"""
+import collections
+import time
+
+SCOPES = ('user', 'channel', 'guild')
+# At most this many replies per number of seconds, for each user, channel and guild
+DEFAULT_LIMITS = {'user': (3, 10.0), 'channel': (10, 10.0), 'guild': (30, 10.0)}
+# An identical reply in the same channel is dropped for this many seconds
+DEFAULT_DEDUP_WINDOW = 30.0
+# Keys tracked per scope before the least recently used are dropped
+DEFAULT_MAX_KEYS = 10000
+
+
+class Cooldown:
+    """
+    At most rate hits per key in any per-second window, estimated with a
+    sliding window counter: each key only keeps the count of the current
+    fixed window and of the previous one, and the previous count is weighted
+    by how much of it still overlaps the sliding window.
+    """
+    def __init__(self, rate, per, max_keys=DEFAULT_MAX_KEYS):
+        if rate < 1 or per <= 0:
+            raise ValueError(f"Invalid cooldown {rate} per {per} s")
+        self.rate = rate
+        self.per = per
+        self.max_keys = max_keys
+        self._windows = collections.OrderedDict()  # key -> [window number, previous count, current count]
+
+    def __len__(self):
+        return len(self._windows)
+
+    def allowed(self, key, now):
+        """Whether one more hit for the key stays within the limit"""
+        return self._estimate(key, now) + 1 <= self.rate
+
+    def hit(self, key, now):
+        window = int(now // self.per)
+        self._estimate(key, now)
+        entry = self._windows.get(key)
+        if entry is None:
+            entry = self._windows[key] = [window, 0, 0]
+        entry[2] += 1
+        self._windows.move_to_end(key)
+        # Least recently hit first: stop at the first key that still counts
+        while self._windows:
+            oldest_key, oldest = next(iter(self._windows.items()))
+            if oldest[0] >= window - 1 and len(self._windows) <= self.max_keys:
+                break
+            del self._windows[oldest_key]
+
+    def _estimate(self, key, now):
+        entry = self._windows.get(key)
+        if entry is None:
+            return 0
+        window = int(now // self.per)
+        if entry[0] != window:
+            # Roll over: the current count becomes the previous one if it is just one window old
+            entry[1] = entry[2] if entry[0] == window - 1 else 0
+            entry[2] = 0
+            entry[0] = window
+        overlap = 1 - (now % self.per) / self.per
+        return entry[1] * overlap + entry[2]
+
+
+class ReplyCooldowns:
+    """
+    Decides whether an automatic reply may be sent: per-user, per-channel and
+    per-guild cooldowns, and no identical reply in the same channel within the
+    deduplication window. Used from the bot's event loop only.
+    """
+    def __init__(self, limits=None, dedup_window=DEFAULT_DEDUP_WINDOW, max_keys=DEFAULT_MAX_KEYS):
+        """
+        :param limits: {scope: (replies, seconds)} for scopes in SCOPES, DEFAULT_LIMITS if None;
+                       a scope left out is not limited
+        :param dedup_window: Seconds an identical reply in a channel is dropped, 0 to disable
+        :param max_keys: Users, channels, guilds and recent replies remembered, each
+        """
+        self.max_keys = max_keys
+        self.cooldowns = {}
+        self._recent = collections.OrderedDict()  # hash of (channel, reply) -> expires_at, oldest first
+        self.configure(limits, dedup_window)
+
+    def configure(self, limits=None, dedup_window=DEFAULT_DEDUP_WINDOW):
+        """
+        Change the limits; the counts of the scopes whose limit is unchanged are kept
+        :param limits: {scope: (replies, seconds)}, DEFAULT_LIMITS if None
+        :param dedup_window: Seconds an identical reply in a channel is dropped, 0 to disable
+        """
+        limits = DEFAULT_LIMITS if limits is None else limits
+        unknown = set(limits) - set(SCOPES)
+        if unknown:
+            raise ValueError(f"Unknown cooldown scopes {', '.join(sorted(unknown))}, expected {', '.join(SCOPES)}")
+        cooldowns = {}
+        for scope, (rate, per) in limits.items():
+            cooldown = self.cooldowns.get(scope)
+            if cooldown is None or (cooldown.rate, cooldown.per) != (rate, per):
+                cooldown = Cooldown(rate, per, self.max_keys)
+            cooldowns[scope] = cooldown
+        self.cooldowns = cooldowns
+        self.dedup_window = dedup_window
+
+    def check(self, user_id, channel_id, guild_id, reply, now=None):
+        """
+        Count a reply if it is allowed
+        :param guild_id: None for direct messages
+        :return: None if the reply can be sent, else why it is suppressed: a scope or 'duplicate'
+        """
+        now = time.monotonic() if now is None else now
+        keys = {'user': user_id, 'channel': channel_id, 'guild': guild_id}
+        for scope, cooldown in self.cooldowns.items():
+            if keys[scope] is not None and not cooldown.allowed(keys[scope], now):
+                return scope
+
+        while self._recent and next(iter(self._recent.values())) <= now:
+            self._recent.popitem(last=False)
+        # A hash keeps long replies from being held in memory
+        reply_key = hash((channel_id, reply))
+        if self.dedup_window:
+            if reply_key in self._recent:
+                return 'duplicate'
+            self._recent[reply_key] = now + self.dedup_window
+            while len(self._recent) > self.max_keys:
+                self._recent.popitem(last=False)
+
+        for scope, cooldown in self.cooldowns.items():
+            if keys[scope] is not None:
+                cooldown.hit(keys[scope], now)
+        return None
@@ -0,0 +1,248 @@
+"""
+Headless ZxBot: runs DiscordBot without tkinter and exposes its operations
+through a local JSON API (TCP on localhost or a Unix socket).
+
+    python main.py --headless [--port 8765 | --socket /run/zxbot.sock]
+
+Use zxctl.py to drive it from the command line or scripts.
+"""
+import asyncio
+import hmac
+import signal
+
+from aiohttp import web
+
+from bot import DiscordBot
+from dispatcher import PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from cooldowns import DEFAULT_DEDUP_WINDOW
+from composer import DEFAULT_LINGER
+from avatar import MAX_AVATAR_WAIT
+from settings import SettingsWatcher, POLL_INTERVAL
+from cleanup import CleanupFilter
+
+
+def _operation(bot, name, params):
+    """
+    Map an API operation to the dispatcher job that runs it
+    :return: (factory, route, priority, coalesce_key)
+    :raises KeyError: if a required parameter is missing
+    :raises ValueError: if the operation is unknown
+    """
+    if name == 'send':
+        channel_id, message = str(params['channel_id']), params['message']
+        return lambda: bot.send_message(channel_id, message), ('send', channel_id), PRIORITY_NORMAL, None
+    if name == 'send_image':
+        channel_id, image_paths, message = str(params['channel_id']), _image_paths(params), params.get('message')
+        if not image_paths:
+            raise KeyError('image_path')
+        if len(image_paths) > 1:
+            factory = lambda: bot.send_images(channel_id, image_paths, message)
+        else:
+            factory = lambda: bot.send_image(channel_id, image_paths[0], message)
+        return factory, ('send', channel_id), PRIORITY_NORMAL, None
+    if name == 'broadcast':
+        channel_ids = [str(channel_id) for channel_id in params['channel_ids']]
+        image_paths = _image_paths(params)
+        if len(image_paths) > 1:
+            message = params.get('message')
+            factory = lambda: bot.broadcast_images(channel_ids, image_paths, message)
+        elif image_paths:
+            message = params.get('message')
+            factory = lambda: bot.broadcast_image(channel_ids, image_paths[0], message)
+        else:
+            message = params['message']
+            factory = lambda: bot.broadcast_message(channel_ids, message)
+        return factory, 'broadcast', PRIORITY_NORMAL, None
+    if name == 'presence':
+        status, activity = params.get('status', 'online'), params.get('activity', '')
+        return lambda: bot.change_presence(status, activity), 'presence', PRIORITY_HIGH, 'presence'
+    if name == 'avatar':
+        image_path, max_wait = params['image_path'], float(params.get('max_wait', MAX_AVATAR_WAIT))
+        return lambda: bot.change_avatar(image_path, max_wait), 'avatar', PRIORITY_NORMAL, 'avatar'
+    if name == 'cleanup':
+        channel_id, bulk, resume = str(params['channel_id']), params.get('bulk', True), params.get('resume', True)
+        # 0 or null: no limit
+        limit = params.get('limit', 100)
+        limit = int(limit) if limit else None
+        message_filter = CleanupFilter.from_dict(params)
+        factory = lambda: bot.delete_bot_messages(channel_id, limit, bulk, message_filter, resume=resume)
+        return factory, 'cleanup', PRIORITY_LOW, None
+    raise ValueError(f"Unknown operation {name!r}")
+
+
+def _image_paths(params):
+    """image_path and image_paths parameters together"""
+    paths = [params['image_path']] if params.get('image_path') else []
+    return paths + list(params.get('image_paths') or [])
+
+
+async def run_operation(bot, name, params):
+    """
+    Queue an operation on a bot and wait for its result
+    :return: (HTTP status, JSON body)
+    """
+    if not bot.is_running():
+        return 503, {'error': 'bot is not running'}
+    try:
+        if name == 'send' and params.get('coalesce'):
+            # Merged with the other small messages to the channel sent within the linger window
+            result = await bot.queue_message(params['channel_id'], params['message'])
+        else:
+            factory, route, priority, coalesce_key = _operation(bot, name, params)
+            result = await bot.dispatcher.submit(factory, route, priority, coalesce_key)
+    except asyncio.QueueFull:
+        return 429, {'error': 'outbound queue is full'}
+    except (KeyError, ValueError, TypeError) as e:
+        return 400, {'error': f'invalid request: {e}'}
+    if isinstance(result, bool):
+        return 200, {'ok': result}
+    if name == 'avatar':
+        # Already {'ok', 'outcome', 'retry_after'}
+        return 200, result
+    if name == 'broadcast':
+        return 200, {'ok': all(result.values()), 'results': result}
+    return 200, {'ok': True, 'result': result}
+
+
+class ControlServer:
+    """
+    Local JSON API over a DiscordBot. Every operation goes through the bot's
+    outbound dispatcher, so API clients get the same pacing and backpressure
+    as the GUI: a full queue answers 429.
+    """
+    OPERATIONS = ('send', 'send_image', 'broadcast', 'presence', 'avatar', 'cleanup')
+
+    def __init__(self, bot, host='127.0.0.1', port=8765, socket_path=None, api_key=None):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.api_key = api_key
+        self._runner = None
+
+        self.app = web.Application(middlewares=[self._auth])
+        self.app.router.add_get('/status', self.handle_status)
+        self.app.router.add_post('/batch', self.handle_batch)
+        self.app.router.add_post('/restart', self.handle_restart)
+        self.app.router.add_get('/metrics', self.handle_metrics)
+        for name in self.OPERATIONS:
+            self.app.router.add_post(f'/{name}', self.handle_operation)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        if self.socket_path:
+            site = web.UnixSite(self._runner, self.socket_path)
+        else:
+            site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        print(f"Control API listening on {self.socket_path or f'http://{self.host}:{self.port}'}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _auth(self, request, handler):
+        if self.api_key and not hmac.compare_digest(request.headers.get('X-Api-Key', ''), self.api_key):
+            return web.json_response({'error': 'invalid API key'}, status=401)
+        return await handler(request)
+
+    async def run_operation(self, name, params):
+        """
+        Queue an operation and wait for its result
+        :return: (HTTP status, JSON body)
+        """
+        return await run_operation(self.bot, name, params)
+
+    async def handle_operation(self, request):
+        try:
+            params = await request.json()
+        except ValueError:
+            return web.json_response({'error': 'body must be JSON'}, status=400)
+        status, body = await self.run_operation(request.path.strip('/'), params)
+        return web.json_response(body, status=status)
+
+    async def handle_batch(self, request):
+        """Run a list of {"op": ..., ...params} operations concurrently, results in order"""
+        try:
+            operations = (await request.json())['operations']
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({'error': 'body must be {"operations": [...]}'}, status=400)
+
+        async def run(operation):
+            if not isinstance(operation, dict):
+                return {'status': 400, 'error': 'operation must be an object'}
+            status, body = await self.run_operation(operation.get('op'), operation)
+            body['status'] = status
+            return body
+
+        results = await asyncio.gather(*(run(operation) for operation in operations))
+        return web.json_response({'results': results})
+
+    async def handle_restart(self, request):
+        """Reconnect the gateway without tearing down the process or its HTTP pool"""
+        latency = await self.bot.restart()
+        return web.json_response({'ok': latency is not None, 'latency_s': latency})
+
+    async def handle_metrics(self, request):
+        """Prometheus text format, or JSON with ?format=json"""
+        if request.query.get('format') == 'json':
+            return web.json_response(self.bot.metrics.snapshot(self.bot.gauges()))
+        return web.Response(text=self.bot.metrics.prometheus(self.bot.gauges()),
+                            content_type='text/plain', headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def handle_status(self, request):
+        return web.json_response(self.bot.status())
+
+
+async def watch_settings(bot, watcher, interval=POLL_INTERVAL):
+    """Apply the changes made to the settings file to a bot, until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        changes = watcher.poll()
+        if changes:
+            print(f"Settings reloaded: {', '.join(sorted(changes))}")
+            bot.apply_settings(changes)
+
+
+async def run_daemon(token, host='127.0.0.1', port=8765, socket_path=None, api_key=None,
+                     message_index_path='message_index.db', profile='messaging', metrics_path=None,
+                     sharded=False, shard_count=None, shard_ids=None, responses_path=None, cooldowns=None,
+                     dedup_window=DEFAULT_DEDUP_WINDOW, schedule_path=None, linger=DEFAULT_LINGER,
+                     config_path=None):
+    """
+    Run the bot and its control API until SIGINT/SIGTERM or the bot stops
+    :param config_path: Settings file (see settings.py) whose values replace the matching arguments
+                        and whose changes are applied while the bot runs, None to disable
+    """
+    watcher = SettingsWatcher(config_path) if config_path else None
+    if watcher:
+        settings = watcher.settings
+        token, profile, responses_path = settings['token'], settings['intents_profile'], settings['autoresponses_path']
+        cooldowns, dedup_window = settings['autoresponse_cooldowns'], settings['autoresponse_dedup_window']
+        linger = settings['message_linger']
+    bot = DiscordBot(message_index_path, profile, metrics_path, sharded, shard_count, shard_ids, responses_path,
+                     cooldowns, dedup_window, schedule_path, linger)
+    if watcher:
+        bot.apply_settings({'route_rates': settings['route_rates'], 'presence': settings['presence']})
+        watch_task = asyncio.ensure_future(watch_settings(bot, watcher))
+    server = ControlServer(bot, host, port, socket_path, api_key)
+    await server.start()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, lambda: loop.create_task(bot.stop_bot()))
+        except (NotImplementedError, AttributeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+
+    try:
+        await bot.start_bot(token)
+    finally:
+        if watcher:
+            watch_task.cancel()
+        if bot.is_running():
+            await bot.stop_bot()
+        await server.stop()
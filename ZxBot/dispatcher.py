@@ -0,0 +1,219 @@
+import asyncio
+import itertools
+import time
+
+# Lower values are sent first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Discord allows 50 requests per second per bot across all routes
+GLOBAL_RATE = (50, 1.0)
+# (requests, per seconds) for each kind of route, the first element of a route key.
+# Kinds not listed here are only paced by the global bucket.
+ROUTE_RATES = {
+    'send': (5, 5.0),
+    'delete': (5, 1.0),
+    'presence': (5, 20.0),
+}
+# Idle per-route buckets are dropped once there are more than this many
+MAX_ROUTE_BUCKETS = 1000
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `capacity` requests in a burst, refilled at
+    capacity / per tokens per second
+    """
+    def __init__(self, capacity, per):
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        
+    def is_full(self):
+        self._refill()
+        return self.tokens >= self.capacity
+        
+    async def acquire(self):
+        """Wait until a token is available and take it, first come first served"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Job:
+    def __init__(self, factory, route, coalesce_key):
+        self.factory = factory
+        self.route = route
+        self.coalesce_key = coalesce_key
+        self.futures = []
+
+
+class OutboundDispatcher:
+    """
+    Single entry point for outbound Discord operations.
+
+    Operations wait in a bounded priority queue and are started in priority
+    order, at most max_in_flight at a time, each one first taking a token
+    from its route bucket and from the global bucket. Operations submitted
+    with the same coalesce_key while one is still pending replace it, so
+    only the latest one is sent.
+    """
+    def __init__(self, max_queue=1000, max_in_flight=10, global_rate=GLOBAL_RATE, route_rates=None):
+        self.max_queue = max_queue
+        self.max_in_flight = max_in_flight
+        self.global_rate = global_rate
+        self.global_bucket = None
+        self.route_rates = dict(ROUTE_RATES if route_rates is None else route_rates)
+        self._route_buckets = {}
+        self._pending = {}
+        self._counter = itertools.count()
+        self._loop = None
+        self._queue = None
+        self._in_flight = None
+        self._worker = None
+        self._tasks = set()
+        
+    def start(self):
+        """Start the dispatcher on the running event loop"""
+        if self._worker and not self._worker.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue(self.max_queue)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        # Buckets hold asyncio locks, which belong to the loop they are used on
+        self.global_bucket = TokenBucket(*self.global_rate)
+        self._route_buckets = {}
+        self._pending.clear()
+        self._worker = self._loop.create_task(self._run())
+        
+    async def stop(self):
+        """Stop the dispatcher, cancelling running and queued operations"""
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._tasks):
+            task.cancel()
+        while self._queue and not self._queue.empty():
+            _, _, job = self._queue.get_nowait()
+            for future in job.futures:
+                if not future.done():
+                    future.cancel()
+        self._pending.clear()
+        
+    def set_route_rates(self, route_rates):
+        """
+        Replace the per-route rates, must be called from the dispatcher's loop
+        once it is started. Operations already waiting for a token keep their
+        old bucket; later ones use the new rates.
+        :param route_rates: {kind: (requests, per seconds)}
+        """
+        self.route_rates = dict(route_rates)
+        self._route_buckets = {}
+        
+    @property
+    def queue_depth(self):
+        """Number of operations waiting to be started"""
+        return self._queue.qsize() if self._queue else 0
+        
+    def submit(self, factory, route=None, priority=PRIORITY_NORMAL, coalesce_key=None):
+        """
+        Queue an operation, must be called from the dispatcher's loop
+        :param factory: Callable returning the coroutine to run
+        :param route: Route key used for pacing, e.g. ('send', channel_id)
+        :param priority: PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW
+        :param coalesce_key: Operations sharing this key replace each other while pending
+        :return: Future resolved with the operation's result
+        :raises asyncio.QueueFull: if the queue is full
+        """
+        future = self._loop.create_future()
+        job = self._pending.get(coalesce_key) if coalesce_key else None
+        if job:
+            job.factory = factory
+            job.futures.append(future)
+            return future
+            
+        job = _Job(factory, route, coalesce_key)
+        job.futures.append(future)
+        self._queue.put_nowait((priority, next(self._counter), job))
+        if coalesce_key:
+            self._pending[coalesce_key] = job
+        return future
+        
+    def submit_threadsafe(self, factory, route=None, priority=PRIORITY_NORMAL, coalesce_key=None):
+        """
+        Queue an operation from another thread
+        :return: concurrent.futures.Future resolved with the operation's result
+        :raises RuntimeError: if the dispatcher is not running
+        :raises asyncio.QueueFull: if the queue is full
+        """
+        if not self._worker or self._loop.is_closed():
+            raise RuntimeError("Dispatcher is not running")
+        if self.queue_depth >= self.max_queue:
+            raise asyncio.QueueFull()
+            
+        async def submit_and_wait():
+            return await self.submit(factory, route, priority, coalesce_key)
+            
+        return asyncio.run_coroutine_threadsafe(submit_and_wait(), self._loop)
+        
+    async def _run(self):
+        while True:
+            _, _, job = await self._queue.get()
+            await self._in_flight.acquire()
+            task = self._loop.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            
+    async def _execute(self, job):
+        try:
+            bucket = self._route_bucket(job.route)
+            if bucket:
+                await bucket.acquire()
+            await self.global_bucket.acquire()
+            # From here on a new submission with the same key is a new job
+            if job.coalesce_key and self._pending.get(job.coalesce_key) is job:
+                del self._pending[job.coalesce_key]
+            result = await job.factory()
+        except asyncio.CancelledError:
+            for future in job.futures:
+                if not future.done():
+                    future.cancel()
+            raise
+        except Exception as e:
+            for future in job.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future in job.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._in_flight.release()
+            
+    def _route_bucket(self, route):
+        if route is None:
+            return None
+        kind = route[0] if isinstance(route, tuple) else route
+        rate = self.route_rates.get(kind)
+        if rate is None:
+            return None
+        bucket = self._route_buckets.get(route)
+        if bucket is None:
+            if len(self._route_buckets) >= MAX_ROUTE_BUCKETS:
+                self._route_buckets = {
+                    key: value for key, value in self._route_buckets.items() if not value.is_full()
+                }
+            bucket = self._route_buckets[route] = TokenBucket(*rate)
+        return bucket
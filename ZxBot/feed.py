@@ -0,0 +1,65 @@
+import collections
+import threading
+
+# Messages kept for the live feed, older ones are overwritten
+FEED_CAPACITY = 5000
+# Longer message contents are cut, so memory stays bounded
+MAX_CONTENT = 500
+
+FeedEntry = collections.namedtuple('FeedEntry', 'seq timestamp channel_id channel author content')
+
+
+class MessageFeed:
+    """
+    Ring buffer of the last messages the bot received. The bot's loop pushes
+    every incoming message and the GUI reads the new ones in batches, so a
+    burst of messages costs one append each and never waits on the GUI.
+    """
+    def __init__(self, capacity=FEED_CAPACITY):
+        self._entries = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def push(self, message):
+        """Record a discord.Message"""
+        content = message.content
+        if len(content) > MAX_CONTENT:
+            content = content[:MAX_CONTENT] + '…'
+        if message.attachments:
+            content = f"{content} [{len(message.attachments)} 📎]".strip()
+        with self._lock:
+            self._seq += 1
+            self._entries.append(FeedEntry(
+                self._seq,
+                message.created_at.timestamp(),
+                message.channel.id,
+                getattr(message.channel, 'name', None) or str(message.channel.id),
+                message.author.display_name,
+                content,
+            ))
+
+    def since(self, seq, channel_ids=None, limit=None):
+        """
+        :param seq: Sequence number of the last entry already read, 0 for all
+        :param channel_ids: Only return messages from these channel IDs (ints), all if None
+        :param limit: Only return the newest entries, up to this many
+        :return: (entries newer than seq oldest first, sequence number of the newest entry)
+        """
+        with self._lock:
+            last = self._seq
+            # Entries are in seq order: only walk the new ones, from the end
+            new = []
+            for entry in reversed(self._entries):
+                if entry.seq <= seq:
+                    break
+                new.append(entry)
+        if channel_ids is not None:
+            new = [entry for entry in new if entry.channel_id in channel_ids]
+        if limit is not None:
+            new = new[:limit]
+        new.reverse()
+        return new, last
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
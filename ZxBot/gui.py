@@ -2,88 +2,153 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import threading
 import asyncio
-from bot import DiscordBot
-from config import TOKEN, DEFAULT_CHANNEL_ID, DEFAULT_LANGUAGE
-from translations import TRANSLATIONS
+import datetime
+import os
+import re
+import time
+from dispatcher import PRIORITY_LOW, PRIORITY_NORMAL
+from config import (MESSAGE_INDEX_PATH, METRICS_SNAPSHOT_PATH, SHARDED, SHARD_COUNT, SHARD_IDS, SCHEDULE_PATH,
+                    CONFIG_PATH)
+from settings import SettingsWatcher, RECONNECT, POLL_INTERVAL
+from autoresponder import AutoResponder, Rule, KEYWORD, REGEX
+from avatar import CHANGED, UNCHANGED, RATE_LIMITED
+from scheduler import Scheduler, KINDS, MISSED_POLICIES, MISSED_ONCE, ONCE, parse_spec
+from translations import get_catalog, available_languages
+from tk_bridge import TkBridge
+from startup_profile import profiler
+
+# Upcoming jobs listed in the schedule tab
+SCHEDULE_ROWS = 500
+# Lines kept in the live feed, and how often in milliseconds it is redrawn
+FEED_LINES = 500
+FEED_INTERVAL = 250
 
 class BotGUI:
-    def __init__(self):
+    def __init__(self, sharded=SHARDED, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS):
+        self.sharding = (sharded, shard_count, shard_ids)
         self.root = tk.Tk()
-        self.current_language = DEFAULT_LANGUAGE
-        self.root.title(self._('window_title'))
+        # config.py's values, overridden by the settings file and reloaded when it changes
+        self.settings_watcher = SettingsWatcher(CONFIG_PATH)
+        self.current_language = self.settings_watcher.settings['language']
+        # Only the catalog of the language shown is read
+        self.catalog = get_catalog(self.current_language)
+        # (function receiving the text, translation key) of every translated widget, see bind_text()
+        self.text_bindings = []
+        self.default_channel_id = self.settings_watcher.settings['default_channel_id']
+        self.bind_text(self.root.title, 'window_title')
         self.root.geometry("500x400")
         
-        self.bot = DiscordBot()
-        self.bot_thread = None
+        # Created on first start so discord.py is not imported before the window shows
+        self.bot = None
+        # Edited in the auto-responses tab, handed to the bot when it is created
+        self.responder = AutoResponder(self.settings_watcher.settings['autoresponses_path'])
+        self.scheduler = Scheduler(SCHEDULE_PATH)
+        self.bridge = TkBridge(self.root)
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(int(POLL_INTERVAL * 1000), self.watch_settings)
+        self.root.bind('<Map>', self._on_first_map)
+        # Import discord.py in the background once the window is up
+        self.root.after(200, lambda: threading.Thread(target=self.preload_bot, daemon=True).start())
+        profiler.mark('tk_constructed')
+        
+    def _on_first_map(self, event):
+        if event.widget is self.root:
+            self.root.unbind('<Map>')
+            profiler.mark('window_mapped')
+            
+    def preload_bot(self):
+        """Import the bot module (and discord.py) off the Tk thread"""
+        started = time.perf_counter()
+        import bot
+        profiler.record('discord_import', time.perf_counter() - started)
+        
+    def get_bot(self):
+        """Create the DiscordBot on first use"""
+        if self.bot is None:
+            from bot import DiscordBot
+            settings = self.settings_watcher.settings
+            self.bot = DiscordBot(MESSAGE_INDEX_PATH, settings['intents_profile'], METRICS_SNAPSHOT_PATH,
+                                  *self.sharding, cooldowns=settings['autoresponse_cooldowns'],
+                                  dedup_window=settings['autoresponse_dedup_window'],
+                                  linger=settings['message_linger'])
+            self.bot.responder = self.responder
+            self.bot.scheduler = self.scheduler
+            self.bot.apply_settings({'route_rates': settings['route_rates'], 'presence': settings['presence']})
+        return self.bot
+        
+    def bot_running(self):
+        return self.bot is not None and self.bot.is_running()
         
     def _(self, key):
         """Translate a key to the current language"""
-        return TRANSLATIONS[self.current_language].get(key, key)
+        return self.catalog.get(key)
+        
+    def bind_text(self, target, key):
+        """
+        Show a translated text on a widget now and after every language change
+        :param target: Widget with a text option, or a function receiving the text
+        :param key: Translation key of the text
+        :return: target
+        """
+        if isinstance(target, tk.Misc):
+            setter = lambda text, widget=target: widget.config(text=text)
+        else:
+            setter = target
+        self.text_bindings.append((setter, key))
+        setter(self._(key))
+        return target
         
     def change_language(self, event=None):
         """Change the interface language"""
         self.current_language = self.language_var.get()
+        self.catalog = get_catalog(self.current_language)
         self.update_interface_texts()
         
     def update_interface_texts(self):
         """Update all interface texts with the current language"""
-        self.root.title(self._('window_title'))
-        
-        # Update tabs
-        self.notebook.tab(0, text=self._('tab_messages'))
-        self.notebook.tab(1, text=self._('tab_settings'))
-        
-        # Update channel frame
-        self.channel_frame.config(text=self._('channel_settings'))
-        self.channel_label.config(text=self._('channel_id'))
-        
-        # Update message frame
-        self.message_frame.config(text=self._('message'))
-        
-        # Update image frame
-        self.image_frame.config(text=self._('image'))
-        self.browse_image_btn.config(text=self._('browse'))
-        
-        # Update control buttons
-        self.bot_control_frame.config(text=self._('bot_control'))
-        self.start_stop_btn.config(text=self._('start_bot') if not self.bot.is_running() else self._('stop_bot'))
-        self.force_stop_btn.config(text=self._('force_stop'))
-        self.send_btn.config(text=self._('send_message'))
-        self.send_image_btn.config(text=self._('send_image'))
-        self.cleanup_btn.config(text=self._('clean_messages'))
-        
-        # Update settings tab
-        self.avatar_frame.config(text=self._('avatar_settings'))
-        self.browse_avatar_btn.config(text=self._('browse'))
-        self.change_avatar_btn.config(text=self._('change_avatar'))
-        
-        self.status_frame.config(text=self._('status_settings'))
-        self.status_label.config(text=self._('status'))
-        self.activity_label.config(text=self._('activity'))
-        self.update_presence_btn.config(text=self._('update_presence'))
+        for setter, key in self.text_bindings:
+            setter(self._(key))
+            
+        # Texts that depend on the bot's state
+        self.start_stop_btn.config(text=self._('start_bot') if not self.bot_running() else self._('stop_bot'))
+        self.queue_label.config(text=self.catalog.format('queue_depth', self.bot.queue_depth() if self.bot else 0))
+        self.update_stats(reschedule=False)
+        self.refresh_schedule(reschedule=False)
         
     def setup_gui(self):
         # Create notebook for tabs
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill="both", expand=True, padx=5, pady=5)
         
+        # Outcome and latency of the last operation
+        self.operation_status = tk.StringVar()
+        operation_label = ttk.Label(self.root, textvariable=self.operation_status, anchor="w")
+        operation_label.pack(fill="x", padx=10, pady=(0, 5))
+        
         # Create tabs
         self.message_tab = ttk.Frame(self.notebook)
         self.settings_tab = ttk.Frame(self.notebook)
+        self.stats_tab = ttk.Frame(self.notebook)
+        self.responses_tab = ttk.Frame(self.notebook)
+        self.schedule_tab = ttk.Frame(self.notebook)
+        self.feed_tab = ttk.Frame(self.notebook)
         
-        self.notebook.add(self.message_tab, text=self._('tab_messages'))
-        self.notebook.add(self.settings_tab, text=self._('tab_settings'))
+        for tab, key in ((self.message_tab, 'tab_messages'), (self.settings_tab, 'tab_settings'),
+                         (self.stats_tab, 'tab_stats'), (self.responses_tab, 'tab_responses'),
+                         (self.schedule_tab, 'tab_schedule'), (self.feed_tab, 'tab_feed')):
+            self.notebook.add(tab)
+            self.bind_text(lambda text, tab=tab: self.notebook.tab(tab, text=text), key)
         
         # Language selector in settings tab
-        language_frame = ttk.LabelFrame(self.settings_tab, text=self._('language'), padding=10)
+        language_frame = self.bind_text(ttk.LabelFrame(self.settings_tab, padding=10), 'language')
         language_frame.pack(fill="x", padx=10, pady=5)
         
         self.language_var = tk.StringVar(value=self.current_language)
         language_combo = ttk.Combobox(
             language_frame,
             textvariable=self.language_var,
-            values=["fr", "en"],
+            values=available_languages(),
             state="readonly",
             width=5
         )
@@ -92,36 +157,41 @@ class BotGUI:
         
         self.setup_message_tab()
         self.setup_settings_tab()
+        self.setup_stats_tab()
+        self.setup_responses_tab()
+        self.setup_schedule_tab()
+        self.setup_feed_tab()
         
         # Create custom styles
         style = ttk.Style()
         style.configure("Danger.TButton", foreground="red")
         style.configure("Warning.TButton", foreground="orange")
         
-        self.update_interface_texts()
-        
     def setup_message_tab(self):
         # Channel ID Frame
-        self.channel_frame = ttk.LabelFrame(self.message_tab, text=self._('channel_settings'), padding=10)
+        self.channel_frame = self.bind_text(ttk.LabelFrame(self.message_tab, padding=10), 'channel_settings')
         self.channel_frame.pack(fill="x", padx=10, pady=5)
         
-        self.channel_label = ttk.Label(self.channel_frame, text=self._('channel_id'))
+        self.channel_label = self.bind_text(ttk.Label(self.channel_frame), 'channel_id')
         self.channel_label.pack(side="left")
         
-        self.channel_id = ttk.Entry(self.channel_frame)
+        # One or more channel IDs, separated by commas or new lines
+        self.channel_id = tk.Text(self.channel_frame, height=2, width=20)
         self.channel_id.pack(side="left", fill="x", expand=True, padx=5)
-        if DEFAULT_CHANNEL_ID:
-            self.channel_id.insert(0, str(DEFAULT_CHANNEL_ID))
+        if self.default_channel_id:
+            self.channel_id.insert("1.0", str(self.default_channel_id))
             
         # Messages Cleanup Frame
         cleanup_frame = ttk.Frame(self.channel_frame)
         cleanup_frame.pack(side="left", padx=5)
         
+        # 0: no limit
         self.cleanup_limit = ttk.Spinbox(
             cleanup_frame,
-            from_=1,
-            to=1000,
-            width=5,
+            from_=0,
+            to=100000,
+            increment=100,
+            width=6,
             state="readonly"
         )
         self.cleanup_limit.set(100)
@@ -129,33 +199,45 @@ class BotGUI:
         
         self.cleanup_btn = ttk.Button(
             cleanup_frame,
-            text=self._('clean_messages'),
             command=self.delete_messages,
             style="Warning.TButton"
         )
+        self.bind_text(self.cleanup_btn, 'clean_messages')
         self.cleanup_btn.pack(side="left", padx=2)
         self.cleanup_btn.config(state="disabled")
         
+        # Set to stop the running cleanup after its current page
+        self.cleanup_cancel = threading.Event()
+        self.cancel_cleanup_btn = ttk.Button(
+            cleanup_frame,
+            command=self.cleanup_cancel.set,
+            state="disabled"
+        )
+        self.bind_text(self.cancel_cleanup_btn, 'cancel_cleanup')
+        self.cancel_cleanup_btn.pack(side="left", padx=2)
+        
         # Message Frame
-        self.message_frame = ttk.LabelFrame(self.message_tab, text=self._('message'), padding=10)
+        self.message_frame = self.bind_text(ttk.LabelFrame(self.message_tab, padding=10), 'message')
         self.message_frame.pack(fill="both", expand=True, padx=10, pady=5)
         
         self.message_text = tk.Text(self.message_frame, height=8)
         self.message_text.pack(fill="both", expand=True)
         
         # Image Frame
-        self.image_frame = ttk.LabelFrame(self.message_tab, text=self._('image'), padding=10)
+        self.image_frame = self.bind_text(ttk.LabelFrame(self.message_tab, padding=10), 'image')
         self.image_frame.pack(fill="x", padx=10, pady=5)
         
+        # Selected images, listed by name in the entry
+        self.image_paths = []
         self.image_path = tk.StringVar()
         image_entry = ttk.Entry(self.image_frame, textvariable=self.image_path, state="readonly")
         image_entry.pack(side="left", fill="x", expand=True, padx=5)
         
         self.browse_image_btn = ttk.Button(
             self.image_frame,
-            text=self._('browse'),
-            command=self.browse_image
+            command=self.browse_images
         )
+        self.bind_text(self.browse_image_btn, 'browse')
         self.browse_image_btn.pack(side="left", padx=5)
         
         # Control Frame
@@ -163,7 +245,7 @@ class BotGUI:
         control_frame.pack(fill="x", padx=10, pady=5)
         
         # Bot Control Buttons Frame
-        self.bot_control_frame = ttk.LabelFrame(control_frame, text=self._('bot_control'), padding=5)
+        self.bot_control_frame = self.bind_text(ttk.LabelFrame(control_frame, padding=5), 'bot_control')
         self.bot_control_frame.pack(side="left", padx=5)
         
         self.start_stop_btn = ttk.Button(
@@ -173,12 +255,20 @@ class BotGUI:
         )
         self.start_stop_btn.pack(side="left", padx=5)
         
+        self.restart_btn = ttk.Button(
+            self.bot_control_frame,
+            command=self.restart_bot
+        )
+        self.bind_text(self.restart_btn, 'restart_bot')
+        self.restart_btn.pack(side="left", padx=5)
+        self.restart_btn.config(state="disabled")
+        
         self.force_stop_btn = ttk.Button(
             self.bot_control_frame,
-            text=self._('force_stop'),
             command=self.force_stop_bot,
             style="Danger.TButton"
         )
+        self.bind_text(self.force_stop_btn, 'force_stop')
         self.force_stop_btn.pack(side="left", padx=5)
         self.force_stop_btn.config(state="disabled")
         
@@ -188,23 +278,27 @@ class BotGUI:
         
         self.send_btn = ttk.Button(
             message_control_frame,
-            text=self._('send_message'),
             command=self.send_message
         )
+        self.bind_text(self.send_btn, 'send_message')
         self.send_btn.pack(side="left", padx=5)
         self.send_btn.config(state="disabled")
         
         self.send_image_btn = ttk.Button(
             message_control_frame,
-            text=self._('send_image'),
             command=self.send_image
         )
+        self.bind_text(self.send_image_btn, 'send_image')
         self.send_image_btn.pack(side="left", padx=5)
         self.send_image_btn.config(state="disabled")
         
+        self.queue_label = ttk.Label(message_control_frame, text=self.catalog.format('queue_depth', 0))
+        self.queue_label.pack(side="left", padx=5)
+        self.update_queue_depth()
+        
     def setup_settings_tab(self):
         # Avatar Frame
-        self.avatar_frame = ttk.LabelFrame(self.settings_tab, text=self._('avatar_settings'), padding=10)
+        self.avatar_frame = self.bind_text(ttk.LabelFrame(self.settings_tab, padding=10), 'avatar_settings')
         self.avatar_frame.pack(fill="x", padx=10, pady=5)
         
         self.avatar_path = tk.StringVar()
@@ -213,23 +307,23 @@ class BotGUI:
         
         self.browse_avatar_btn = ttk.Button(
             self.avatar_frame,
-            text=self._('browse'),
             command=self.browse_avatar
         )
+        self.bind_text(self.browse_avatar_btn, 'browse')
         self.browse_avatar_btn.pack(side="left", padx=5)
         
         self.change_avatar_btn = ttk.Button(
             self.avatar_frame,
-            text=self._('change_avatar'),
             command=self.change_avatar
         )
+        self.bind_text(self.change_avatar_btn, 'change_avatar')
         self.change_avatar_btn.pack(side="left", padx=5)
         
         # Status Frame
-        self.status_frame = ttk.LabelFrame(self.settings_tab, text=self._('status_settings'), padding=10)
+        self.status_frame = self.bind_text(ttk.LabelFrame(self.settings_tab, padding=10), 'status_settings')
         self.status_frame.pack(fill="x", padx=10, pady=5)
         
-        self.status_label = ttk.Label(self.status_frame, text=self._('status'))
+        self.status_label = self.bind_text(ttk.Label(self.status_frame), 'status')
         self.status_label.pack(side="left", padx=5)
         
         self.status_var = tk.StringVar(value="online")
@@ -242,7 +336,7 @@ class BotGUI:
         )
         status_combo.pack(side="left", padx=5)
         
-        self.activity_label = ttk.Label(self.status_frame, text=self._('activity'))
+        self.activity_label = self.bind_text(ttk.Label(self.status_frame), 'activity')
         self.activity_label.pack(side="left", padx=5)
         
         self.activity_var = tk.StringVar()
@@ -251,11 +345,395 @@ class BotGUI:
         
         self.update_presence_btn = ttk.Button(
             self.status_frame,
-            text=self._('update_presence'),
             command=self.update_presence
         )
+        self.bind_text(self.update_presence_btn, 'update_presence')
         self.update_presence_btn.pack(side="left", padx=5)
         
+        # Cleanup Filters Frame, used by the cleanup button of the messages tab
+        self.cleanup_filters_frame = self.bind_text(ttk.LabelFrame(self.settings_tab, padding=10), 'cleanup_filters')
+        self.cleanup_filters_frame.pack(fill="x", padx=10, pady=5)
+        
+        self.cleanup_pattern_label = self.bind_text(ttk.Label(self.cleanup_filters_frame), 'cleanup_pattern')
+        self.cleanup_pattern_label.grid(row=0, column=0, sticky="w", padx=5, pady=2)
+        self.cleanup_pattern = tk.StringVar()
+        ttk.Entry(self.cleanup_filters_frame, textvariable=self.cleanup_pattern).grid(
+            row=0, column=1, columnspan=3, sticky="ew", padx=5, pady=2
+        )
+        
+        self.cleanup_after_label = self.bind_text(ttk.Label(self.cleanup_filters_frame), 'cleanup_after')
+        self.cleanup_after_label.grid(row=1, column=0, sticky="w", padx=5, pady=2)
+        self.cleanup_after = tk.StringVar()
+        ttk.Entry(self.cleanup_filters_frame, textvariable=self.cleanup_after, width=12).grid(
+            row=1, column=1, sticky="w", padx=5, pady=2
+        )
+        self.cleanup_before_label = self.bind_text(ttk.Label(self.cleanup_filters_frame), 'cleanup_before')
+        self.cleanup_before_label.grid(row=1, column=2, sticky="w", padx=5, pady=2)
+        self.cleanup_before = tk.StringVar()
+        ttk.Entry(self.cleanup_filters_frame, textvariable=self.cleanup_before, width=12).grid(
+            row=1, column=3, sticky="w", padx=5, pady=2
+        )
+        
+        self.cleanup_authors_label = self.bind_text(ttk.Label(self.cleanup_filters_frame), 'cleanup_authors')
+        self.cleanup_authors_label.grid(row=2, column=0, sticky="w", padx=5, pady=2)
+        self.cleanup_authors = tk.StringVar()
+        ttk.Entry(self.cleanup_filters_frame, textvariable=self.cleanup_authors).grid(
+            row=2, column=1, columnspan=3, sticky="ew", padx=5, pady=2
+        )
+        
+        self.cleanup_attachments = tk.BooleanVar()
+        self.cleanup_attachments_check = ttk.Checkbutton(
+            self.cleanup_filters_frame,
+            variable=self.cleanup_attachments
+        )
+        self.bind_text(self.cleanup_attachments_check, 'cleanup_attachments')
+        self.cleanup_attachments_check.grid(row=3, column=0, columnspan=4, sticky="w", padx=5, pady=2)
+        self.cleanup_filters_frame.columnconfigure(1, weight=1)
+        self.cleanup_filters_frame.columnconfigure(3, weight=1)
+        
+    def setup_stats_tab(self):
+        self.stats_summary = tk.StringVar()
+        ttk.Label(self.stats_tab, textvariable=self.stats_summary, anchor="w").pack(fill="x", padx=10, pady=5)
+        
+        columns = ('operation', 'count', 'failures', 'p50', 'p99')
+        self.stats_tree = ttk.Treeview(self.stats_tab, columns=columns, show="headings", height=8)
+        for column in columns:
+            self.bind_text(lambda text, column=column: self.stats_tree.heading(column, text=text), f'stats_{column}')
+            self.stats_tree.column(column, width=160 if column == 'operation' else 70,
+                                   anchor="w" if column == 'operation' else "e")
+        self.stats_tree.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        columns = ('shard', 'state', 'latency', 'guilds')
+        self.shards_tree = ttk.Treeview(self.stats_tab, columns=columns, show="headings", height=4)
+        for column in columns:
+            self.bind_text(lambda text, column=column: self.shards_tree.heading(column, text=text), f'stats_{column}')
+            self.shards_tree.column(column, width=90, anchor="e")
+        self.shards_tree.pack(fill="x", padx=10, pady=5)
+        self.update_stats()
+        
+    def update_stats(self, reschedule=True):
+        """Refresh the stats tab every second while it is shown"""
+        if reschedule:
+            self.root.after(1000, self.update_stats)
+        if self.notebook.select() != str(self.stats_tab) and reschedule:
+            return
+        snapshot = self.bot.metrics.snapshot() if self.bot else None
+        if snapshot is None:
+            self.stats_summary.set(self.catalog.format('stats_summary', '—', '—', 0, 0.0))
+            return
+            
+        def ms(seconds):
+            return f"{seconds * 1000:.0f} ms" if seconds is not None else '—'
+            
+        rate_limited = snapshot['rate_limited'].values()
+        self.stats_summary.set(self.catalog.format(
+            'stats_summary',
+            ms(snapshot['gateway_latency_s']),
+            ms(snapshot['loop_lag_s']),
+            sum(route['count'] for route in rate_limited),
+            sum(route['retry_after_s'] for route in rate_limited),
+        ))
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for name, operation in snapshot['operations'].items():
+            self.stats_tree.insert("", "end", values=(
+                name, operation['count'], operation['failure'], ms(operation['p50']), ms(operation['p99'])
+            ))
+        self.shards_tree.delete(*self.shards_tree.get_children())
+        for shard in self.bot.shard_status():
+            latency = shard['latency_ms']
+            self.shards_tree.insert("", "end", values=(
+                shard['id'],
+                self._('shard_connected' if shard['connected'] else 'shard_disconnected'),
+                f"{latency:.0f} ms" if latency is not None else '—',
+                shard['guilds'],
+            ))
+        
+    def setup_responses_tab(self):
+        columns = ('trigger', 'kind', 'response')
+        self.responses_tree = ttk.Treeview(self.responses_tab, columns=columns, show="headings", height=8)
+        for column in columns:
+            self.bind_text(lambda text, column=column: self.responses_tree.heading(column, text=text), f'responses_{column}')
+            self.responses_tree.column(column, width=70 if column == 'kind' else 180)
+        self.responses_tree.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        form_frame = ttk.Frame(self.responses_tab, padding=5)
+        form_frame.pack(fill="x", padx=10, pady=5)
+        
+        self.response_trigger_label = self.bind_text(ttk.Label(form_frame), 'responses_trigger')
+        self.response_trigger_label.pack(side="left", padx=2)
+        self.response_trigger_var = tk.StringVar()
+        ttk.Entry(form_frame, textvariable=self.response_trigger_var, width=15).pack(side="left", padx=2)
+        
+        self.response_kind_var = tk.StringVar(value=KEYWORD)
+        ttk.Combobox(
+            form_frame,
+            textvariable=self.response_kind_var,
+            values=[KEYWORD, REGEX],
+            state="readonly",
+            width=8
+        ).pack(side="left", padx=2)
+        
+        self.response_text_label = self.bind_text(ttk.Label(form_frame), 'responses_response')
+        self.response_text_label.pack(side="left", padx=2)
+        self.response_text_var = tk.StringVar()
+        ttk.Entry(form_frame, textvariable=self.response_text_var).pack(side="left", fill="x", expand=True, padx=2)
+        
+        buttons_frame = ttk.Frame(self.responses_tab)
+        buttons_frame.pack(fill="x", padx=10, pady=(0, 5))
+        
+        self.add_response_btn = self.bind_text(ttk.Button(buttons_frame, command=self.add_response), 'add_response')
+        self.add_response_btn.pack(side="left", padx=5)
+        
+        self.remove_response_btn = ttk.Button(
+            buttons_frame,
+            command=self.remove_response,
+            style="Warning.TButton"
+        )
+        self.bind_text(self.remove_response_btn, 'remove_response')
+        self.remove_response_btn.pack(side="left", padx=5)
+        self.refresh_responses()
+        
+    def refresh_responses(self):
+        self.responses_tree.delete(*self.responses_tree.get_children())
+        for rule in self.responder.rules:
+            self.responses_tree.insert("", "end", iid=str(rule.id), values=(rule.trigger, rule.kind, rule.response))
+            
+    def add_response(self):
+        trigger = self.response_trigger_var.get().strip()
+        response = self.response_text_var.get().strip()
+        if not trigger or not response:
+            messagebox.showerror(self._('error'), self._('response_fields_required'))
+            return
+        try:
+            rule = Rule(trigger, response, self.response_kind_var.get())
+        except re.error as e:
+            messagebox.showerror(self._('error'), self.catalog.format('invalid_regex', e))
+            return
+        except ValueError as e:
+            messagebox.showerror(self._('error'), self.catalog.format('invalid_response', e))
+            return
+        self.responder.add_rule(rule)
+        self.save_responses()
+        self.response_trigger_var.set("")
+        self.response_text_var.set("")
+        
+    def remove_response(self):
+        selection = self.responses_tree.selection()
+        if not selection:
+            messagebox.showerror(self._('error'), self._('select_response'))
+            return
+        for item in selection:
+            self.responder.remove_rule(int(item))
+        self.save_responses()
+        
+    def save_responses(self):
+        try:
+            self.responder.save()
+        except OSError as e:
+            messagebox.showerror(self._('error'), self.catalog.format('responses_save_failed', e))
+        self.settings_watcher.rules_saved()
+        self.refresh_responses()
+        
+    def setup_schedule_tab(self):
+        columns = ('next_run', 'schedule', 'channel', 'message')
+        self.schedule_tree = ttk.Treeview(self.schedule_tab, columns=columns, show="headings", height=7)
+        for column in columns:
+            self.bind_text(lambda text, column=column: self.schedule_tree.heading(column, text=text), f'schedule_{column}')
+            self.schedule_tree.column(column, width=200 if column == 'message' else 110)
+        self.schedule_tree.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        when_frame = ttk.Frame(self.schedule_tab, padding=5)
+        when_frame.pack(fill="x", padx=10)
+        
+        self.schedule_channel_label = self.bind_text(ttk.Label(when_frame), 'channel_id')
+        self.schedule_channel_label.pack(side="left", padx=2)
+        self.schedule_channel_var = tk.StringVar(value=str(self.default_channel_id or ""))
+        ttk.Entry(when_frame, textvariable=self.schedule_channel_var, width=20).pack(side="left", padx=2)
+        
+        self.schedule_kind_var = tk.StringVar(value=ONCE)
+        ttk.Combobox(
+            when_frame,
+            textvariable=self.schedule_kind_var,
+            values=list(KINDS),
+            state="readonly",
+            width=8
+        ).pack(side="left", padx=2)
+        
+        # 'YYYY-MM-DD HH:MM', a duration such as 30m or 1d, or a cron expression
+        self.schedule_spec_var = tk.StringVar()
+        ttk.Entry(when_frame, textvariable=self.schedule_spec_var, width=16).pack(side="left", fill="x", expand=True, padx=2)
+        
+        self.schedule_missed_label = self.bind_text(ttk.Label(when_frame), 'schedule_missed')
+        self.schedule_missed_label.pack(side="left", padx=2)
+        self.schedule_missed_var = tk.StringVar(value=MISSED_ONCE)
+        ttk.Combobox(
+            when_frame,
+            textvariable=self.schedule_missed_var,
+            values=list(MISSED_POLICIES),
+            state="readonly",
+            width=5
+        ).pack(side="left", padx=2)
+        
+        what_frame = ttk.Frame(self.schedule_tab, padding=5)
+        what_frame.pack(fill="x", padx=10)
+        
+        self.schedule_message_label = self.bind_text(ttk.Label(what_frame), 'message')
+        self.schedule_message_label.pack(side="left", padx=2)
+        self.schedule_message_var = tk.StringVar()
+        ttk.Entry(what_frame, textvariable=self.schedule_message_var).pack(side="left", fill="x", expand=True, padx=2)
+        
+        self.schedule_image_path = tk.StringVar()
+        ttk.Entry(what_frame, textvariable=self.schedule_image_path, state="readonly", width=12).pack(side="left", padx=2)
+        self.browse_schedule_image_btn = ttk.Button(
+            what_frame,
+            command=lambda: self.browse_image(self.schedule_image_path)
+        )
+        self.bind_text(self.browse_schedule_image_btn, 'browse')
+        self.browse_schedule_image_btn.pack(side="left", padx=2)
+        
+        buttons_frame = ttk.Frame(self.schedule_tab)
+        buttons_frame.pack(fill="x", padx=10, pady=(0, 5))
+        
+        self.add_job_btn = self.bind_text(ttk.Button(buttons_frame, command=self.add_job), 'add_job')
+        self.add_job_btn.pack(side="left", padx=5)
+        
+        self.remove_job_btn = ttk.Button(
+            buttons_frame,
+            command=self.remove_job,
+            style="Warning.TButton"
+        )
+        self.bind_text(self.remove_job_btn, 'remove_job')
+        self.remove_job_btn.pack(side="left", padx=5)
+        self.refresh_schedule()
+        
+    def refresh_schedule(self, reschedule=True):
+        """Refresh the schedule tab every five seconds while it is shown"""
+        if reschedule:
+            self.root.after(5000, self.refresh_schedule)
+        if self.notebook.select() != str(self.schedule_tab) and reschedule:
+            return
+        self.schedule_tree.delete(*self.schedule_tree.get_children())
+        # A Treeview slows down with tens of thousands of rows, show the next ones only
+        for job in self.scheduler.jobs[:SCHEDULE_ROWS]:
+            self.schedule_tree.insert("", "end", iid=str(job.id), values=(
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(job.next_run)),
+                job.describe(),
+                job.channel_id,
+                job.message or job.image_path,
+            ))
+            
+    def add_job(self):
+        channel_id = self.schedule_channel_var.get().strip()
+        message = self.schedule_message_var.get().strip() or None
+        image_path = self.schedule_image_path.get() or None
+        if not channel_id.isdigit():
+            messagebox.showerror(self._('error'), self.catalog.format('invalid_channel_id', channel_id))
+            return
+        if not message and not image_path:
+            messagebox.showerror(self._('error'), self._('enter_message'))
+            return
+        kind = self.schedule_kind_var.get()
+        try:
+            spec = parse_spec(kind, self.schedule_spec_var.get())
+            self.scheduler.add_job(int(channel_id), kind, spec, message, image_path, self.schedule_missed_var.get())
+        except ValueError as e:
+            messagebox.showerror(self._('error'), self.catalog.format('invalid_schedule', e))
+            return
+        self.schedule_spec_var.set("")
+        self.schedule_message_var.set("")
+        self.schedule_image_path.set("")
+        self.refresh_schedule(reschedule=False)
+        
+    def remove_job(self):
+        selection = self.schedule_tree.selection()
+        if not selection:
+            messagebox.showerror(self._('error'), self._('select_job'))
+            return
+        for item in selection:
+            self.scheduler.remove_job(int(item))
+        self.refresh_schedule(reschedule=False)
+        
+    def setup_feed_tab(self):
+        options_frame = ttk.Frame(self.feed_tab, padding=5)
+        options_frame.pack(fill="x", padx=10)
+        
+        # Only show the channels entered in the messages tab
+        self.feed_filter_var = tk.BooleanVar(value=True)
+        self.feed_filter_check = ttk.Checkbutton(
+            options_frame,
+            variable=self.feed_filter_var,
+            command=self.reset_feed
+        )
+        self.bind_text(self.feed_filter_check, 'feed_filter')
+        self.feed_filter_check.pack(side="left", padx=5)
+        
+        self.clear_feed_btn = self.bind_text(ttk.Button(options_frame, command=self.clear_feed), 'clear_feed')
+        self.clear_feed_btn.pack(side="left", padx=5)
+        
+        feed_frame = ttk.Frame(self.feed_tab)
+        feed_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        self.feed_text = tk.Text(feed_frame, height=12, wrap="word", state="disabled")
+        scrollbar = ttk.Scrollbar(feed_frame, command=self.feed_text.yview)
+        self.feed_text.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.feed_text.pack(side="left", fill="both", expand=True)
+        
+        self.feed_seq = 0
+        self.feed_channels = None
+        self.update_feed()
+        
+    def feed_channel_filter(self):
+        """Channel IDs typed in the messages tab, None to show every channel"""
+        if not self.feed_filter_var.get():
+            return None
+        channel_ids = re.split(r'[\s,;]+', self.channel_id.get("1.0", tk.END))
+        return {int(c) for c in channel_ids if c.isdigit()} or None
+        
+    def update_feed(self):
+        """
+        Add the messages received since the last call to the feed, every
+        FEED_INTERVAL ms while the tab is shown: one insert per batch however
+        many messages arrived
+        """
+        self.root.after(FEED_INTERVAL, self.update_feed)
+        if self.bot is None or self.notebook.select() != str(self.feed_tab):
+            return
+        channels = self.feed_channel_filter()
+        if channels != self.feed_channels:
+            # Filter changed: redraw from what the buffer still holds
+            self.feed_channels = channels
+            self.reset_feed()
+            return
+        entries, self.feed_seq = self.bot.feed.since(self.feed_seq, channels, FEED_LINES)
+        if not entries:
+            return
+        lines = "".join(
+            f"[{time.strftime('%H:%M:%S', time.localtime(entry.timestamp))}] #{entry.channel}  "
+            f"{entry.author}: {entry.content}\n"
+            for entry in entries
+        )
+        # Stay at the bottom only if the user has not scrolled up
+        following = self.feed_text.yview()[1] >= 0.999
+        self.feed_text.config(state="normal")
+        self.feed_text.insert(tk.END, lines)
+        extra = int(self.feed_text.index('end-1c').split('.')[0]) - 1 - FEED_LINES
+        if extra > 0:
+            self.feed_text.delete("1.0", f"{extra + 1}.0")
+        self.feed_text.config(state="disabled")
+        if following:
+            self.feed_text.see(tk.END)
+            
+    def reset_feed(self):
+        self.feed_seq = 0
+        self.feed_text.config(state="normal")
+        self.feed_text.delete("1.0", tk.END)
+        self.feed_text.config(state="disabled")
+        
+    def clear_feed(self):
+        if self.bot is not None:
+            self.bot.feed.clear()
+        self.reset_feed()
+        
     def browse_avatar(self):
         file_path = filedialog.askopenfilename(
             title=self._('select_avatar'),
@@ -268,7 +746,7 @@ class BotGUI:
             self.avatar_path.set(file_path)
             
     def change_avatar(self):
-        if not self.bot.is_running():
+        if not self.bot_running():
             messagebox.showerror(self._('error'), self._('bot_must_run'))
             return
             
@@ -277,13 +755,22 @@ class BotGUI:
             messagebox.showerror(self._('error'), self._('select_image'))
             return
             
-        asyncio.run_coroutine_threadsafe(
-            self.bot.change_avatar(avatar_path),
-            self.bot.bot.loop
-        )
-        messagebox.showinfo(self._('success'), self._('avatar_changed'))
+        def on_done(result):
+            outcome = result.get('outcome') if isinstance(result, dict) else None
+            if outcome == CHANGED:
+                messagebox.showinfo(self._('success'), self._('avatar_changed'))
+            elif outcome == UNCHANGED:
+                messagebox.showinfo(self._('success'), self._('avatar_unchanged'))
+            elif outcome == RATE_LIMITED:
+                minutes = max(1, round(result['retry_after'] / 60))
+                messagebox.showerror(self._('error'), self.catalog.format('avatar_rate_limited', minutes))
+            else:
+                messagebox.showerror(self._('error'), self._('avatar_change_failed'))
+                
+        future = self.submit(lambda: self.bot.change_avatar(avatar_path), route='avatar', coalesce_key='avatar')
+        self.track(self.change_avatar_btn, 'change_avatar', future, on_done)
         
-    def browse_image(self):
+    def browse_image(self, target):
         file_path = filedialog.askopenfilename(
             title=self._('select_image'),
             filetypes=[
@@ -292,115 +779,295 @@ class BotGUI:
             ]
         )
         if file_path:
-            self.image_path.set(file_path)
+            target.set(file_path)
+            
+    def browse_images(self):
+        file_paths = filedialog.askopenfilenames(
+            title=self._('select_image'),
+            filetypes=[
+                ("Images", "*.png *.jpg *.jpeg *.gif"),
+                ("Tous les fichiers", "*.*")
+            ]
+        )
+        if file_paths:
+            self.image_paths = list(file_paths)
+            self.image_path.set(file_paths[0] if len(file_paths) == 1
+                                else "; ".join(os.path.basename(path) for path in file_paths))
             
     def toggle_bot(self):
-        if not self.bot.is_running():
+        if not self.bot_running():
             self.start_bot()
         else:
             self.stop_bot()
             
     def start_bot(self):
-        self.bot_thread = threading.Thread(target=self.run_bot_async)
-        self.bot_thread.start()
-        self.start_stop_btn.config(text=self._('stop_bot'))
-        self.send_btn.config(state="normal")
-        self.send_image_btn.config(state="normal")
-        self.force_stop_btn.config(state="normal")
-        self.cleanup_btn.config(state="normal")
+        profiler.mark('bot_start')
+        ready = self.get_bot().start(self.settings_watcher.settings['token'])
+        self.set_running_state(True)
+        
+        def on_done(started):
+            if started is not True:
+                self.set_running_state(False)
+                messagebox.showerror(self._('error'), self._('start_failed'))
+                
+        self.track(self.start_stop_btn, 'stop_bot', ready, on_done)
         
     def stop_bot(self):
-        if self.bot_thread and self.bot.is_running():
-            asyncio.run(self.bot.stop_bot())
-            self.bot_thread.join()
-            self.start_stop_btn.config(text=self._('start_bot'))
-            self.send_btn.config(state="disabled")
-            self.send_image_btn.config(state="disabled")
-            self.force_stop_btn.config(state="disabled")
-            self.cleanup_btn.config(state="disabled")
+        if not self.bot_running():
+            return
+            
+        try:
+            # Keep the session so the next start resumes it
+            future = self.bot.run_threadsafe(self.bot.stop_bot(keep_session=True))
+        except RuntimeError:
+            self.set_running_state(False)
+            return
+        self.track(self.start_stop_btn, 'start_bot', future, lambda result: self.set_running_state(False))
+        
+    def restart_bot(self):
+        if not self.bot_running():
+            return
+            
+        def on_done(latency):
+            if latency is None:
+                self.set_running_state(self.bot_running())
+                messagebox.showerror(self._('error'), self._('restart_failed'))
+                
+        try:
+            future = self.bot.run_threadsafe(self.bot.restart(self.settings_watcher.settings['token']))
+        except RuntimeError:
+            return
+        self.track(self.restart_btn, 'restart_bot', future, on_done)
             
     def force_stop_bot(self):
-        if not self.bot.is_running():
+        if not self.bot_running():
             return
             
-        if messagebox.askyesno(self._('confirmation'), self._('confirm_force_stop')):
-            asyncio.run_coroutine_threadsafe(
-                self.bot.force_stop_bot(),
-                self.bot.bot.loop
-            )
-            if self.bot_thread:
-                self.bot_thread.join(timeout=2)  # Wait for up to 2 seconds
-            self.start_stop_btn.config(text=self._('start_bot'))
-            self.send_btn.config(state="disabled")
-            self.send_image_btn.config(state="disabled")
-            self.force_stop_btn.config(state="disabled")
-            self.cleanup_btn.config(state="disabled")
-            messagebox.showinfo(self._('success'), self._('bot_force_stopped'))
-        
-    def run_bot_async(self):
-        asyncio.run(self.bot.start_bot(TOKEN))
+        if messagebox.askyesno(self._('confirmation'), self._('force_stop_confirm')):
+            def on_done(result):
+                self.set_running_state(False)
+                messagebox.showinfo(self._('success'), self._('force_stop_success'))
+                
+            try:
+                future = self.bot.run_threadsafe(self.bot.force_stop_bot())
+            except RuntimeError:
+                self.set_running_state(False)
+                return
+            self.track(self.force_stop_btn, 'force_stop', future, on_done)
         
-    def send_message(self):
-        channel_id = self.channel_id.get().strip()
-        message = self.message_text.get("1.0", tk.END).strip()
+    def set_running_state(self, running):
+        """Update the controls for a started or stopped bot"""
+        state = "normal" if running else "disabled"
+        self.start_stop_btn.config(text=self._('stop_bot') if running else self._('start_bot'))
+        self.send_btn.config(state=state)
+        self.send_image_btn.config(state=state)
+        self.restart_btn.config(state=state)
+        self.force_stop_btn.config(state=state)
+        self.cleanup_btn.config(state=state)
+        
+    def track(self, button, text_key, future, on_done=None):
+        """
+        Show a button as pending until its operation completes, then report the
+        outcome and latency in the status bar. Runs on_done(result) on the Tk thread.
+        :param button: Button that started the operation
+        :param text_key: Translation key of the button text once the operation completes
+        :param future: concurrent.futures.Future of the operation, None if it was not started
+        :param on_done: Optional callback receiving the operation's result
+        """
+        if future is None:
+            return
+        button.config(state="disabled", text=self._(text_key) + " …")
+        self.operation_status.set(self.catalog.format('operation_pending', self._(text_key)))
         
-        if not channel_id:
+        def done(completed, latency):
+            needs_bot = button in (
+                self.send_btn, self.send_image_btn, self.restart_btn, self.force_stop_btn, self.cleanup_btn
+            )
+            state = "disabled" if needs_bot and not self.bot_running() else "normal"
+            button.config(state=state, text=self._(text_key))
+            if completed.cancelled():
+                result = None
+            elif completed.exception():
+                result = completed.exception()
+            else:
+                result = completed.result()
+            failed = result is False or result is None or isinstance(result, Exception)
+            if isinstance(result, dict) and result.get('ok') is False:
+                failed = True
+            if isinstance(result, dict) and result and all(isinstance(v, bool) for v in result.values()):
+                # Broadcast: per-channel outcome
+                outcome = self.catalog.format('operation_partial', sum(result.values()), len(result))
+            else:
+                outcome = self._('failed') if failed else self._('ok')
+            self.operation_status.set(
+                self.catalog.format('operation_done', self._(text_key), outcome, latency * 1000)
+            )
+            if on_done:
+                on_done(result)
+                
+        self.bridge.watch(future, done)
+        
+    def get_channel_ids(self):
+        """
+        Read the channel IDs entered by the user
+        :return: List of channel IDs, or None if none or an invalid one was entered (an error is shown)
+        """
+        channel_ids = [c for c in re.split(r'[\s,;]+', self.channel_id.get("1.0", tk.END)) if c]
+        if not channel_ids:
             messagebox.showerror(self._('error'), self._('enter_channel_id'))
+            return None
+            
+        invalid = [c for c in channel_ids if not c.isdigit()]
+        if invalid:
+            messagebox.showerror(self._('error'), self.catalog.format('invalid_channel_id', ', '.join(invalid)))
+            return None
+        return channel_ids
+        
+    def submit(self, factory, route=None, priority=PRIORITY_NORMAL, coalesce_key=None):
+        """
+        Queue a bot operation on the outbound dispatcher
+        :return: Future of the operation, or None if it could not be queued (an error is shown)
+        """
+        try:
+            return self.bot.enqueue(factory, route, priority, coalesce_key)
+        except asyncio.QueueFull:
+            messagebox.showerror(self._('error'), self._('queue_full'))
+        except RuntimeError:
+            messagebox.showerror(self._('error'), self._('bot_must_run'))
+        return None
+        
+    def watch_settings(self):
+        """Apply the changes made to the settings file, checked every POLL_INTERVAL"""
+        try:
+            changes = self.settings_watcher.poll()
+            if changes:
+                self.apply_settings(changes)
+        finally:
+            self.root.after(int(POLL_INTERVAL * 1000), self.watch_settings)
+            
+    def apply_settings(self, changes):
+        """
+        Apply reloaded settings to the interface and hand the bot's to the bot
+        :param changes: {setting name: new value} from SettingsWatcher.poll()
+        """
+        if 'language' in changes:
+            self.language_var.set(changes['language'])
+            self.change_language()
+        if 'default_channel_id' in changes:
+            # Channels the user typed in are left alone
+            previous = str(self.default_channel_id or "")
+            new = str(changes['default_channel_id'] or "")
+            if self.channel_id.get("1.0", tk.END).strip() == previous:
+                self.channel_id.delete("1.0", tk.END)
+                self.channel_id.insert("1.0", new)
+            if self.schedule_channel_var.get().strip() == previous:
+                self.schedule_channel_var.set(new)
+            self.default_channel_id = changes['default_channel_id']
+        if changes.get('presence'):
+            self.status_var.set(changes['presence']['status'])
+            self.activity_var.set(changes['presence']['activity'])
+        if 'autoresponses_path' in changes:
+            self.responder.path = changes['autoresponses_path']
+            try:
+                if os.path.exists(self.responder.path):
+                    self.responder.load()
+            except (OSError, ValueError) as e:
+                print(f"Error reloading auto-responses: {e}")
+            self.refresh_responses()
+            
+        # The bot shares the GUI's responder, already reloaded
+        bot_changes = {name: value for name, value in changes.items() if name != 'autoresponses_path'}
+        reconnect = self.bot_running() and not RECONNECT.isdisjoint(changes)
+        if self.bot is not None and bot_changes:
+            if self.bot_running():
+                self.bot.loop.call_soon_threadsafe(self.bot.apply_settings, bot_changes)
+            else:
+                self.bot.apply_settings(bot_changes)
+        key = 'settings_reconnecting' if reconnect else 'settings_reloaded'
+        self.operation_status.set(self.catalog.format(key, ', '.join(sorted(changes))))
+        
+    def update_queue_depth(self):
+        """Refresh the outbound queue depth label every half second"""
+        self.queue_label.config(text=self.catalog.format('queue_depth', self.bot.queue_depth() if self.bot else 0))
+        self.root.after(500, self.update_queue_depth)
+        
+    def send_message(self):
+        if not self.bot_running():
+            messagebox.showerror(self._('error'), self._('bot_must_run'))
             return
             
+        channel_ids = self.get_channel_ids()
+        if not channel_ids:
+            return
+            
+        message = self.message_text.get("1.0", tk.END).strip()
         if not message:
             messagebox.showerror(self._('error'), self._('enter_message'))
             return
             
-        asyncio.run_coroutine_threadsafe(
-            self.bot.send_message(channel_id, message),
-            self.bot.bot.loop
-        )
+        if len(channel_ids) > 1:
+            future = self.submit(lambda: self.bot.broadcast_message(channel_ids, message), route='broadcast')
+        else:
+            future = self.submit(lambda: self.bot.send_message(channel_ids[0], message), route=('send', channel_ids[0]))
+        self.track(self.send_btn, 'send_message', future)
         
     def send_image(self):
-        if not self.bot.is_running():
+        if not self.bot_running():
             messagebox.showerror(self._('error'), self._('bot_must_run'))
             return
             
-        channel_id = self.channel_id.get().strip()
-        if not channel_id:
-            messagebox.showerror(self._('error'), self._('enter_channel_id'))
+        channel_ids = self.get_channel_ids()
+        if not channel_ids:
             return
             
-        image_path = self.image_path.get()
-        if not image_path:
+        image_paths = list(self.image_paths)
+        if not image_paths:
             messagebox.showerror(self._('error'), self._('select_image'))
             return
             
-        message = self.message_text.get("1.0", tk.END).strip()
+        message = self.message_text.get("1.0", tk.END).strip() or None
         
-        asyncio.run_coroutine_threadsafe(
-            self.bot.send_image(channel_id, image_path, message if message else None),
-            self.bot.bot.loop
-        )
+        if len(image_paths) > 1:
+            # As few messages as the attachment limits allow, per channel
+            if len(channel_ids) > 1:
+                future = self.submit(lambda: self.bot.broadcast_images(channel_ids, image_paths, message),
+                                     route='broadcast')
+            else:
+                future = self.submit(
+                    lambda: self.bot.send_images(channel_ids[0], image_paths, message),
+                    route=('send', channel_ids[0])
+                )
+            self.track(self.send_image_btn, 'send_image', future)
+            return
+            
+        image_path = image_paths[0]
+        if len(channel_ids) > 1:
+            future = self.submit(lambda: self.bot.broadcast_image(channel_ids, image_path, message), route='broadcast')
+        else:
+            future = self.submit(
+                lambda: self.bot.send_image(channel_ids[0], image_path, message),
+                route=('send', channel_ids[0])
+            )
+        self.track(self.send_image_btn, 'send_image', future)
         
     def update_presence(self):
-        if not self.bot.is_running():
+        if not self.bot_running():
             messagebox.showerror(self._('error'), self._('bot_must_run'))
             return
             
         status = self.status_var.get()
         activity = self.activity_var.get().strip()
         
-        asyncio.run_coroutine_threadsafe(
-            self.bot.change_presence(status, activity),
-            self.bot.bot.loop
-        )
-        messagebox.showinfo(self._('success'), self._('presence_updated'))
+        future = self.submit(lambda: self.bot.change_presence(status, activity), route='presence', coalesce_key='presence')
+        self.track(self.update_presence_btn, 'update_presence', future)
         
     def delete_messages(self):
-        if not self.bot.is_running():
+        if not self.bot_running():
             messagebox.showerror(self._('error'), self._('bot_must_run'))
             return
             
-        channel_id = self.channel_id.get().strip()
-        if not channel_id:
-            messagebox.showerror(self._('error'), self._('enter_channel_id'))
+        channel_ids = self.get_channel_ids()
+        if not channel_ids:
             return
             
         try:
@@ -408,18 +1075,95 @@ class BotGUI:
         except ValueError:
             messagebox.showerror(self._('error'), self._('invalid_limit'))
             return
+        message_filter = self.get_cleanup_filter()
+        if message_filter is None:
+            return
             
-        if messagebox.askyesno(self._('confirmation'), self._('confirm_delete').format(limit)):
-            async def delete_and_show_result():
-                deleted = await self.bot.delete_bot_messages(channel_id, limit)
-                messagebox.showinfo(self._('success'), self._('messages_deleted').format(deleted))
-                
-            asyncio.run_coroutine_threadsafe(
-                delete_and_show_result(),
-                self.bot.bot.loop
+        if limit:
+            confirmed = messagebox.askyesno(self._('confirmation'), self.catalog.format('confirm_delete', limit))
+        else:
+            confirmed = messagebox.askyesno(self._('confirmation'), self._('confirm_delete_all'))
+        if not confirmed:
+            return
+            
+        self.cleanup_cancel.clear()
+        # Deleted and scanned in the channels already cleaned
+        totals = {'total': 0, 'scanned': 0}
+        
+        def show_progress(deleted, scanned):
+            self.operation_status.set(self.catalog.format('cleanup_progress', deleted, scanned))
+            
+        def progress(result):
+            # On the bot's loop, shown on the Tk thread
+            self.bridge.post(show_progress, totals['total'] + result['total'], totals['scanned'] + result['scanned'])
+            
+        async def delete_all():
+            cancelled = False
+            for channel_id in channel_ids:
+                result = await self.bot.delete_bot_messages(
+                    channel_id, limit or None, message_filter=message_filter, progress=progress,
+                    cancel=self.cleanup_cancel
+                )
+                totals['total'] += result['total']
+                totals['scanned'] += result['scanned']
+                if result['cancelled']:
+                    cancelled = True
+                    break
+            return {'deleted': totals['total'], 'cancelled': cancelled}
+            
+        def on_done(result):
+            self.cancel_cleanup_btn.config(state="disabled")
+            if isinstance(result, dict):
+                key = 'cleanup_cancelled' if result['cancelled'] else 'messages_deleted'
+                messagebox.showinfo(self._('success'), self.catalog.format(key, result['deleted']))
+                    
+        future = self.submit(delete_all, route='cleanup', priority=PRIORITY_LOW)
+        if future is not None:
+            self.cancel_cleanup_btn.config(state="normal")
+        self.track(self.cleanup_btn, 'clean_messages', future, on_done)
+        
+    def get_cleanup_filter(self):
+        """
+        Read the cleanup filters of the settings tab
+        :return: cleanup.CleanupFilter, or None if a filter is invalid (an error is shown)
+        """
+        # Only imported once the bot runs, as it needs discord.py
+        from cleanup import CleanupFilter
+        
+        dates = []
+        for value in (self.cleanup_after.get().strip(), self.cleanup_before.get().strip()):
+            try:
+                dates.append(datetime.datetime.strptime(value, "%Y-%m-%d") if value else None)
+            except ValueError:
+                messagebox.showerror(self._('error'), self.catalog.format('invalid_date', value))
+                return None
+        author_ids = [a for a in re.split(r'[\s,;]+', self.cleanup_authors.get()) if a]
+        invalid = [a for a in author_ids if not a.isdigit()]
+        if invalid:
+            messagebox.showerror(self._('error'), self.catalog.format('invalid_author_id', ', '.join(invalid)))
+            return None
+        try:
+            return CleanupFilter(
+                dates[0], dates[1], self.cleanup_pattern.get() or None, self.cleanup_attachments.get(),
+                author_ids or None
             )
+        except re.error as e:
+            messagebox.showerror(self._('error'), self.catalog.format('invalid_regex', e))
+            return None
+        
+    def on_close(self):
+        """Stop the bot without blocking the window, then close it"""
+        if not self.bot_running():
+            self.root.destroy()
+            return
+        try:
+            future = self.bot.run_threadsafe(self.bot.stop_bot())
+        except RuntimeError:
+            self.root.destroy()
+            return
+        self.bridge.watch(future, lambda completed, latency: self.root.destroy())
+        # Do not wait forever on a bot that does not stop
+        self.root.after(5000, self.root.destroy)
         
     def run(self):
-        self.root.mainloop()
-        if self.bot.is_running():
-            self.stop_bot()
\ No newline at end of file
+        self.root.mainloop()
\ No newline at end of file
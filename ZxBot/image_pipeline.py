@@ -0,0 +1,309 @@
+import asyncio
+import collections
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+import discord
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, oversized images are rejected without it
+    Image = ImageOps = None
+
+# Upload limit used when the channel does not tell us its guild's limit
+DEFAULT_UPLOAD_LIMIT = 25 * 1024 * 1024
+# How long a CDN URL is reused when it carries no expiry of its own
+DEFAULT_URL_TTL = 12 * 3600
+# Keep a margin before the expiry Discord signs into attachment URLs
+URL_EXPIRY_MARGIN = 600
+# Attempts at shrinking an oversized image before giving up
+MAX_SHRINK_ATTEMPTS = 5
+# Discord's limit on the number of files attached to one message
+MAX_ATTACHMENTS = 10
+# Images are hashed in blocks of this size instead of being read whole
+HASH_BLOCK_SIZE = 1024 * 1024
+# Avatars are cropped square and scaled down to this many pixels a side
+AVATAR_SIZE = 512
+# Discord's limit on the size of an avatar image
+MAX_AVATAR_BYTES = 10 * 1024 * 1024
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class PreparedImage:
+    """
+    An image ready to be sent: the file it is streamed from, its bytes once
+    shrunk, or the CDN URL of a previous upload of the same content
+    """
+    def __init__(self, digest, filename, data=None, url=None, path=None, size=None):
+        self.digest = digest
+        self.filename = filename
+        self.data = data
+        self.url = url
+        self.path = path
+        self.size = len(data) if data is not None else size
+        
+    def to_file(self):
+        """
+        Build a new discord.File, one per send. From a path the file is
+        streamed by the upload rather than loaded in memory.
+        """
+        if self.data is None:
+            return discord.File(self.path, filename=self.filename)
+        return discord.File(io.BytesIO(self.data), filename=self.filename)
+
+
+class ImagePipeline:
+    """
+    Reads, hashes and shrinks images in a thread pool so large files never
+    block the event loop, and remembers the CDN URL of each uploaded content
+    so the same image can be sent again by reference
+    """
+    def __init__(self, max_workers=2, cache_size=512):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='zxbot-image')
+        self._lock = threading.Lock()
+        self._cache_size = cache_size
+        self._urls = collections.OrderedDict()  # digest -> (url, expires_at, (channel_id, message_id))
+        self._owners = {}  # (channel_id, message_id) -> digests whose URL is an attachment of that message
+        self._digests = collections.OrderedDict()  # (path, size, mtime) -> digest
+        
+    async def prepare(self, image_path, max_size=DEFAULT_UPLOAD_LIMIT, reuse=True, stream=True):
+        """
+        Load an image without blocking the loop
+        :param image_path: Path to the image file
+        :param max_size: Upload limit in bytes, larger images are shrunk if Pillow is installed
+        :param reuse: Return the CDN URL of a previous upload of the same content when known
+        :param stream: Stream the file from disk on each upload; False reads it once into memory,
+                       for an image uploaded to several channels
+        :return: PreparedImage
+        :raises ImageTooLarge: if the image cannot be brought under max_size
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._prepare, image_path, max_size, reuse, stream)
+        
+    async def prepare_avatar(self, image_path, size=AVATAR_SIZE):
+        """
+        Crop, scale down and encode an avatar without blocking the loop
+        :param image_path: Path to the image file
+        :param size: Side of the square avatar in pixels
+        :return: (image bytes, content hash of those bytes)
+        :raises ImageTooLarge: if the image is over Discord's avatar limit and cannot be scaled down
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _encode_avatar, image_path, size)
+        
+    def cached_url(self, digest):
+        with self._lock:
+            entry = self._urls.get(digest)
+            if entry is None:
+                return None
+            url, expires_at, owner = entry
+            if expires_at <= time.time():
+                self._drop(digest)
+                return None
+            self._urls.move_to_end(digest)
+            return url
+            
+    def remember(self, digest, message, index=0):
+        """
+        Record the CDN URL of an attachment of a sent message
+        :param digest: Content hash of the uploaded image
+        :param message: discord.Message returned by the send
+        :param index: Position of the image among the message's attachments
+        """
+        if len(message.attachments) <= index:
+            return
+        url = message.attachments[index].url
+        owner = (message.channel.id, message.id)
+        with self._lock:
+            self._drop(digest)
+            self._urls[digest] = (url, _url_expiry(url), owner)
+            self._owners.setdefault(owner, set()).add(digest)
+            while len(self._urls) > self._cache_size:
+                self._drop(next(iter(self._urls)))
+                
+    def forget(self, digest):
+        with self._lock:
+            self._drop(digest)
+            
+    def forget_messages(self, channel_id, message_ids):
+        """
+        Forget the URLs of the attachments of deleted messages, Discord
+        removes a message's attachments with it
+        :param channel_id: Channel the messages were in
+        :param message_ids: IDs of the deleted messages
+        """
+        with self._lock:
+            for message_id in message_ids:
+                for digest in self._owners.pop((int(channel_id), int(message_id)), ()):
+                    self._urls.pop(digest, None)
+                    
+    def _drop(self, digest):
+        """Remove a digest's URL, with the lock held"""
+        entry = self._urls.pop(digest, None)
+        if entry is None:
+            return
+        digests = self._owners.get(entry[2])
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._owners[entry[2]]
+                
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        
+    def _prepare(self, image_path, max_size, reuse, stream):
+        filename = os.path.basename(image_path)
+        stat = os.stat(image_path)
+        key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest and reuse:
+            url = self.cached_url(digest)
+            if url:
+                return PreparedImage(digest, filename, url=url)
+                
+        data = None
+        if not stream or stat.st_size > max_size:
+            # Only images that have to be shrunk or are shared by several uploads are loaded in memory
+            with open(image_path, 'rb') as image:
+                data = image.read()
+        if digest is None:
+            digest = hashlib.sha256(data).hexdigest() if data is not None else _hash_file(image_path)
+            with self._lock:
+                self._digests[key] = digest
+                self._digests.move_to_end(key)
+                while len(self._digests) > self._cache_size:
+                    self._digests.popitem(last=False)
+            if reuse:
+                url = self.cached_url(digest)
+                if url:
+                    return PreparedImage(digest, filename, url=url)
+                    
+        if data is None:
+            return PreparedImage(digest, filename, path=image_path, size=stat.st_size)
+        if len(data) > max_size:
+            data, filename = _shrink(data, filename, max_size)
+        return PreparedImage(digest, filename, data=data)
+
+
+def pack_attachments(sizes, max_size, max_count=MAX_ATTACHMENTS):
+    """
+    Group files into as few messages as possible, each holding at most
+    max_count files totalling at most max_size bytes. Files keep their order
+    when that costs no extra message, otherwise the largest are placed first.
+    :param sizes: Size of each file in bytes
+    :return: List of lists of indexes into sizes, one list per message
+    :raises ImageTooLarge: if a single file is over max_size
+    """
+    for size in sizes:
+        if size > max_size:
+            raise ImageTooLarge(f"A {size} bytes file is over the {max_size} bytes limit")
+    if not sizes:
+        return []
+    # No packing can use fewer messages than this
+    lower_bound = max(-(-len(sizes) // max_count), -(-sum(sizes) // max_size))
+    
+    groups = [[]]
+    total = 0
+    for index, size in enumerate(sizes):
+        if len(groups[-1]) == max_count or total + size > max_size:
+            groups.append([])
+            total = 0
+        groups[-1].append(index)
+        total += size
+    if len(groups) == lower_bound:
+        return groups
+        
+    # First fit decreasing, then each message's files back in their order
+    bins = []  # [total size, indexes]
+    for index in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        for entry in bins:
+            if len(entry[1]) < max_count and entry[0] + sizes[index] <= max_size:
+                entry[0] += sizes[index]
+                entry[1].append(index)
+                break
+        else:
+            bins.append([sizes[index], [index]])
+    packed = sorted((sorted(indexes) for _, indexes in bins), key=lambda indexes: indexes[0])
+    return packed if len(packed) < len(groups) else groups
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as image:
+        for block in iter(lambda: image.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _shrink(data, filename, max_size):
+    """
+    Downscale and recompress an image until it fits in max_size
+    :return: (data, filename)
+    :raises ImageTooLarge: if Pillow is missing or the image cannot be shrunk enough
+    """
+    if Image is None:
+        raise ImageTooLarge(f"{filename} is {len(data)} bytes, over the {max_size} bytes limit (install Pillow to shrink it)")
+        
+    with Image.open(io.BytesIO(data)) as image:
+        if getattr(image, 'is_animated', False):
+            raise ImageTooLarge(f"{filename} is an animated image over the {max_size} bytes limit")
+        image.load()
+        fmt = image.format or 'PNG'
+        if fmt not in ('JPEG', 'PNG', 'WEBP'):
+            fmt = 'PNG'
+        for _ in range(MAX_SHRINK_ATTEMPTS):
+            # Pixel count scales roughly with encoded size
+            scale = min(0.9, (max_size / len(data)) ** 0.5 * 0.95)
+            size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+            image = image.resize(size, Image.LANCZOS)
+            buffer = io.BytesIO()
+            if fmt == 'JPEG':
+                image.convert('RGB').save(buffer, 'JPEG', quality=85, optimize=True)
+            else:
+                image.save(buffer, fmt, optimize=True)
+            data = buffer.getvalue()
+            if len(data) <= max_size:
+                return data, filename
+    raise ImageTooLarge(f"{filename} could not be shrunk under {max_size} bytes")
+
+
+def _encode_avatar(image_path, size):
+    with open(image_path, 'rb') as image:
+        data = image.read()
+    if Image is not None:
+        with Image.open(io.BytesIO(data)) as image:
+            # Animated avatars are uploaded as they are, re-encoding would drop the animation
+            if not getattr(image, 'is_animated', False):
+                image = ImageOps.exif_transpose(image)
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA')
+                side = min(image.width, image.height, size)
+                image = ImageOps.fit(image, (side, side), Image.LANCZOS)
+                buffer = io.BytesIO()
+                image.save(buffer, 'PNG', optimize=True)
+                data = buffer.getvalue()
+    if len(data) > MAX_AVATAR_BYTES:
+        raise ImageTooLarge(f"{os.path.basename(image_path)} is {len(data)} bytes, "
+                            f"over the {MAX_AVATAR_BYTES} bytes avatar limit")
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def _url_expiry(url):
+    """Expiry timestamp of a CDN URL, from its signed ex parameter when present"""
+    try:
+        expires = parse_qs(urlparse(url).query).get('ex')
+        if expires:
+            return int(expires[0], 16) - URL_EXPIRY_MARGIN
+    except ValueError:
+        pass
+    return time.time() + DEFAULT_URL_TTL
@@ -1,5 +1,71 @@
-from gui import BotGUI
+import time
+_started = time.perf_counter()
+
+import argparse
+
+from config import (TOKEN, MESSAGE_INDEX_PATH, INTENTS_PROFILE, CONTROL_HOST, CONTROL_PORT, CONTROL_API_KEY,
+                    METRICS_SNAPSHOT_PATH, SHARDED, SHARD_COUNT, SHARD_IDS, BOTS, AUTORESPONSES_PATH,
+                    AUTORESPONSE_COOLDOWNS, AUTORESPONSE_DEDUP_WINDOW, SCHEDULE_PATH,
+                    MESSAGE_LINGER, CONFIG_PATH)
+from startup_profile import profiler
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ZxBot")
+    parser.add_argument('--headless', action='store_true', help="Run without the GUI, controlled through a local JSON API")
+    parser.add_argument('--multi', action='store_true',
+                        help="Run every bot listed in config.BOTS, each in its own process, behind one control API")
+    parser.add_argument('--host', default=CONTROL_HOST, help="Control API host (headless mode)")
+    parser.add_argument('--port', type=int, default=CONTROL_PORT, help="Control API port (headless mode)")
+    parser.add_argument('--socket', help="Serve the control API on this Unix socket instead (headless mode)")
+    parser.add_argument('--api-key', default=CONTROL_API_KEY, help="Require this X-Api-Key header (headless mode)")
+    parser.add_argument('--sharded', action='store_true', default=SHARDED,
+                        help="Split the gateway connection into as many shards as Discord recommends")
+    parser.add_argument('--shard-count', type=int, default=SHARD_COUNT, help="Total number of shards across all processes")
+    parser.add_argument('--shard-ids', type=_shard_ids, default=SHARD_IDS,
+                        help="Comma separated shards run by this process, e.g. 0,1 (needs --shard-count)")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Print a time breakdown of imports, window creation, gateway connect, IDENTIFY and READY")
+    args = parser.parse_args()
+    if args.shard_ids is not None and args.shard_count is None:
+        parser.error("--shard-ids needs --shard-count")
+    return args
+
+def _shard_ids(value):
+    return [int(shard_id) for shard_id in value.split(',') if shard_id.strip()]
 
 if __name__ == "__main__":
-    app = BotGUI()
-    app.run()
\ No newline at end of file
+    args = parse_args()
+    if args.profile_startup:
+        profiler.enable(_started)
+    if args.multi:
+        import asyncio
+        from multibot import run_controller
+        try:
+            asyncio.run(run_controller(
+                BOTS or [{'name': 'main', 'token': TOKEN}], args.host, args.port, args.socket, args.api_key,
+                profile=INTENTS_PROFILE, sharded=args.sharded, shard_count=args.shard_count, shard_ids=args.shard_ids,
+                responses_path=AUTORESPONSES_PATH, cooldowns=AUTORESPONSE_COOLDOWNS,
+                dedup_window=AUTORESPONSE_DEDUP_WINDOW, linger=MESSAGE_LINGER
+            ))
+        except KeyboardInterrupt:
+            pass
+    elif args.headless:
+        import asyncio
+        from daemon import run_daemon
+        profiler.mark('imports')
+        profiler.mark('bot_start')
+        try:
+            asyncio.run(run_daemon(
+                TOKEN, args.host, args.port, args.socket, args.api_key,
+                MESSAGE_INDEX_PATH, INTENTS_PROFILE, METRICS_SNAPSHOT_PATH,
+                args.sharded, args.shard_count, args.shard_ids, AUTORESPONSES_PATH,
+                AUTORESPONSE_COOLDOWNS, AUTORESPONSE_DEDUP_WINDOW, SCHEDULE_PATH,
+                MESSAGE_LINGER, CONFIG_PATH
+            ))
+        except KeyboardInterrupt:
+            pass
+    else:
+        from gui import BotGUI
+        profiler.mark('imports')
+        app = BotGUI(args.sharded, args.shard_count, args.shard_ids)
+        app.run()
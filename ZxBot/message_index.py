@@ -0,0 +1,153 @@
+import sqlite3
+import threading
+
+
+class MessageIndex:
+    """
+    On-disk index of the messages sent by the bot, keyed by channel, so
+    cleanups can delete them directly instead of scanning channel history
+    """
+    def __init__(self, path='message_index.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " channel_id INTEGER NOT NULL,"
+            " message_id INTEGER NOT NULL,"
+            " PRIMARY KEY (channel_id, message_id))"
+        )
+        # scan_before: history older than this message may still hold bot
+        # messages that were sent before the index existed
+        # exhausted: that older history has been fully scanned
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS channels ("
+            " channel_id INTEGER PRIMARY KEY,"
+            " scan_before INTEGER,"
+            " exhausted INTEGER NOT NULL DEFAULT 0)"
+        )
+        # cursor: oldest message ID a filtered cleanup went through, until it completes
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cleanups ("
+            " channel_id INTEGER NOT NULL,"
+            " filter TEXT NOT NULL,"
+            " cursor INTEGER NOT NULL,"
+            " PRIMARY KEY (channel_id, filter))"
+        )
+        self._db.commit()
+        
+    def add(self, channel_id, message_id):
+        """
+        Record a message sent by the bot
+        :param channel_id: ID of the channel the message was sent to
+        :param message_id: ID of the sent message
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO channels (channel_id, scan_before) VALUES (?, ?)",
+                (int(channel_id), int(message_id))
+            )
+            self._db.execute(
+                "INSERT OR IGNORE INTO messages (channel_id, message_id) VALUES (?, ?)",
+                (int(channel_id), int(message_id))
+            )
+            self._db.commit()
+            
+    def get(self, channel_id, limit=100, after=None, before=None):
+        """
+        Get the most recent indexed message IDs of a channel
+        :param channel_id: ID of the channel
+        :param limit: Maximum number of IDs to return
+        :param after: Only IDs above this one
+        :param before: Only IDs below this one
+        :return: List of message IDs, newest first
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT message_id FROM messages WHERE channel_id = ? AND message_id > ? AND message_id < ?"
+                " ORDER BY message_id DESC LIMIT ?",
+                (int(channel_id), int(after or 0), int(before) if before else 2 ** 63 - 1, int(limit))
+            ).fetchall()
+        return [row[0] for row in rows]
+        
+    def remove(self, channel_id, message_ids):
+        """
+        Forget messages that were deleted or no longer exist
+        :param channel_id: ID of the channel
+        :param message_ids: IDs of the messages to forget
+        """
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM messages WHERE channel_id = ? AND message_id = ?",
+                [(int(channel_id), int(message_id)) for message_id in message_ids]
+            )
+            self._db.commit()
+            
+    def scan_state(self, channel_id):
+        """
+        Get where the history fallback scan should resume for a channel
+        :param channel_id: ID of the channel
+        :return: (scan_before, exhausted); scan_before is None when the whole history is unscanned
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT scan_before, exhausted FROM channels WHERE channel_id = ?",
+                (int(channel_id),)
+            ).fetchone()
+        if row is None:
+            return None, False
+        return row[0], bool(row[1])
+        
+    def set_scan_state(self, channel_id, scan_before, exhausted):
+        """
+        Save how far back the history fallback scan went for a channel
+        :param channel_id: ID of the channel
+        :param scan_before: Oldest message ID scanned so far
+        :param exhausted: True when the beginning of the channel was reached
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO channels (channel_id, scan_before, exhausted) VALUES (?, ?, ?)"
+                " ON CONFLICT(channel_id) DO UPDATE SET scan_before = excluded.scan_before,"
+                " exhausted = excluded.exhausted",
+                (int(channel_id), scan_before, int(exhausted))
+            )
+            self._db.commit()
+            
+    def cleanup_cursor(self, channel_id, key):
+        """
+        Get where an interrupted filtered cleanup should resume
+        :param channel_id: ID of the channel
+        :param key: CleanupFilter.key() of the cleanup
+        :return: Oldest message ID it went through, None if it never ran or completed
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT cursor FROM cleanups WHERE channel_id = ? AND filter = ?",
+                (int(channel_id), key)
+            ).fetchone()
+        return row[0] if row else None
+        
+    def set_cleanup_cursor(self, channel_id, key, cursor):
+        """
+        Save how far a filtered cleanup went
+        :param channel_id: ID of the channel
+        :param key: CleanupFilter.key() of the cleanup
+        :param cursor: Oldest message ID it went through, None once it completed
+        """
+        with self._lock:
+            if cursor is None:
+                self._db.execute("DELETE FROM cleanups WHERE channel_id = ? AND filter = ?", (int(channel_id), key))
+            else:
+                self._db.execute(
+                    "INSERT INTO cleanups (channel_id, filter, cursor) VALUES (?, ?, ?)"
+                    " ON CONFLICT(channel_id, filter) DO UPDATE SET cursor = excluded.cursor",
+                    (int(channel_id), key, int(cursor))
+                )
+            self._db.commit()
+            
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,264 @@
+import asyncio
+import bisect
+import json
+import math
+import os
+import re
+import threading
+import time
+
+import aiohttp
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# How often the event loop lag and the gateway latency are sampled
+SAMPLE_INTERVAL = 1.0
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, as Prometheus expects them"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimate a quantile from the buckets
+        :return: Upper bound of the bucket holding the quantile, None if empty
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def snapshot(self):
+        p50, p99 = self.quantile(0.5), self.quantile(0.99)
+        # Above the last bucket there is no bound to report, and JSON has no infinity
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': p50 if p50 != math.inf else None,
+            'p99': p99 if p99 != math.inf else None,
+        }
+
+
+class Metrics:
+    """
+    Counters and histograms for one bot: how long each operation takes and
+    whether it succeeded, the REST requests and the 429s Discord answered,
+    the gateway heartbeat latency, how late the event loop runs and how many
+    automatic replies were sent or suppressed.
+    Written from the bot's loop, read from any thread.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operations = {}  # name -> Histogram
+        self.outcomes = {}  # (name, 'success' | 'failure') -> count
+        self.requests = {}  # 'METHOD /route' -> Histogram
+        self.rate_limited = {}  # 'METHOD /route' -> [count, total retry-after seconds]
+        self.gateway_latency = Histogram()
+        self.last_gateway_latency = None
+        self.loop_lag = Histogram(LOOP_LAG_BUCKETS)
+        self.last_loop_lag = None
+        self.autoresponses = {}  # 'sent' or why a reply was suppressed -> count
+        self.started_at = time.time()
+
+    def observe(self, operation, seconds, succeeded):
+        with self._lock:
+            self.operations.setdefault(operation, Histogram()).observe(seconds)
+            key = (operation, 'success' if succeeded else 'failure')
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    def observe_request(self, route, seconds, status, retry_after=None):
+        with self._lock:
+            self.requests.setdefault(route, Histogram()).observe(seconds)
+            if status == 429:
+                counter = self.rate_limited.setdefault(route, [0, 0.0])
+                counter[0] += 1
+                counter[1] += retry_after or 0.0
+
+    def observe_gateway_latency(self, seconds):
+        with self._lock:
+            self.gateway_latency.observe(seconds)
+            self.last_gateway_latency = seconds
+
+    def observe_loop_lag(self, seconds):
+        with self._lock:
+            self.loop_lag.observe(seconds)
+            self.last_loop_lag = seconds
+
+    def count_autoresponse(self, outcome):
+        """:param outcome: 'sent', or the reason the reply was suppressed"""
+        with self._lock:
+            self.autoresponses[outcome] = self.autoresponses.get(outcome, 0) + 1
+
+    def http_trace(self):
+        """
+        aiohttp trace config timing every REST request discord.py makes,
+        passed to the client as http_trace
+        """
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            context.started = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            response = params.response
+            retry_after = None
+            if response.status == 429:
+                retry_after = _float(response.headers.get('Retry-After') or
+                                     response.headers.get('X-RateLimit-Reset-After'))
+            self.observe_request(
+                f'{params.method} {_route(params.url.path)}',
+                time.perf_counter() - context.started,
+                response.status,
+                retry_after,
+            )
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    async def monitor(self, discord_bot, interval=SAMPLE_INTERVAL, snapshot_path=None, snapshot_interval=60,
+                      gauges=None):
+        """
+        Sample the loop lag and the gateway latency until cancelled,
+        optionally writing a JSON snapshot every snapshot_interval seconds
+        :param discord_bot: discord.Client whose heartbeat latency is sampled
+        :param snapshot_path: File the JSON snapshot is written to, None to disable
+        :param gauges: Callable returning extra values for the snapshot
+        """
+        loop = asyncio.get_running_loop()
+        last_latency = None
+        next_snapshot = loop.time() + snapshot_interval
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.observe_loop_lag(max(loop.time() - expected, 0.0))
+
+            latency = discord_bot.latency
+            if math.isfinite(latency) and latency != last_latency:
+                # Only a new heartbeat ACK changes the value
+                self.observe_gateway_latency(latency)
+                last_latency = latency
+
+            if snapshot_path and loop.time() >= next_snapshot:
+                next_snapshot = loop.time() + snapshot_interval
+                snapshot = self.snapshot(gauges() if gauges else None)
+                try:
+                    await loop.run_in_executor(None, _write_json, snapshot_path, snapshot)
+                except OSError as e:
+                    print(f"Error writing metrics snapshot: {e}")
+
+    def snapshot(self, gauges=None):
+        """:return: JSON-serializable dict of every metric"""
+        with self._lock:
+            return {
+                'timestamp': time.time(),
+                'uptime_s': time.time() - self.started_at,
+                'operations': {
+                    name: dict(
+                        histogram.snapshot(),
+                        success=self.outcomes.get((name, 'success'), 0),
+                        failure=self.outcomes.get((name, 'failure'), 0),
+                    )
+                    for name, histogram in sorted(self.operations.items())
+                },
+                'requests': {route: histogram.snapshot() for route, histogram in sorted(self.requests.items())},
+                'rate_limited': {
+                    route: {'count': count, 'retry_after_s': retry_after}
+                    for route, (count, retry_after) in sorted(self.rate_limited.items())
+                },
+                'gateway_latency_s': self.last_gateway_latency,
+                'gateway_latency': self.gateway_latency.snapshot(),
+                'loop_lag_s': self.last_loop_lag,
+                'loop_lag': self.loop_lag.snapshot(),
+                'autoresponses': dict(sorted(self.autoresponses.items())),
+                'gauges': dict(gauges or {}),
+            }
+
+    def prometheus(self, gauges=None):
+        """
+        :param gauges: Extra {name: value} gauges, exported as zxbot_<name>
+        :return: Metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            _histogram_lines(lines, 'zxbot_operation_duration_seconds', 'Duration of bot operations',
+                             'operation', self.operations)
+            lines.append('# HELP zxbot_operations_total Bot operations by outcome')
+            lines.append('# TYPE zxbot_operations_total counter')
+            for (name, outcome), count in sorted(self.outcomes.items()):
+                lines.append(f'zxbot_operations_total{{operation="{name}",outcome="{outcome}"}} {count}')
+            _histogram_lines(lines, 'zxbot_http_request_duration_seconds', 'Duration of Discord REST requests',
+                             'route', self.requests)
+            lines.append('# HELP zxbot_rate_limited_total 429 responses from Discord')
+            lines.append('# TYPE zxbot_rate_limited_total counter')
+            for route, (count, _) in sorted(self.rate_limited.items()):
+                lines.append(f'zxbot_rate_limited_total{{route="{route}"}} {count}')
+            lines.append('# HELP zxbot_rate_limit_retry_after_seconds_total Retry-after time asked by 429 responses')
+            lines.append('# TYPE zxbot_rate_limit_retry_after_seconds_total counter')
+            for route, (_, retry_after) in sorted(self.rate_limited.items()):
+                lines.append(f'zxbot_rate_limit_retry_after_seconds_total{{route="{route}"}} {retry_after}')
+            _histogram_lines(lines, 'zxbot_gateway_latency_seconds', 'Gateway heartbeat latency',
+                             None, {None: self.gateway_latency})
+            _histogram_lines(lines, 'zxbot_event_loop_lag_seconds', 'Delay of the event loop behind schedule',
+                             None, {None: self.loop_lag})
+            lines.append('# HELP zxbot_autoresponses_total Automatic replies sent, or suppressed by reason')
+            lines.append('# TYPE zxbot_autoresponses_total counter')
+            for outcome, count in sorted(self.autoresponses.items()):
+                lines.append(f'zxbot_autoresponses_total{{outcome="{outcome}"}} {count}')
+        for name, value in sorted((gauges or {}).items()):
+            if value is not None:
+                lines.append(f'# TYPE zxbot_{name} gauge')
+                lines.append(f'zxbot_{name} {float(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(lines, metric, help_text, label, histograms):
+    lines.append(f'# HELP {metric} {help_text}')
+    lines.append(f'# TYPE {metric} histogram')
+    for key, histogram in sorted(histograms.items(), key=lambda item: item[0] or ''):
+        labels = f'{label}="{key}",' if label else ''
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+            cumulative += count
+            le = '+Inf' if bound == math.inf else repr(bound)
+            lines.append(f'{metric}_bucket{{{labels}le="{le}"}} {cumulative}')
+        labels = f'{{{labels.rstrip(",")}}}' if label else ''
+        lines.append(f'{metric}_sum{labels} {histogram.sum}')
+        lines.append(f'{metric}_count{labels} {histogram.count}')
+
+
+def _route(path):
+    """Turn /api/v10/channels/123/messages into /channels/{id}/messages so routes aggregate"""
+    path = re.sub(r'^/api/v\d+', '', path)
+    return re.sub(r'/\d{15,}', '/{id}', path)
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    # Write then rename so readers never see a half-written file
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temporary, path)
@@ -0,0 +1,371 @@
+"""
+Run several bot identities from one controller. Each bot lives in its own
+worker process, with its own event loop and DiscordBot, so a slow or
+crashing bot never stalls the others. The controller routes commands to one
+bot or to all of them, aggregates their health and metrics, and restarts a
+worker that died.
+
+    python main.py --multi [--port 8765]
+
+Bots are listed in config.BOTS. The control API is the same as in headless
+mode, with a "bot" field naming the target bot, or "*" for all of them.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+
+from aiohttp import web
+
+from daemon import ControlServer
+
+# How often each worker reports its status to the controller
+STATUS_INTERVAL = 1.0
+# Delay before restarting a crashed worker, doubled after each crash in a row
+RESTART_BACKOFF = (1.0, 60.0)
+# A worker that ran this long is considered healthy again, resetting the backoff
+STABLE_AFTER = 60.0
+STOP_TIMEOUT = 10.0
+
+
+def _worker_main(name, token, options, commands, results):
+    """Entry point of a worker process: run one DiscordBot and serve the controller's commands"""
+    from bot import DiscordBot
+    from daemon import run_operation
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the controller decides when workers stop
+    bot = DiscordBot(**options)
+    ready = bot.start(token)
+    stopping = threading.Event()
+
+    def report():
+        while not stopping.wait(STATUS_INTERVAL):
+            results.put(('status', name, bot.status()))
+
+    def reply(request_id, future):
+        try:
+            outcome = future.result()
+        except Exception as e:
+            outcome = (500, {'error': f'{type(e).__name__}: {e}'})
+        results.put(('result', name, request_id, outcome))
+
+    async def restart():
+        latency = await bot.restart(token)
+        return 200, {'ok': latency is not None, 'latency_s': latency}
+
+    async def metrics():
+        gauges = bot.gauges()
+        return 200, {'snapshot': bot.metrics.snapshot(gauges), 'prometheus': bot.metrics.prometheus(gauges)}
+
+    threading.Thread(target=report, name='zxbot-report', daemon=True).start()
+    exit_code = 0
+    while True:
+        try:
+            command = commands.get(timeout=STATUS_INTERVAL)
+        except queue.Empty:
+            if ready.done() and not bot.is_running():
+                # Failed to start or lost the gateway for good: let the controller restart us
+                exit_code = 1
+                break
+            continue
+        if command is None:
+            break
+        request_id, operation, params = command
+        if operation == 'restart':
+            coro = restart()
+        elif operation == 'metrics':
+            coro = metrics()
+        else:
+            coro = run_operation(bot, operation, params)
+        future = bot.run_threadsafe(coro)
+        future.add_done_callback(lambda completed, request_id=request_id: reply(request_id, completed))
+
+    stopping.set()
+    if bot.is_running():
+        try:
+            bot.run_threadsafe(bot.stop_bot()).result(STOP_TIMEOUT)
+        except Exception as e:
+            print(f"Error stopping bot {name}: {e}")
+    results.put(('status', name, bot.status()))
+    raise SystemExit(exit_code)
+
+
+class _Worker:
+    def __init__(self, name, token, options):
+        self.name = name
+        self.token = token
+        self.options = options
+        self.process = None
+        self.commands = None
+        self.status = None
+        self.started_at = None
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF[0]
+        self.restart_at = None
+
+
+class BotController:
+    """
+    Starts one worker process per bot and talks to them through queues.
+    Methods can be called from any thread; results come back as
+    concurrent.futures.Future resolved with (HTTP status, JSON body).
+    """
+    def __init__(self, bots, **options):
+        """
+        :param bots: List of {"name": ..., "token": ...} dicts; other keys are passed to DiscordBot
+        :param options: DiscordBot options shared by all bots
+        """
+        self._context = multiprocessing.get_context('spawn')
+        self._results = self._context.Queue()
+        self._workers = {}
+        for bot in bots:
+            name = str(bot['name'])
+            if name in self._workers or name == '*':
+                raise ValueError(f"Bot names must be unique and not '*': {name!r}")
+            bot_options = dict(options, **{key: value for key, value in bot.items() if key not in ('name', 'token')})
+            # One message index and schedule per bot, SQLite files are not shared between processes
+            bot_options.setdefault('message_index_path', f'message_index_{name}.db')
+            bot_options.setdefault('schedule_path', f'schedule_{name}.db')
+            self._workers[name] = _Worker(name, bot['token'], bot_options)
+        self._pending = {}  # request_id -> (bot name, Future)
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    @property
+    def names(self):
+        return list(self._workers)
+
+    def start(self):
+        for worker in self._workers.values():
+            self._spawn(worker)
+        for target, name in ((self._read_results, 'zxbot-results'), (self._supervise, 'zxbot-supervisor')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        for worker in self._workers.values():
+            if worker.process and worker.process.is_alive():
+                worker.commands.put(None)
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for worker in self._workers.values():
+            if worker.process:
+                worker.process.join(max(deadline - time.monotonic(), 0))
+                if worker.process.is_alive():
+                    worker.process.terminate()
+        self._fail_pending(None, 'controller stopped')
+
+    def submit(self, name, operation, params=None):
+        """
+        Send an operation to one bot
+        :return: Future resolved with (HTTP status, JSON body)
+        :raises KeyError: if there is no bot with that name
+        """
+        worker = self._workers[name]
+        future = concurrent.futures.Future()
+        if not (worker.process and worker.process.is_alive()):
+            future.set_result((503, {'error': f'bot {name} is restarting'}))
+            return future
+        request_id = next(self._request_ids)
+        with self._lock:
+            self._pending[request_id] = (name, future)
+        worker.commands.put((request_id, operation, params or {}))
+        return future
+
+    def submit_all(self, operation, params=None):
+        """:return: dict mapping each bot name to the Future of its result"""
+        return {name: self.submit(name, operation, params) for name in self._workers}
+
+    def status(self):
+        """:return: dict mapping each bot name to its last reported status, plus process health"""
+        report = {}
+        for name, worker in self._workers.items():
+            alive = bool(worker.process and worker.process.is_alive())
+            report[name] = dict(
+                worker.status or {'running': False, 'ready': False},
+                alive=alive,
+                pid=worker.process.pid if worker.process else None,
+                restarts=worker.restarts,
+                uptime_s=time.monotonic() - worker.started_at if alive else None,
+            )
+        return report
+
+    def is_running(self):
+        return any(status['running'] for status in self.status().values())
+
+    # Worker management
+
+    def _spawn(self, worker):
+        worker.commands = self._context.Queue()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.name, worker.token, worker.options, worker.commands, self._results),
+            name=f'zxbot-{worker.name}',
+            daemon=True,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+
+    def _supervise(self):
+        while not self._stopping.wait(0.5):
+            now = time.monotonic()
+            for worker in self._workers.values():
+                if worker.process.is_alive():
+                    if now - worker.started_at > STABLE_AFTER:
+                        worker.backoff = RESTART_BACKOFF[0]
+                    continue
+                if worker.restart_at is None:
+                    print(f"Bot {worker.name} exited with code {worker.process.exitcode}, "
+                          f"restarting in {worker.backoff:.0f}s")
+                    worker.status = dict(worker.status or {}, running=False, ready=False)
+                    self._fail_pending(worker.name, f'bot {worker.name} crashed')
+                    worker.restart_at = now + worker.backoff
+                    worker.backoff = min(worker.backoff * 2, RESTART_BACKOFF[1])
+                elif now >= worker.restart_at and not self._stopping.is_set():
+                    worker.restarts += 1
+                    self._spawn(worker)
+
+    def _read_results(self):
+        while not self._stopping.is_set():
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if message[0] == 'status':
+                _, name, status = message
+                self._workers[name].status = status
+            elif message[0] == 'result':
+                _, name, request_id, outcome = message
+                with self._lock:
+                    _, future = self._pending.pop(request_id, (None, None))
+                if future is not None and not future.done():
+                    future.set_result(outcome)
+
+    def _fail_pending(self, name, error):
+        """Answer the requests still waiting on a bot (all bots if name is None) with a 503"""
+        with self._lock:
+            failed = [request_id for request_id, (bot, _) in self._pending.items() if name in (None, bot)]
+            futures = [self._pending.pop(request_id)[1] for request_id in failed]
+        for future in futures:
+            if not future.done():
+                future.set_result((503, {'error': error}))
+
+
+class ControllerServer(ControlServer):
+    """
+    The control API in front of a BotController. Operations take a "bot"
+    field with the target bot's name, or "*" to run on every bot.
+    """
+    async def run_operation(self, name, params):
+        target = params.get('bot') if isinstance(params, dict) else None
+        if target == '*':
+            futures = self.bot.submit_all(name, params)
+            outcomes = dict(zip(futures, await asyncio.gather(*map(asyncio.wrap_future, futures.values()))))
+            bodies = {bot: dict(body, status=status) for bot, (status, body) in outcomes.items()}
+            return 200, {'ok': all(body.get('ok') for body in bodies.values()), 'bots': bodies}
+        if target not in self.bot.names:
+            return 400, {'error': f'"bot" must be one of {", ".join(self.bot.names)} or "*"'}
+        return await asyncio.wrap_future(self.bot.submit(target, name, params))
+
+    async def handle_status(self, request):
+        bots = self.bot.status()
+        return web.json_response({
+            'running': sum(status['running'] for status in bots.values()),
+            'ready': sum(bool(status.get('ready')) for status in bots.values()),
+            'bots': bots,
+        })
+
+    async def handle_restart(self, request):
+        try:
+            params = await request.json()
+        except ValueError:
+            params = {}
+        status, body = await self.run_operation('restart', params or {'bot': '*'})
+        return web.json_response(body, status=status)
+
+    async def handle_metrics(self, request):
+        futures = self.bot.submit_all('metrics')
+        outcomes = await asyncio.gather(*map(asyncio.wrap_future, futures.values()))
+        reports = {name: body for name, (status, body) in zip(futures, outcomes) if status == 200}
+        if request.query.get('format') == 'json':
+            return web.json_response({
+                'totals': _total_operations(report['snapshot'] for report in reports.values()),
+                'bots': {name: report['snapshot'] for name, report in reports.items()},
+            })
+        text = _merge_prometheus({name: report['prometheus'] for name, report in reports.items()})
+        return web.Response(text=text, content_type='text/plain', headers={'X-Content-Type-Options': 'nosniff'})
+
+
+def _total_operations(snapshots):
+    """Sum the operation and 429 counters of several metrics snapshots"""
+    operations, rate_limited = {}, {'count': 0, 'retry_after_s': 0.0}
+    for snapshot in snapshots:
+        for name, operation in snapshot['operations'].items():
+            total = operations.setdefault(name, {'count': 0, 'success': 0, 'failure': 0, 'sum': 0.0})
+            for key in total:
+                total[key] += operation[key]
+        for route in snapshot['rate_limited'].values():
+            rate_limited['count'] += route['count']
+            rate_limited['retry_after_s'] += route['retry_after_s']
+    return {'operations': operations, 'rate_limited': rate_limited}
+
+
+def _merge_prometheus(texts):
+    """
+    Merge the Prometheus exports of several bots, adding a bot label to every
+    sample and keeping each metric family's samples together
+    """
+    families = {}  # family -> {'meta': [...], 'samples': [...]}, in first-seen order
+    for bot, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith('#'):
+                family = line.split()[2]
+                entry = families.setdefault(family, {'meta': [], 'samples': []})
+                if line not in entry['meta']:
+                    entry['meta'].append(line)
+                continue
+            if not line or family is None:
+                continue
+            name, _, value = line.rpartition(' ')
+            if name.endswith('}'):
+                name = f'{name[:-1]},bot="{bot}"}}'
+            else:
+                name = f'{name}{{bot="{bot}"}}'
+            families[family]['samples'].append(f'{name} {value}')
+    lines = []
+    for entry in families.values():
+        lines.extend(entry['meta'])
+        lines.extend(entry['samples'])
+    return '\n'.join(lines) + '\n'
+
+
+async def run_controller(bots, host='127.0.0.1', port=8765, socket_path=None, api_key=None, **options):
+    """Run every bot of the list and the control API until SIGINT/SIGTERM"""
+    controller = BotController(bots, **options)
+    controller.start()
+    server = ControllerServer(controller, host, port, socket_path, api_key)
+    await server.start()
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopped.set)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+    try:
+        await stopped.wait()
+    finally:
+        await server.stop()
+        await loop.run_in_executor(None, controller.stop)
@@ -0,0 +1,367 @@
+"""
+Scheduled and recurring messages.
+
+All jobs share one heap ordered by next run time and a single task in the
+bot's event loop sleeps until the earliest one is due, so thousands of jobs
+cost no more than one timer. Jobs are kept in SQLite and survive restarts;
+runs missed while the bot was stopped are replayed according to each job's
+policy.
+"""
+import asyncio
+import datetime
+import heapq
+import re
+import sqlite3
+import threading
+import time
+
+ONCE = 'once'
+INTERVAL = 'interval'
+CRON = 'cron'
+KINDS = (ONCE, INTERVAL, CRON)
+# What to do with the runs missed while the bot was stopped
+MISSED_SKIP = 'skip'  # nothing, wait for the next run
+MISSED_ONCE = 'once'  # send once
+MISSED_ALL = 'all'  # send once per missed run, up to MAX_CATCH_UP
+MISSED_POLICIES = (MISSED_SKIP, MISSED_ONCE, MISSED_ALL)
+MAX_CATCH_UP = 100
+# A run this late counts as missed rather than just delayed
+MISFIRE_GRACE = 60.0
+# The timer wakes up at least this often, so wall clock changes are noticed
+MAX_SLEEP = 60.0
+
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+class CronSchedule:
+    """
+    Standard five-field cron expression (minute hour day month weekday) in
+    local time. Fields accept *, numbers, ranges, lists and /steps; weekdays
+    go from 0 (Sunday) to 6, and 7 is Sunday too.
+    """
+    _FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got {len(parts)}: {expression!r}")
+        self.expression = expression
+        values = [_cron_field(part, low, high) for part, (_, low, high) in zip(parts, self._FIELDS)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = values
+        if 7 in self.weekdays:
+            self.weekdays = self.weekdays | {0}
+        # Like cron, when both day fields are restricted either one matching is enough
+        self._any_day = parts[2] == '*'
+        self._any_weekday = parts[4] == '*'
+
+    def _day_matches(self, when):
+        day = when.day in self.days
+        weekday = (when.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, timestamp):
+        """:return: Timestamp of the first run strictly after timestamp, None if there is none"""
+        when = datetime.datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0)
+        when += datetime.timedelta(minutes=1)
+        last_year = when.year + 5
+        # Skip whole months, days and hours that cannot match
+        while when.year <= last_year:
+            if when.month not in self.months:
+                when = (when.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(when):
+                when = when.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif when.hour not in self.hours:
+                when = when.replace(minute=0) + datetime.timedelta(hours=1)
+            elif when.minute not in self.minutes:
+                when += datetime.timedelta(minutes=1)
+            else:
+                return when.timestamp()
+        return None
+
+
+class Job:
+    """A message, or an image with an optional message, sent to a channel on a schedule"""
+    __slots__ = ('id', 'channel_id', 'message', 'image_path', 'kind', 'spec', 'missed', 'next_run', '_cron')
+
+    def __init__(self, job_id, channel_id, message, image_path, kind, spec, missed, next_run):
+        """
+        :param spec: Timestamp for ONCE, seconds between runs for INTERVAL, expression for CRON
+        :param next_run: Timestamp of the next run
+        """
+        self.id = job_id
+        self.channel_id = channel_id
+        self.message = message
+        self.image_path = image_path
+        self.kind = kind
+        self.spec = spec
+        self.missed = missed
+        self.next_run = next_run
+        self._cron = CronSchedule(spec) if kind == CRON else None
+
+    def following(self, after):
+        """:return: Timestamp of the first run strictly after after, None if the job is done"""
+        if self.kind == ONCE:
+            return None
+        if self.kind == INTERVAL:
+            runs = int((after - self.next_run) // self.spec) + 1
+            return self.next_run + max(runs, 1) * self.spec
+        return self._cron.next_after(after)
+
+    def missed_runs(self, now):
+        """:return: Number of runs due at or before now, up to MAX_CATCH_UP"""
+        if self.kind == ONCE:
+            return 1
+        if self.kind == INTERVAL:
+            return min(int((now - self.next_run) // self.spec) + 1, MAX_CATCH_UP)
+        count, when = 1, self.next_run
+        while count < MAX_CATCH_UP:
+            when = self._cron.next_after(when)
+            if when is None or when > now:
+                break
+            count += 1
+        return count
+
+    def describe(self):
+        """:return: The schedule as parse_spec() accepts it, after its kind"""
+        if self.kind == ONCE:
+            return f"{ONCE} {datetime.datetime.fromtimestamp(self.spec).strftime('%Y-%m-%d %H:%M')}"
+        if self.kind == INTERVAL:
+            return f'{INTERVAL} {format_duration(self.spec)}'
+        return f'{CRON} {self.spec}'
+
+
+class Scheduler:
+    """
+    Persistent job store and the timer that runs the jobs. Jobs can be added
+    and removed from any thread; they only run while start() is active on
+    the bot's event loop.
+    """
+    def __init__(self, path='schedule.db'):
+        """
+        :param path: SQLite file the jobs are kept in, ':memory:' to not keep them
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY,"
+            " channel_id INTEGER NOT NULL,"
+            " message TEXT,"
+            " image_path TEXT,"
+            " kind TEXT NOT NULL,"
+            " spec TEXT NOT NULL,"
+            " missed TEXT NOT NULL,"
+            " next_run REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._jobs = {}  # job id -> Job
+        self._heap = []  # (next_run, job id); entries whose time no longer matches the job are skipped
+        for row in self._db.execute("SELECT id, channel_id, message, image_path, kind, spec, missed, next_run FROM jobs"):
+            job_id, channel_id, message, image_path, kind, spec, missed, next_run = row
+            try:
+                job = Job(job_id, channel_id, message, image_path, kind, _load_spec(kind, spec), missed, next_run)
+            except ValueError as e:
+                print(f"Error loading scheduled job {job_id}: {e}")
+                continue
+            self._jobs[job_id] = job
+            self._heap.append((next_run, job_id))
+        heapq.heapify(self._heap)
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+    @property
+    def jobs(self):
+        """:return: Jobs, soonest first"""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.next_run)
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def add_job(self, channel_id, kind, spec, message=None, image_path=None, missed=MISSED_ONCE, now=None):
+        """
+        Schedule a message
+        :param kind: ONCE, INTERVAL or CRON
+        :param spec: Timestamp for ONCE, seconds between runs for INTERVAL (first run one interval
+                     from now), cron expression for CRON; see parse_spec() for text input
+        :param missed: What to do with runs missed while the bot was stopped, one of MISSED_POLICIES
+        :return: The Job
+        :raises ValueError: on an invalid schedule
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown schedule kind {kind!r}, expected one of {', '.join(KINDS)}")
+        if missed not in MISSED_POLICIES:
+            raise ValueError(f"Unknown missed runs policy {missed!r}, expected one of {', '.join(MISSED_POLICIES)}")
+        if not message and not image_path:
+            raise ValueError("A scheduled job needs a message or an image")
+        now = time.time() if now is None else now
+        if kind == ONCE:
+            next_run = float(spec)
+        elif kind == INTERVAL:
+            spec = float(spec)
+            if spec <= 0:
+                raise ValueError("The interval must be positive")
+            next_run = now + spec
+        else:
+            next_run = CronSchedule(spec).next_after(now)
+            if next_run is None:
+                raise ValueError(f"Cron expression {spec!r} never matches")
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (channel_id, message, image_path, kind, spec, missed, next_run)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (int(channel_id), message, image_path, kind, str(spec), missed, next_run)
+            )
+            self._db.commit()
+            job = Job(cursor.lastrowid, int(channel_id), message, image_path, kind, spec, missed, next_run)
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (next_run, job.id))
+        self._wake()
+        return job
+
+    def remove_job(self, job_id):
+        with self._lock:
+            # Its heap entry is dropped when it comes up
+            if self._jobs.pop(job_id, None) is not None:
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                self._db.commit()
+
+    def start(self, fire):
+        """
+        Run the jobs on the running event loop until stop(); does nothing if already running
+        :param fire: Called with each Job when it is due
+        """
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run(fire))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _wake(self):
+        # Re-arm the timer in case the new job is the earliest
+        if self._task is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # Loop closed
+
+    async def _run(self, fire):
+        while True:
+            now = time.time()
+            with self._lock:
+                due = self._pop_due(now)
+                delay = self._heap[0][0] - now if self._heap else MAX_SLEEP
+            if due:
+                self._run_due(due, now, fire)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), min(delay, MAX_SLEEP))
+            except asyncio.TimeoutError:
+                pass
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            next_run, job_id = heapq.heappop(self._heap)
+            job = self._jobs.get(job_id)
+            if job is not None and job.next_run == next_run:
+                due.append(job)
+        return due
+
+    def _run_due(self, due, now, fire):
+        finished = []
+        updated = []
+        for job in due:
+            runs = 1
+            if now - job.next_run > MISFIRE_GRACE:
+                runs = {MISSED_SKIP: 0, MISSED_ONCE: 1, MISSED_ALL: job.missed_runs(now)}[job.missed]
+            for _ in range(runs):
+                try:
+                    fire(job)
+                except Exception as e:
+                    print(f"Error running scheduled job {job.id}: {e}")
+            next_run = job.following(now)
+            if next_run is None:
+                finished.append(job)
+            else:
+                job.next_run = next_run
+                updated.append(job)
+        with self._lock:
+            for job in finished:
+                self._jobs.pop(job.id, None)
+            for job in updated:
+                if job.id in self._jobs:
+                    heapq.heappush(self._heap, (job.next_run, job.id))
+            # One transaction for everything that ran together
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job.id,) for job in finished])
+            self._db.executemany("UPDATE jobs SET next_run = ? WHERE id = ?",
+                                 [(job.next_run, job.id) for job in updated])
+            self._db.commit()
+
+
+def parse_spec(kind, text):
+    """
+    Schedule from user input
+    :param text: 'YYYY-MM-DD HH:MM' for ONCE, a duration such as 90, 30m, 2h or 1d for INTERVAL,
+                 a cron expression for CRON
+    :raises ValueError: if the text does not fit the kind
+    """
+    text = text.strip()
+    if kind == ONCE:
+        return datetime.datetime.strptime(text, '%Y-%m-%d %H:%M').timestamp()
+    if kind == INTERVAL:
+        return parse_duration(text)
+    if kind == CRON:
+        CronSchedule(text)
+        return text
+    raise ValueError(f"Unknown schedule kind {kind!r}")
+
+
+def parse_duration(text):
+    """:return: Seconds in a duration like 90, 30m, 2h or 1d"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([smhdw]?)', text.strip().lower())
+    if not match:
+        raise ValueError(f"Invalid duration {text!r}, expected e.g. 90, 30m, 2h or 1d")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2) or 's']
+
+
+def format_duration(seconds):
+    for unit in ('w', 'd', 'h', 'm'):
+        if seconds >= _DURATION_UNITS[unit] and seconds % _DURATION_UNITS[unit] == 0:
+            return f'{int(seconds // _DURATION_UNITS[unit])}{unit}'
+    return f'{seconds:g}s'
+
+
+def _load_spec(kind, spec):
+    return spec if kind == CRON else float(spec)
+
+
+def _cron_field(text, low, high):
+    values = set()
+    for part in text.split(','):
+        match = re.fullmatch(r'(\*|\d+)(?:-(\d+))?(?:/(\d+))?', part)
+        if not match:
+            raise ValueError(f"Invalid cron field {text!r}")
+        start, end, step = match.groups()
+        if start == '*':
+            first, last = low, high
+        else:
+            first = int(start)
+            last = int(end) if end else (high if step else first)
+        step = int(step) if step else 1
+        if not low <= first <= last <= high or step < 1:
+            raise ValueError(f"Invalid cron field {text!r}, values go from {low} to {high}")
+        values.update(range(first, last + 1, step))
+    return frozenset(values)
@@ -0,0 +1,220 @@
+"""
+Settings read from an external JSON or TOML file (CONFIG_PATH in config.py),
+over the constants of config.py, and watched while the bot runs:
+
+    {
+        "default_channel_id": 123456789012345678,
+        "language": "en",
+        "presence": {"status": "idle", "activity": "Tickets"},
+        "route_rates": {"send": [4, 5.0]},
+        "autoresponse_cooldowns": {"user": [3, 10], "channel": [10, 10]}
+    }
+
+Every setting applies without touching the gateway connection, except the
+RECONNECT ones: a new token or intents profile makes the bot identify again.
+The auto-response rules file is watched too, edits to it apply at once.
+"""
+import json
+import os
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:  # TOML is optional, JSON settings files always work
+        tomllib = None
+
+import config
+from cooldowns import SCOPES
+from dispatcher import ROUTE_RATES
+from translations import available_languages
+
+# bot.PROFILES, repeated so reading the settings does not import discord.py
+INTENTS_PROFILES = ('minimal', 'messaging', 'full')
+STATUSES = ('online', 'idle', 'dnd', 'invisible')
+# Seconds between two checks of the settings file
+POLL_INTERVAL = 1.0
+
+
+class SettingsError(ValueError):
+    pass
+
+
+def _string(value):
+    if not isinstance(value, str):
+        raise ValueError("expected a string")
+    return value
+
+
+def _choice(*choices):
+    def check(value):
+        if value not in choices:
+            raise ValueError(f"expected one of {', '.join(choices)}")
+        return value
+    return check
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise ValueError("expected a positive number")
+    return value
+
+
+def _channel_id(value):
+    if value is None:
+        return None
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("expected a channel ID")
+    return value
+
+
+def _presence(value):
+    if value is None:
+        return None
+    if not isinstance(value, dict) or set(value) - {'status', 'activity'}:
+        raise ValueError('expected {"status": ..., "activity": ...}')
+    return {
+        'status': _choice(*STATUSES)(value.get('status', 'online')),
+        'activity': _string(value.get('activity', '')),
+    }
+
+
+def _rates(keys=None, base=None):
+    """
+    {name: [requests, seconds]} to {name: (requests, seconds)}
+    :param keys: Only accept these names
+    :param base: Rates the given ones are merged over
+    """
+    def check(value):
+        if not isinstance(value, dict):
+            raise ValueError("expected {name: [requests, seconds]}")
+        rates = dict(base or {})
+        for name, rate in value.items():
+            if keys is not None and name not in keys:
+                raise ValueError(f"unknown name {name!r}, expected one of {', '.join(keys)}")
+            if (not isinstance(rate, (list, tuple)) or len(rate) != 2 or not isinstance(rate[0], int)
+                    or rate[0] < 1 or _number(rate[1]) == 0):
+                raise ValueError(f"{name}: expected [requests, seconds]")
+            rates[name] = (rate[0], float(rate[1]))
+        return rates
+    return check
+
+
+# name: (default, validator, whether a change needs a new gateway session)
+SCHEMA = {
+    'token': (config.TOKEN, _string, True),
+    'intents_profile': (config.INTENTS_PROFILE, _choice(*INTENTS_PROFILES), True),
+    'default_channel_id': (config.DEFAULT_CHANNEL_ID, _channel_id, False),
+    'language': (config.DEFAULT_LANGUAGE, _choice(*available_languages()), False),
+    'presence': (None, _presence, False),
+    'route_rates': (ROUTE_RATES, _rates(base=ROUTE_RATES), False),
+    'autoresponses_path': (config.AUTORESPONSES_PATH, _string, False),
+    'autoresponse_cooldowns': (config.AUTORESPONSE_COOLDOWNS, _rates(SCOPES), False),
+    'autoresponse_dedup_window': (config.AUTORESPONSE_DEDUP_WINDOW, _number, False),
+    'message_linger': (config.MESSAGE_LINGER, _number, False),
+}
+RECONNECT = frozenset(name for name, (_, _, reconnect) in SCHEMA.items() if reconnect)
+
+
+def defaults():
+    """:return: Every setting, with its value from config.py"""
+    return {name: default for name, (default, _, _) in SCHEMA.items()}
+
+
+def load_settings(path):
+    """
+    :param path: JSON or TOML (.toml) settings file, None or a missing file for config.py's values only
+    :return: Every setting, the file's values over config.py's
+    :raises SettingsError: if the file cannot be read or has invalid values, listing every problem
+    """
+    settings = defaults()
+    if not path or not os.path.exists(path):
+        return settings
+    try:
+        if path.endswith('.toml'):
+            if tomllib is None:
+                raise SettingsError(f"{path}: reading TOML needs Python 3.11 or the tomli package")
+            with open(path, 'rb') as f:
+                data = tomllib.load(f)
+        else:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SettingsError(f"{path}: {e}") from e
+    if not isinstance(data, dict):
+        raise SettingsError(f"{path}: expected an object of settings")
+
+    problems = []
+    for name, value in data.items():
+        if name not in SCHEMA:
+            problems.append(f"unknown setting {name!r}")
+            continue
+        try:
+            settings[name] = SCHEMA[name][1](value)
+        except ValueError as e:
+            problems.append(f"{name}: {e}")
+    if problems:
+        raise SettingsError(f"{path}: {'; '.join(problems)}")
+    return settings
+
+
+def _stamp(path):
+    """Modification time and size of a file, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SettingsWatcher:
+    """
+    Follows the settings file and the auto-response rules file it points to.
+    A poll only costs two stat calls until one of them changes, so it can run
+    every second. Used from one thread.
+    """
+    def __init__(self, path):
+        """
+        :param path: Settings file, see load_settings(); an invalid file is reported and config.py's values used
+        """
+        self.path = path
+        self._stamp = _stamp(path)
+        try:
+            self.settings = load_settings(path)
+        except SettingsError as e:
+            print(f"Error loading settings: {e}")
+            self.settings = defaults()
+        self._rules_stamp = _stamp(self.settings['autoresponses_path'])
+
+    def poll(self):
+        """
+        Reload the settings if their file changed. A file that does not load
+        is reported and the current settings kept.
+        :return: {name: new value} for each setting that changed, empty if none did;
+                 autoresponses_path is included when the rules file itself changed
+        """
+        changes = {}
+        stamp = _stamp(self.path)
+        if stamp != self._stamp:
+            self._stamp = stamp
+            try:
+                settings = load_settings(self.path)
+            except SettingsError as e:
+                print(f"Error reloading settings, keeping the current ones: {e}")
+                settings = self.settings
+            changes = {name: value for name, value in settings.items() if value != self.settings[name]}
+            self.settings = settings
+
+        rules_path = self.settings['autoresponses_path']
+        rules_stamp = _stamp(rules_path)
+        if rules_stamp != self._rules_stamp:
+            self._rules_stamp = rules_stamp
+            changes['autoresponses_path'] = rules_path
+        return changes
+
+    def rules_saved(self):
+        """Take note of a change the application made itself to the rules file, so it is not reloaded"""
+        self._rules_stamp = _stamp(self.settings['autoresponses_path'])
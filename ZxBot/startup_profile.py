@@ -0,0 +1,84 @@
+import json
+import time
+
+# Gateway opcode of the IDENTIFY payload
+OP_IDENTIFY = 2
+
+
+class StartupProfiler:
+    """
+    Records named timestamps from process start to the bot being ready and
+    prints the breakdown. Disabled unless main.py is run with --profile-startup,
+    in which case marking costs a dict insert.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.marks = []
+        self.durations = {}
+        
+    def enable(self, origin=None):
+        self.enabled = True
+        if origin is not None:
+            self.origin = origin
+            
+    def mark(self, name):
+        """Record that a startup step has just completed"""
+        if self.enabled:
+            self.marks.append((name, time.perf_counter()))
+            
+    def record(self, name, seconds):
+        """Record the duration of a step that did not run on the startup path, e.g. a background import"""
+        if self.enabled:
+            self.durations[name] = seconds
+            
+    def attach(self, discord_bot):
+        """
+        Mark the gateway steps of a DiscordBot, whose commands.Bot must have been
+        built with enable_debug_events=True
+        """
+        seen = set()
+        
+        def once(name):
+            if name not in seen:
+                seen.add(name)
+                self.mark(name)
+                
+        async def on_socket_raw_receive(msg):
+            once('gateway_hello')
+            
+        async def on_socket_raw_send(data):
+            if 'identify_sent' not in seen:
+                try:
+                    if json.loads(data).get('op') == OP_IDENTIFY:
+                        once('identify_sent')
+                except (ValueError, TypeError, AttributeError):
+                    pass
+                    
+        async def on_socket_event_type(event_type):
+            if event_type == 'READY':
+                once('ready_received')
+                
+        async def on_ready():
+            once('on_ready')
+            self.report()
+            
+        bot = discord_bot.bot
+        bot.add_listener(on_socket_raw_receive, 'on_socket_raw_receive')
+        bot.add_listener(on_socket_raw_send, 'on_socket_raw_send')
+        bot.add_listener(on_socket_event_type, 'on_socket_event_type')
+        bot.add_listener(on_ready, 'on_ready')
+        
+    def report(self):
+        if not self.enabled:
+            return
+        print("Startup profile (ms since process start, delta from previous step)")
+        previous = self.origin
+        for name, at in sorted(self.marks, key=lambda mark: mark[1]):
+            print(f"  {name:<20} {(at - self.origin) * 1000:9.1f} {(at - previous) * 1000:+9.1f}")
+            previous = at
+        for name, seconds in self.durations.items():
+            print(f"  {name:<20} {seconds * 1000:9.1f} (off the startup path)")
+
+
+profiler = StartupProfiler()
@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from autoresponder import AutoResponder, Rule, REGEX
+
+
+@pytest.mark.parametrize('response', ['{0}', '{}', '{name}', '{user.name}', 'a { b', 'a } b', '{user:d}', '{user:{x}}'])
+def test_malformed_response_is_rejected(response):
+    with pytest.raises(ValueError):
+        Rule('hello', response)
+
+
+@pytest.mark.parametrize('response', ['Hi {user}', '{mention} in {channel}', '{{literal}}', 'no fields'])
+def test_response_fields_are_accepted(response):
+    assert Rule('hello', response).response == response
+
+
+def test_load_skips_invalid_rules(tmp_path, capsys):
+    path = tmp_path / 'autoresponses.json'
+    path.write_text(json.dumps([
+        {'trigger': 'hello', 'response': 'Hi {0}'},
+        {'trigger': '(', 'response': 'never', 'kind': REGEX},
+        {'trigger': 'bye', 'response': 'Bye {user}'},
+    ]), encoding='utf-8')
+    responder = AutoResponder(str(path))
+    assert [rule.trigger for rule in responder.rules] == ['bye']
+    assert responder.match('hello there') is None
+    assert capsys.readouterr().out.count('skipped') == 2
+
+
+def test_higher_priority_regex_inside_another_match_wins():
+    responder = AutoResponder()
+    responder.add_rule(Rule('b', 'first', REGEX))
+    responder.add_rule(Rule('ab+c', 'second', REGEX))
+    assert responder.match('abc').response == 'first'
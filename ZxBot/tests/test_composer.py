@@ -0,0 +1,181 @@
+import asyncio
+import random
+
+import pytest
+
+from composer import MessageCoalescer, split_message, _balanced, MESSAGE_LIMIT
+
+FENCE = '```'
+
+
+def assert_round_trip(text, chunks):
+    """
+    Check that the chunks are exactly the text with only fences added where
+    a code block was cut. A chunk ending with "x\\n```" may be "x\\n" or "x"
+    closed, so every position of the text a chunk can end at is followed.
+    """
+    positions = {0}
+    for chunk in chunks:
+        following = set()
+        for position in positions:
+            body = chunk
+            if text[:position].count(FENCE) % 2:
+                # Reopened with the line that opened the block
+                opening = text[text.rfind(FENCE, 0, position):].split('\n', 1)[0].strip()
+                if not body.startswith(f'{opening}\n'):
+                    continue
+                body = body[len(opening) + 1:]
+            for added in ('', FENCE, f'\n{FENCE}'):
+                if added and not body.endswith(added):
+                    continue
+                piece = body[:len(body) - len(added)]
+                end = position + len(piece)
+                if text[position:end] != piece:
+                    continue
+                inside = text[:end].count(FENCE) % 2 == 1
+                if (not added and not inside
+                        or added == FENCE and inside and piece.endswith('\n')
+                        or added == f'\n{FENCE}' and inside and not piece.endswith('\n')):
+                    following.add(end)
+        if not following:
+            pytest.fail(f"chunk is not a piece of the text: {chunk!r}")
+        positions = following
+    assert len(text) in positions
+
+
+def random_text(rng):
+    words = ['word', 'a', 'longerword', '**bold text**', '`code`', '~~gone~~', '||secret||', 'x' * 60]
+    blocks = []
+    for _ in range(rng.randint(1, 40)):
+        kind = rng.random()
+        if kind < 0.3:
+            language = rng.choice(['', 'python', 'js'])
+            lines = [' '.join(rng.choice(words) for _ in range(rng.randint(0, 30))) for _ in range(rng.randint(1, 30))]
+            blocks.append(f"{FENCE}{language}\n" + '\n'.join(lines) + f"\n{FENCE}")
+        elif kind < 0.4:
+            blocks.append('y' * rng.randint(500, 3000))
+        else:
+            blocks.append(' '.join(rng.choice(words) for _ in range(rng.randint(1, 200))))
+    return rng.choice(['\n', '\n\n']).join(blocks)
+
+
+def test_short_text_is_one_message():
+    assert split_message('hello') == ['hello']
+    assert split_message('x' * MESSAGE_LIMIT) == ['x' * MESSAGE_LIMIT]
+    assert split_message('') == []
+
+
+def test_prefers_paragraph_breaks():
+    first, second = 'a' * 1200, 'b' * 1200
+    assert split_message(f'{first}\n\n{second}') == [f'{first}\n\n', second]
+
+
+def test_code_block_is_closed_and_reopened_with_its_language():
+    code = '\n'.join(f'print({i})' for i in range(400))
+    text = f'Intro\n```python\n{code}\n```\nOutro'
+    chunks = split_message(text)
+    assert len(chunks) > 1
+    assert chunks[0].endswith(FENCE)
+    for chunk in chunks[1:]:
+        assert chunk.startswith('```python\n')
+    for chunk in chunks:
+        assert chunk.count(FENCE) % 2 == 0
+    assert_round_trip(text, chunks)
+
+
+def test_long_line_is_not_cut_inside_inline_markdown():
+    text = ' '.join(['**bold words here**'] * 200)
+    chunks = split_message(text)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert _balanced(chunk)
+    assert ''.join(chunks) == text
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_random_text(seed):
+    rng = random.Random(seed)
+    text = random_text(rng)
+    limit = rng.choice([MESSAGE_LIMIT, 500, 120])
+    chunks = split_message(text, limit)
+    assert all(chunk and len(chunk) <= limit for chunk in chunks)
+    for chunk in chunks:
+        assert chunk.count(FENCE) % 2 == 0
+    assert_round_trip(text, chunks)
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    async def __call__(self, channel_id, text):
+        self.sent.append((channel_id, text))
+        return len(self.sent)
+
+
+def test_coalescer_merges_messages_within_the_linger():
+    async def run():
+        send = Recorder()
+        coalescer = MessageCoalescer(send, linger=0.05)
+        results = await asyncio.gather(
+            coalescer.send(1, 'a'), coalescer.send(1, 'b'), coalescer.send(2, 'c'), coalescer.send(1, 'd'),
+        )
+        return send.sent, results
+
+    sent, results = asyncio.run(run())
+    assert sorted(sent) == [(1, 'a\nb\nd'), (2, 'c')]
+    assert results[0] == results[1] == results[3] != results[2]
+
+
+def test_coalescer_flushes_a_batch_that_would_go_over_the_limit():
+    async def run():
+        send = Recorder()
+        coalescer = MessageCoalescer(send, linger=10, limit=10)
+        first = asyncio.ensure_future(coalescer.send(1, 'aaaa'))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(coalescer.send(1, 'bbbbbbb'))
+        await first
+        await asyncio.sleep(0)
+        pending = send.sent[:]
+        coalescer.flush()
+        await second
+        return pending, send.sent
+
+    pending, sent = asyncio.run(run())
+    assert pending == [(1, 'aaaa')]
+    assert sent == [(1, 'aaaa'), (1, 'bbbbbbb')]
+
+
+def test_coalescer_sends_long_messages_and_no_linger_at_once():
+    async def run():
+        send = Recorder()
+        await MessageCoalescer(send, linger=10, limit=5).send(1, 'x' * 5)
+        await MessageCoalescer(send, linger=0).send(2, 'y')
+        return send.sent
+
+    assert asyncio.run(run()) == [(1, 'xxxxx'), (2, 'y')]
+
+
+def test_coalescer_cancel_drops_waiting_messages():
+    async def run():
+        send = Recorder()
+        coalescer = MessageCoalescer(send, linger=10)
+        waiting = asyncio.ensure_future(coalescer.send(1, 'a'))
+        await asyncio.sleep(0)
+        coalescer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return send.sent
+
+    assert asyncio.run(run()) == []
+
+
+def test_coalescer_passes_send_errors_to_every_message():
+    async def failing(channel_id, text):
+        raise RuntimeError('boom')
+
+    async def run():
+        coalescer = MessageCoalescer(failing, linger=0.01)
+        return await asyncio.gather(coalescer.send(1, 'a'), coalescer.send(1, 'b'), return_exceptions=True)
+
+    assert [str(error) for error in asyncio.run(run())] == ['boom', 'boom']
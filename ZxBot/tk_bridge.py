@@ -0,0 +1,48 @@
+import queue
+import time
+
+
+class TkBridge:
+    """
+    Hands the results of bot operations, which complete on the bot's event
+    loop thread, back to the Tk thread. Completions are pushed to a queue
+    that the Tk main loop drains with root.after, so callbacks never run on
+    the bot thread and the main loop never waits on the bot.
+    """
+    def __init__(self, root, interval=50):
+        self.root = root
+        self.interval = interval
+        self._completed = queue.Queue()
+        self.root.after(self.interval, self._poll)
+        
+    def watch(self, future, callback):
+        """
+        Call callback(future, latency) on the Tk thread once future completes
+        :param future: concurrent.futures.Future of the operation
+        :param callback: Called with the completed future and the operation's latency in seconds
+        """
+        started = time.perf_counter()
+        
+        def done(completed):
+            self._completed.put((callback, (completed, time.perf_counter() - started)))
+            
+        future.add_done_callback(done)
+        
+    def post(self, callback, *args):
+        """
+        Call callback(*args) on the Tk thread, can be called from any thread,
+        e.g. to report the progress of a running operation
+        """
+        self._completed.put((callback, args))
+        
+    def _poll(self):
+        while True:
+            try:
+                callback, args = self._completed.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error handling operation result: {e}")
+        self.root.after(self.interval, self._poll)
@@ -1,82 +1,116 @@
-TRANSLATIONS = {
-    'fr': {
-        'window_title': "Contrôleur de Bot Discord",
-        'tab_messages': "Messages",
-        'tab_settings': "Paramètres",
-        'channel_settings': "Paramètres du Canal",
-        'channel_id': "ID du Canal:",
-        'message': "Message",
-        'image': "Image",
-        'browse': "Parcourir",
-        'bot_control': "Contrôle du Bot",
-        'start_bot': "Démarrer Bot",
-        'stop_bot': "Arrêter Bot",
-        'force_stop': "Arrêt Forcé",
-        'send_message': "Envoyer Message",
-        'send_image': "Envoyer Image",
-        'clean_messages': "Nettoyer Messages",
-        'avatar_settings': "Paramètres Avatar",
-        'select_avatar': "Sélectionner Avatar",
-        'change_avatar': "Changer Avatar",
-        'status_settings': "Paramètres Statut",
-        'status': "Statut:",
-        'activity': "Activité:",
-        'update_presence': "Mettre à jour",
-        'language': "Langue:",
-        # Messages d'erreur et confirmations
-        'error': "Erreur",
-        'success': "Succès",
-        'confirmation': "Confirmation",
-        'bot_must_run': "Le bot doit être en cours d'exécution",
-        'enter_channel_id': "Veuillez entrer l'ID du canal",
-        'enter_message': "Veuillez entrer un message",
-        'select_image': "Veuillez sélectionner une image",
-        'invalid_limit': "Limite invalide",
-        'confirm_delete': "Voulez-vous vraiment supprimer les {} derniers messages du bot dans ce canal ?",
-        'messages_deleted': "{} message(s) supprimé(s)",
-        'force_stop_confirm': "Êtes-vous sûr de vouloir forcer l'arrêt du bot ? Cela peut provoquer un comportement inattendu.",
-        'force_stop_success': "Le bot a été arrêté de force",
-        'avatar_changed': "Demande de changement d'avatar envoyée",
-        'status_updated': "Statut et activité mis à jour",
-    },
-    'en': {
-        'window_title': "Discord Bot Controller",
-        'tab_messages': "Messages",
-        'tab_settings': "Settings",
-        'channel_settings': "Channel Settings",
-        'channel_id': "Channel ID:",
-        'message': "Message",
-        'image': "Image",
-        'browse': "Browse",
-        'bot_control': "Bot Control",
-        'start_bot': "Start Bot",
-        'stop_bot': "Stop Bot",
-        'force_stop': "Force Stop",
-        'send_message': "Send Message",
-        'send_image': "Send Image",
-        'clean_messages': "Clean Messages",
-        'avatar_settings': "Avatar Settings",
-        'select_avatar': "Select Avatar",
-        'change_avatar': "Change Avatar",
-        'status_settings': "Status Settings",
-        'status': "Status:",
-        'activity': "Activity:",
-        'update_presence': "Update",
-        'language': "Language:",
-        # Error messages and confirmations
-        'error': "Error",
-        'success': "Success",
-        'confirmation': "Confirmation",
-        'bot_must_run': "Bot must be running",
-        'enter_channel_id': "Please enter a channel ID",
-        'enter_message': "Please enter a message",
-        'select_image': "Please select an image",
-        'invalid_limit': "Invalid limit",
-        'confirm_delete': "Do you really want to delete the last {} bot messages in this channel?",
-        'messages_deleted': "{} message(s) deleted",
-        'force_stop_confirm': "Are you sure you want to force stop the bot? This may cause unexpected behavior.",
-        'force_stop_success': "Bot has been force stopped",
-        'avatar_changed': "Avatar change request sent",
-        'status_updated': "Status and activity updated",
-    }
-}
+"""
+Interface texts, one JSON catalog per language in locales/ ({"key": "text"}).
+A catalog is only read the first time its language is used, so shipping more
+languages costs nothing at startup. The REFERENCE_LANGUAGE catalog has every
+key: keys another catalog lacks are reported when it loads and shown in the
+reference language.
+
+    python translations.py      # check every catalog against the reference
+"""
+import json
+import os
+import sys
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+REFERENCE_LANGUAGE = 'fr'
+
+
+def available_languages():
+    """:return: Language codes that have a catalog, sorted, without reading the catalogs"""
+    try:
+        names = os.listdir(LOCALES_DIR)
+    except OSError:
+        return []
+    return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+
+def _read(language):
+    """:return: {key: text} of a catalog, empty if it cannot be read (the error is printed)"""
+    path = os.path.join(LOCALES_DIR, f'{language}.json')
+    try:
+        with open(path, encoding='utf-8') as f:
+            texts = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error loading translations {path}: {e}")
+        return {}
+    if not isinstance(texts, dict):
+        print(f"Error loading translations {path}: expected an object of texts")
+        return {}
+    return texts
+
+
+class Catalog:
+    """Texts of one language, falling back to the reference language"""
+    def __init__(self, language, fallback=None):
+        """
+        :param language: Language code, the name of a catalog in LOCALES_DIR
+        :param fallback: Catalog of the reference language, None for the reference itself
+        """
+        self.language = language
+        self.texts = _read(language)
+        self.fallback = fallback
+        # Keys of the reference catalog this one lacks
+        self.missing = sorted(set(fallback.texts) - set(self.texts)) if fallback else []
+        if self.missing:
+            print(f"Error in translations {language}.json: {len(self.missing)} missing key(s), "
+                  f"shown in {fallback.language}: {', '.join(self.missing)}")
+        # key: bound str.format of its text, looked up once
+        self._formats = {}
+        self._unknown = set()
+
+    def get(self, key):
+        """:return: Text of a key, from the fallback if this language lacks it, the key itself if no catalog has it"""
+        text = self.texts.get(key)
+        if text is None:
+            text = self.fallback.get(key) if self.fallback else self._unknown_key(key)
+        return text
+
+    def format(self, key, *args, **kwargs):
+        """:return: Text of a key formatted with str.format"""
+        template = self._formats.get(key)
+        if template is None:
+            template = self._formats[key] = self.get(key).format
+        return template(*args, **kwargs)
+
+    def _unknown_key(self, key):
+        if key not in self._unknown:
+            self._unknown.add(key)
+            print(f"Error in translations: unknown key {key!r}")
+        return key
+
+
+_catalogs = {}
+
+
+def get_catalog(language):
+    """
+    Load a language's catalog on first use, then return it from the cache
+    :param language: Language code, see available_languages()
+    :return: Catalog
+    """
+    catalog = _catalogs.get(language)
+    if catalog is None:
+        fallback = None if language == REFERENCE_LANGUAGE else get_catalog(REFERENCE_LANGUAGE)
+        catalog = _catalogs[language] = Catalog(language, fallback)
+    return catalog
+
+
+def check_catalogs():
+    """
+    Load every catalog, reporting its missing keys and the keys the reference lacks
+    :return: Whether every catalog has exactly the reference's keys
+    """
+    reference = get_catalog(REFERENCE_LANGUAGE)
+    complete = bool(reference.texts)
+    for language in available_languages():
+        catalog = get_catalog(language)
+        extra = sorted(set(catalog.texts) - set(reference.texts))
+        if extra:
+            print(f"Error in translations {language}.json: {len(extra)} key(s) not in "
+                  f"{REFERENCE_LANGUAGE}.json: {', '.join(extra)}")
+        complete = complete and not catalog.missing and not extra
+    return complete
+
+
+if __name__ == '__main__':
+    sys.exit(0 if check_catalogs() else 1)
@@ -0,0 +1,155 @@
+"""
+Command line client for the headless ZxBot control API (see daemon.py).
+
+    python zxctl.py status
+    python zxctl.py send 123456789 "Hello"
+    python zxctl.py broadcast 111,222,333 "Announcement"
+    python zxctl.py batch operations.jsonl
+
+batch reads one JSON operation per line, e.g. {"op": "send", "channel_id": "1", "message": "hi"}.
+"""
+import argparse
+import http.client
+import json
+import socket
+import sys
+from urllib.parse import urlparse
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+# Operations sent per /batch request
+BATCH_SIZE = 500
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ControlClient:
+    """Keeps one connection open so scripts can issue many requests cheaply"""
+    def __init__(self, url=DEFAULT_URL, socket_path=None, api_key=None, timeout=300):
+        if socket_path:
+            self.connection = UnixHTTPConnection(socket_path, timeout=timeout)
+        else:
+            parsed = urlparse(url)
+            self.connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+        self.api_key = api_key
+
+    def request(self, method, path, body=None):
+        """
+        :return: (HTTP status, decoded JSON body)
+        """
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['X-Api-Key'] = self.api_key
+        payload = json.dumps(body).encode() if body is not None else None
+        self.connection.request(method, path, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read() or b'{}')
+
+    def call(self, operation, **params):
+        return self.request('POST', f'/{operation}', params)
+
+    def status(self):
+        return self.request('GET', '/status')
+
+    def batch(self, operations):
+        return self.request('POST', '/batch', {'operations': operations})
+
+
+def _channel_list(value):
+    return [channel_id for channel_id in value.replace('\n', ',').split(',') if channel_id.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=DEFAULT_URL, help='Control API URL')
+    parser.add_argument('--socket', help='Unix socket of the control API, instead of --url')
+    parser.add_argument('--api-key', help='API key if the daemon requires one')
+    parser.add_argument('--bot', help='Target bot when the daemon runs several (python main.py --multi), * for all')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('status', help='Show bot status')
+    commands.add_parser('restart', help='Reconnect the bot to Discord')
+    commands.add_parser('metrics', help='Show latency, failure and rate-limit metrics')
+    send = commands.add_parser('send', help='Send a message')
+    send.add_argument('channel_id')
+    send.add_argument('message')
+    send.add_argument('--coalesce', action='store_true',
+                      help='Merge with other small messages sent to the channel at the same time')
+    send_image = commands.add_parser('send-image', help='Send an image')
+    send_image.add_argument('channel_id')
+    send_image.add_argument('image_path')
+    send_image.add_argument('message', nargs='?')
+    send_image.add_argument('--image', dest='image_paths', action='append', metavar='PATH',
+                            help='Another image to send with the first one, can be repeated')
+    broadcast = commands.add_parser('broadcast', help='Send to several channels')
+    broadcast.add_argument('channel_ids', type=_channel_list, help='Comma separated channel IDs')
+    broadcast.add_argument('message', nargs='?')
+    broadcast.add_argument('--image', dest='image_paths', action='append', metavar='PATH',
+                           help='Image to send, can be repeated')
+    presence = commands.add_parser('presence', help='Change status and activity')
+    presence.add_argument('status', choices=['online', 'idle', 'dnd', 'invisible'])
+    presence.add_argument('activity', nargs='?', default='')
+    avatar = commands.add_parser('avatar', help='Change the avatar')
+    avatar.add_argument('image_path')
+    avatar.add_argument('--max-wait', type=float,
+                        help='Seconds to wait for the avatar change budget before giving up')
+    cleanup = commands.add_parser('cleanup', help='Delete bot messages in a channel')
+    cleanup.add_argument('channel_id')
+    cleanup.add_argument('--limit', type=int, default=100, help='Messages to check, 0 for no limit')
+    cleanup.add_argument('--no-bulk', dest='bulk', action='store_false')
+    cleanup.add_argument('--after', help='Only messages sent after this ISO 8601 date, e.g. 2024-01-31')
+    cleanup.add_argument('--before', help='Only messages sent before this ISO 8601 date')
+    cleanup.add_argument('--pattern', help='Only messages whose content matches this regular expression')
+    cleanup.add_argument('--attachments-only', action='store_true', help='Only messages with attachments')
+    cleanup.add_argument('--author', dest='author_ids', action='append', type=int, metavar='USER_ID',
+                         help="Delete this user's messages instead of the bot's, can be repeated")
+    cleanup.add_argument('--restart', dest='resume', action='store_false',
+                         help='Start over instead of resuming an interrupted cleanup with the same filters')
+    batch = commands.add_parser('batch', help='Run JSON operations from a file, one per line (- for stdin)')
+    batch.add_argument('file')
+
+    args = parser.parse_args(argv)
+    client = ControlClient(args.url, args.socket, args.api_key)
+
+    if args.command == 'status':
+        status, body = client.status()
+    elif args.command == 'metrics':
+        status, body = client.request('GET', '/metrics?format=json')
+    elif args.command == 'restart':
+        status, body = client.request('POST', '/restart', {'bot': args.bot} if args.bot else {})
+    elif args.command == 'batch':
+        source = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')
+        with source:
+            operations = [json.loads(line) for line in source if line.strip()]
+        if args.bot:
+            for operation in operations:
+                operation.setdefault('bot', args.bot)
+        status, failed = 200, 0
+        for i in range(0, len(operations), BATCH_SIZE):
+            status, body = client.batch(operations[i:i + BATCH_SIZE])
+            if status != 200:
+                print(json.dumps(body), file=sys.stderr)
+                break
+            for result in body['results']:
+                print(json.dumps(result))
+                failed += result.get('status') != 200 or not result.get('ok')
+        return 1 if status != 200 or failed else 0
+    else:
+        params = {key: value for key, value in vars(args).items()
+                  if key not in ('url', 'socket', 'api_key', 'command') and value is not None}
+        status, body = client.call(args.command.replace('-', '_'), **params)
+
+    print(json.dumps(body, indent=2))
+    return 0 if status == 200 and body.get('ok', True) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())